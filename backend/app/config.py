@@ -26,14 +26,97 @@ class Settings(BaseSettings):
     # Google Gemini API (FREE)
     google_api_key: str = ""
 
+    # LLM providers in order of preference: "gemini", "anthropic", "stub".
+    # Calls go to the one with the best observed latency and error rate; a
+    # later provider must be faster by the switch margin to be preferred.
+    llm_providers: str = "gemini"
+    llm_provider_switch_margin: float = 0.25
+    anthropic_api_key: str = ""
+    anthropic_model: str = "claude-3-5-sonnet-20241022"
+    # Local stub provider for tests and benchmarks
+    llm_stub_latency_ms: int = 200
+    llm_stub_error_rate: float = 0.0
+
+    # Number of uvicorn worker processes. With more than one, workers share the
+    # SQLite cache and deduplicate identical LLM calls through it.
+    workers: int = 1
+
+    # LLM concurrency (max Gemini calls in flight per worker)
+    llm_max_concurrency: int = 4
+
+    # Time budget for LLM-backed requests; partial results are returned when it runs out
+    request_deadline_seconds: float = 50.0
+
+    # Load shedding for LLM-backed endpoints (503 + Retry-After above either limit)
+    llm_max_queue_depth: int = 32
+    llm_max_estimated_wait_seconds: float = 30.0
+
+    # Circuit breaker: open after N consecutive Gemini failures, probe again after the reset time
+    llm_circuit_failure_threshold: int = 5
+    llm_circuit_reset_seconds: float = 30.0
+
+    # Hedged requests: duplicate interactive calls that run past the p95 latency
+    llm_hedge_enabled: bool = False
+    llm_hedge_min_samples: int = 20
+
+    # Background LLM work (e.g. result-email resources): max slots it may hold,
+    # and how long it may wait before being served ahead of interactive calls
+    llm_background_slots: int = 1
+    llm_background_max_wait_seconds: float = 30.0
+
+    # Shared secret for the tenant tokens the frontend mints from the NextAuth
+    # session (LLM fair sharing per teacher); without it every caller is "anonymous"
+    llm_tenant_secret: str = ""
+
+    # Cross-worker LLM deduplication (lock held, and refreshed, while one worker calls Gemini;
+    # waiting workers call Gemini themselves after a full TTL)
+    llm_cross_worker_dedup: bool = True
+    llm_lock_ttl_seconds: int = 120
+
+    # LLM rate limits shared by all callers, split evenly across workers (0 disables a limit)
+    llm_requests_per_minute: int = 10
+    llm_tokens_per_minute: int = 1_000_000
+
+    # Record/replay for offline benchmarks: "live", "record" or "replay"
+    llm_mode: str = "live"
+    llm_cassette_path: Path = Path("cassettes/llm.jsonl")
+    # Replay latency: "recorded", "fixed", "lognormal" or "none"
+    llm_replay_latency_mode: str = "recorded"
+    llm_replay_latency_ms: int = 1000  # fixed value / lognormal median
+    llm_replay_latency_sigma: float = 0.5  # lognormal spread
+
+    # Pricing used for cost metrics (USD per million tokens)
+    llm_input_cost_per_million: float = 0.10
+    llm_output_cost_per_million: float = 0.40
+    llm_cached_input_cost_per_million: float = 0.025
+
+    # Context caching of the shared prompt prefix: "off" or "local" (stand-in
+    # that reports cached tokens, for tests)
+    llm_context_cache: str = "off"
+    llm_context_cache_ttl_seconds: int = 3600
+
+    # Batched multi-prompt calls (LLMService.generate_json_many)
+    llm_batch_token_budget: int = 8000
+    llm_batch_max_output_tokens: int = 8192
+
     # Caching
     cache_dir: Path = Path(".cache")
     cache_enabled: bool = True
+    cache_max_mb: int = 512  # SQLite store size before LRU eviction
+    cache_memory_mb: int = 32  # In-memory tier per worker
 
     # File Uploads
     upload_dir: Path = Path("uploads")
     max_upload_size_mb: int = 50
 
+    # PDF text extraction worker processes per extraction (0 = one per CPU core, 1 = serial).
+    # Every upload extracts its pages in the background, so keep this small.
+    pdf_extract_workers: int = 2
+
+    # Extracted page text per textbook, for page-range reads
+    page_store_dir: Path = Path("page_store")
+    page_store_memory_mb: int = 16  # In-memory page LRU per worker
+
     # CORS
     cors_origins: str = "http://localhost:3000,http://localhost:5173"
 
@@ -5,8 +5,9 @@ FastAPI Application Entry Point
 import os
 from pathlib import Path
 from dotenv import load_dotenv
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 
 # Load environment variables FIRST (before any imports that use them)
 env_path = Path(__file__).parent.parent / '.env'
@@ -16,6 +17,10 @@ print(f"[STARTUP] GOOGLE_API_KEY found: {bool(os.getenv('GOOGLE_API_KEY'))}")
 
 from app.config import settings
 from app.database import db
+from app.services.llm_metrics import get_llm_metrics, track_llm_endpoint
+from app.services.llm_scheduler import track_llm_tenant
+from app.services.load_shedding import shed_llm_load_before_body
+from app.utils.upload_guard import upload_size_guard
 
 # Import routers
 from app.routers import topics, questions, surveys, forms, textbooks, teachers
@@ -26,8 +31,20 @@ app = FastAPI(
     version="0.1.0",
     description="AI-powered diagnostic assessment generation for education",
     debug=settings.debug,
+    # Attribute LLM calls to routes and to the teacher (for fair scheduling)
+    dependencies=[Depends(track_llm_endpoint), Depends(track_llm_tenant)],
 )
 
+# Uploads are turned away from their headers (too large, or the LLM queue is
+# saturated) before the body is received. Registered before CORS so
+# rejections still carry CORS headers.
+UPLOAD_PATHS = {"/api/textbooks/upload"}
+app.middleware("http")(upload_size_guard(
+    paths=UPLOAD_PATHS,
+    max_bytes=settings.max_upload_size_mb * 1024 * 1024,
+))
+app.middleware("http")(shed_llm_load_before_body(paths=UPLOAD_PATHS))
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -35,6 +52,7 @@ app.add_middleware(
     allow_credentials=False,  # Not needed - auth handled by NextAuth on same domain
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],  # Explicitly list allowed methods
     allow_headers=["Content-Type", "Authorization", "X-Requested-With"],  # Restrict headers
+    expose_headers=["Retry-After"],  # Let the frontend honour load-shedding backoff
     max_age=3600,  # Cache preflight requests for 1 hour
 )
 
@@ -58,6 +76,19 @@ async def health_check():
     }
 
 
+@app.get("/health/llm")
+async def llm_health():
+    """LLM cache, coalescing and per-service latency/cost counters"""
+    from app.services.llm_service import get_llm_stats
+    return get_llm_stats()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """LLM latency, token and cost histograms in Prometheus text format"""
+    return get_llm_metrics().render_prometheus()
+
+
 @app.get("/")
 async def root():
     """Root endpoint"""
@@ -74,5 +105,6 @@ if __name__ == "__main__":
         "app.main:app",
         host="0.0.0.0",
         port=8000,
-        reload=settings.debug,
+        reload=settings.debug and settings.workers == 1,
+        workers=settings.workers,
     )
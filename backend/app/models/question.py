@@ -63,8 +63,16 @@ class GenerateQuestionsRequest(BaseModel):
     use_textbook: bool = Field(False, description="Whether to use textbook content for generation")
     total_count: Optional[int] = Field(None, description="Total number of questions desired")
     bloom_levels: Optional[List[str]] = Field(None, description="Bloom's taxonomy levels to target")
+    time_budget_seconds: Optional[float] = Field(
+        None, gt=0, le=600,
+        description="Return whatever is finished after this many seconds (default: server setting)"
+    )
 
 
 class GenerateQuestionsResponse(BaseModel):
     """POST /api/generate-questions response body"""
     questions: List[Question] = Field(..., description="Generated MCQ questions")
+    unfinished_topics: List[str] = Field(
+        default_factory=list,
+        description="Topics with no questions yet (time budget ran out or generation failed)"
+    )
@@ -3,7 +3,7 @@ Native Forms Router
 Endpoints for creating, publishing, and managing shareable diagnostic forms
 """
 
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Request
 from typing import List, Optional, Dict
 from pydantic import BaseModel, EmailStr, Field, ValidationError, field_validator
 from uuid import UUID, uuid4
@@ -15,6 +15,7 @@ from app.database import db
 from app.utils.slug_generator import generate_slug
 from app.services.email_service import get_email_service
 from app.services.khan_academy_service import get_khan_academy_service
+from app.services.llm_scheduler import Priority, llm_priority
 from app.config import settings
 
 router = APIRouter(prefix="/api/forms", tags=["forms"])
@@ -739,15 +740,18 @@ async def get_form_questions(slug: str):
 
 
 @router.post("/{slug}/submit", response_model=SubmitFormResponse)
-async def submit_form(slug: str, submission: SubmitFormRequest):
+async def submit_form(slug: str, submission: SubmitFormRequest, background_tasks: BackgroundTasks):
     """
     Submit completed form answers
 
-    Stores all responses, calculates score, marks session complete.
+    Stores all responses, calculates score, marks session complete. The
+    results email (and its LLM resource lookup) is sent after the response,
+    so a slow or failing LLM never delays the student.
 
     Args:
         slug: Form slug
         submission: Session ID and answers
+        background_tasks: Runs the results email after responding
 
     Returns:
         Score and completion confirmation
@@ -875,18 +879,15 @@ async def submit_form(slug: str, submission: SubmitFormRequest):
 
         print(f"[FORMS] Form submission complete")
 
-        # Send email with personalized resources (async, non-blocking)
-        try:
-            await _send_results_email(
-                session_uuid=session_uuid,
-                student_email=student_email,
-                score_percentage=score,
-                correct_answers=correct_count,
-                total_questions=total_questions
-            )
-        except Exception as email_error:
-            # Don't fail the submission if email fails
-            print(f"[FORMS WARNING] Email sending failed: {email_error}")
+        # Send email with personalized resources once the response is out
+        background_tasks.add_task(
+            _send_results_email_safely,
+            session_uuid=session_uuid,
+            student_email=student_email,
+            score_percentage=score,
+            correct_answers=correct_count,
+            total_questions=total_questions
+        )
 
         return SubmitFormResponse(
             session_id=str(session_uuid),
@@ -1055,6 +1056,14 @@ async def get_all_students():
 # HELPER FUNCTIONS FOR EMAIL INTEGRATION
 # ============================================================
 
+async def _send_results_email_safely(**kwargs):
+    """Background-task wrapper: an email failure must never surface anywhere"""
+    try:
+        await _send_results_email(**kwargs)
+    except Exception as email_error:
+        print(f"[FORMS WARNING] Email sending failed: {email_error}")
+
+
 async def _send_results_email(
     session_uuid: UUID,
     student_email: str,
@@ -1106,7 +1115,9 @@ async def _send_results_email(
     weak_topic_names = [topic['topic_name'] for topic in weak_topics]
 
     print(f"[EMAIL] Finding Khan Academy resources for {len(weak_topic_names)} weak topics")
-    resources = await khan_service.find_resources_for_topics(weak_topic_names)
+    # Nobody is waiting on this lookup; let teachers' generation requests go first
+    with llm_priority(Priority.BACKGROUND, tenant=f"session:{session_uuid}"):
+        resources = await khan_service.find_resources_for_topics(weak_topic_names)
 
     # Send email
     email_service = get_email_service()
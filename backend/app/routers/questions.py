@@ -3,21 +3,33 @@ Question Generation Router
 Endpoints for generating MCQ diagnostic questions
 """
 
+import json
 import logging
 import traceback
-from fastapi import APIRouter, HTTPException
+from contextlib import aclosing
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from typing import List
 
 from app.models.question import Question, GenerateQuestionsRequest, GenerateQuestionsResponse, Difficulty, Topic
+from app.config import settings
 from app.models.course import CourseLevel
+from app.services.load_shedding import shed_llm_load
 from app.services.question_generator import get_question_generator
+from app.utils.deadline import DeadlineExceeded, deadline
+from app.utils.disconnect import (
+    CLIENT_CLOSED_REQUEST,
+    ClientDisconnected,
+    cancel_on_disconnect,
+    stream_until_disconnect,
+)
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/questions", tags=["questions"])
 
 
-@router.post("/generate")
-async def generate_questions(request: GenerateQuestionsRequest):
+@router.post("/generate", dependencies=[Depends(shed_llm_load)])
+async def generate_questions(request: GenerateQuestionsRequest, http_request: Request):
     """
     Generate MCQ diagnostic questions for given topics
 
@@ -25,8 +37,14 @@ async def generate_questions(request: GenerateQuestionsRequest):
     1. AI web search (default): Questions generated from web search
     2. Textbook-based: Questions generated from uploaded textbook content
 
+    Generation is bounded by request.time_budget_seconds (or the
+    REQUEST_DEADLINE_SECONDS setting). When the budget runs out, the questions
+    finished so far are returned and the rest are listed in unfinished_topics.
+    Outstanding LLM calls are cancelled if the client disconnects.
+
     Args:
         request: GenerateQuestionsRequest with topics and count
+        http_request: Incoming HTTP request (watched for disconnects)
 
     Returns:
         GenerateQuestionsResponse with generated questions
@@ -54,13 +72,14 @@ async def generate_questions(request: GenerateQuestionsRequest):
                 # For now, we'll just note that we have the textbook
                 context = f"Use textbook content from: {resource_result.data[0].get('metadata', {}).get('title', 'textbook')}"
 
-        questions = await generator.generate_questions(
-            topics=request.topics,
-            count_per_topic=request.count_per_topic,
-            difficulty=request.difficulty or Difficulty.MEDIUM,
-            course_level=CourseLevel.UNDERGRADUATE,
-            context=context  # Pass textbook context if available
-        )
+        with deadline(request.time_budget_seconds or settings.request_deadline_seconds):
+            questions, unfinished_topics = await cancel_on_disconnect(http_request, generator.generate_questions(
+                topics=request.topics,
+                count_per_topic=request.count_per_topic,
+                difficulty=request.difficulty or Difficulty.MEDIUM,
+                course_level=CourseLevel.UNDERGRADUATE,
+                context=context  # Pass textbook context if available
+            ))
         
         logger.info(f"[QUESTIONS API] Generated {len(questions)} questions")
 
@@ -68,8 +87,17 @@ async def generate_questions(request: GenerateQuestionsRequest):
         if request.total_count and len(questions) > request.total_count:
             questions = questions[:request.total_count]
 
-        return GenerateQuestionsResponse(questions=questions)
+        return GenerateQuestionsResponse(questions=questions, unfinished_topics=unfinished_topics)
 
+    except ClientDisconnected:
+        logger.info("[QUESTIONS API] Client disconnected - generation cancelled")
+        raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="Client closed request")
+    except DeadlineExceeded as e:
+        logger.error(f"[QUESTIONS API ERROR] Time budget exhausted: {str(e)}")
+        raise HTTPException(
+            status_code=504,
+            detail="Question generation did not finish any topic within the time budget"
+        )
     except Exception as e:
         logger.error(f"[QUESTIONS API ERROR] {type(e).__name__}: {str(e)}")
         logger.error(f"[QUESTIONS API ERROR] Full traceback:\n{traceback.format_exc()}")
@@ -83,3 +111,57 @@ async def generate_questions(request: GenerateQuestionsRequest):
             status_code=500,
             detail=f"Failed to generate questions: {str(e)}"
         )
+
+
+@router.post("/generate/stream", dependencies=[Depends(shed_llm_load)])
+async def generate_questions_stream(request: GenerateQuestionsRequest, http_request: Request):
+    """
+    Stream MCQ diagnostic questions as newline-delimited JSON
+
+    Each question is sent as soon as the LLM finishes writing it, so the
+    first questions show up long before the whole set is generated.
+    Outstanding LLM calls are cancelled if the client disconnects.
+
+    Lines:
+        {"type": "question", "question": {...}}  (one per question)
+        {"type": "done", "count": N, "unfinished_topics": [...]}  (last line)
+
+    Args:
+        request: GenerateQuestionsRequest with topics and count
+        http_request: Incoming HTTP request (watched for disconnects)
+    """
+    generator = get_question_generator()
+
+    async def question_lines():
+        count = 0
+        finished_topics = set()
+        try:
+            with deadline(request.time_budget_seconds or settings.request_deadline_seconds):
+                questions = generator.stream_questions(
+                    topics=request.topics,
+                    count_per_topic=request.count_per_topic,
+                    difficulty=request.difficulty or Difficulty.MEDIUM,
+                    course_level=CourseLevel.UNDERGRADUATE,
+                )
+                watched = stream_until_disconnect(http_request, questions)
+                # Breaking out early closes the LLM stream now, not at garbage collection
+                async with aclosing(watched):
+                    async for question in watched:
+                        if request.total_count and count >= request.total_count:
+                            break
+                        count += 1
+                        finished_topics.add(question.topic)
+                        yield json.dumps({"type": "question", "question": question.model_dump(mode="json")}) + "\n"
+        except ClientDisconnected:
+            logger.info(f"[QUESTIONS API] Client disconnected after {count} streamed questions ({CLIENT_CLOSED_REQUEST}) - generation cancelled")
+            return
+        except Exception as e:
+            logger.error(f"[QUESTIONS API ERROR] Stream failed: {type(e).__name__}: {str(e)}")
+            yield json.dumps({"type": "error", "detail": f"Failed to generate questions: {str(e)}"}) + "\n"
+            return
+
+        reached_total = bool(request.total_count and count >= request.total_count)
+        unfinished_topics = [] if reached_total else [t for t in request.topics if t not in finished_topics]
+        yield json.dumps({"type": "done", "count": count, "unfinished_topics": unfinished_topics}) + "\n"
+
+    return StreamingResponse(question_lines(), media_type="application/x-ndjson")
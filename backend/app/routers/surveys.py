@@ -3,16 +3,22 @@ Diagnostic Survey Router
 Endpoints for creating diagnostic surveys and analyzing responses
 """
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from typing import List
 
-from app.models.survey import GenerateSurveyRequest, GenerateSurveyResponse, Survey, SurveyQuestion, CognitiveLevel
+from app.models.survey import GenerateSurveyRequest, GenerateSurveyResponse, Survey, SurveyQuestion
+from app.services.llm_metrics import llm_caller
 from app.services.llm_service import get_llm_service
+from app.services.load_shedding import shed_llm_load
+from app.utils.schemas import draft_model
+
+# What the LLM returns per topic: survey questions without the server-assigned id and topic_id
+SURVEY_QUESTION_DRAFTS = List[draft_model(SurveyQuestion, ("id", "topic_id"))]
 
 router = APIRouter(prefix="/api/survey", tags=["surveys"])
 
 
-@router.post("/generate", response_model=GenerateSurveyResponse)
+@router.post("/generate", response_model=GenerateSurveyResponse, dependencies=[Depends(shed_llm_load)])
 async def generate_survey(request: GenerateSurveyRequest):
     """
     Generate diagnostic survey with Yes/No questions for topics
@@ -49,15 +55,16 @@ Return ONLY a JSON array:
 Cognitive levels: remember, understand, apply, analyze
 """
 
-            questions_data = await llm.generate_json(prompt, max_tokens=1024)
+            with llm_caller("survey_generator"):
+                drafts = await llm.generate_structured(prompt, SURVEY_QUESTION_DRAFTS, max_tokens=1024)
 
-            for q in questions_data:
+            for q in drafts:
                 all_questions.append(
                     SurveyQuestion(
                         id=f"sq_{question_counter:03d}",
                         topic_id=topic_id,
-                        text=q["text"],
-                        cognitive_level=CognitiveLevel(q.get("cognitive_level", "understand"))
+                        text=q.text,
+                        cognitive_level=q.cognitive_level
                     )
                 )
                 question_counter += 1
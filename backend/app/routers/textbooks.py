@@ -1,8 +1,9 @@
 """Textbook upload and parsing endpoints"""
 
+import hashlib
 import os
-from typing import List
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
+from typing import List, Optional, Tuple
+from fastapi import APIRouter, BackgroundTasks, UploadFile, File, HTTPException, Depends, Request
 from pydantic import BaseModel, Field
 
 from app.services.textbook_parser import TextbookParser
@@ -10,10 +11,19 @@ from app.services.topic_parser import get_topic_parser
 from app.models.topic import Topic, CourseLevel
 from app.config import get_settings
 from app.database import db
+from app.utils.disconnect import CLIENT_CLOSED_REQUEST, ClientDisconnected, cancel_on_disconnect
+from app.utils.page_store import get_page_store
 
 router = APIRouter(prefix="/api/textbooks", tags=["textbooks"])
 settings = get_settings()
 
+# Uploads are copied to storage in chunks of this size
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Postgres / PostgREST error codes for inserts into resources
+UNIQUE_VIOLATION = "23505"
+MISSING_COLUMN = "PGRST204"
+
 
 class UploadTextbookResponse(BaseModel):
     """Response after uploading a textbook"""
@@ -30,8 +40,12 @@ class TextbookTopicsResponse(BaseModel):
     topics: List[Topic] = Field(..., description="Extracted topics")
 
 
+# Load shedding runs as middleware (shed_llm_load_before_body in app/main.py):
+# as a dependency it would only run after the whole file had been received
 @router.post("/upload", response_model=UploadTextbookResponse)
 async def upload_textbook(
+    http_request: Request,
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(..., description="PDF file to upload"),
     course_level: str = "ug"
 ):
@@ -40,44 +54,57 @@ async def upload_textbook(
 
     Steps:
     1. Validate PDF file
-    2. Save to storage
+    2. Save to storage (one copy per distinct PDF, named by its SHA-256)
     3. Parse textbook structure (chapters, sections)
     4. Extract topics using Claude AI
     5. Return textbook metadata and topics
+    6. Store the text of every page for page-range reads (after responding)
+
+    A PDF identical to an earlier upload reuses that textbook's stored
+    file, resource row and topics, skipping parsing and topic extraction.
+    The upload is staged under its own name until its resource row is
+    stored, so a failed upload never removes a file another row uses.
+
+    Parsing and topic extraction are cancelled (and the file removed) if the
+    client disconnects.
     """
 
     # Validate file type
     if not file.filename or not file.filename.lower().endswith('.pdf'):
         raise HTTPException(status_code=400, detail="File must be a PDF")
 
-    # Validate file size (50MB max)
-    file_content = await file.read()
-    file_size_mb = len(file_content) / (1024 * 1024)
-
-    if file_size_mb > 50:
-        raise HTTPException(status_code=400, detail="File size must be less than 50MB")
-
     # Generate unique textbook ID
     import uuid
     textbook_id = str(uuid.uuid4())
 
-    # Save file to storage
+    # Save file to storage (validates content and size while copying)
     upload_dir = settings.upload_dir or "/tmp/uploads"
     os.makedirs(upload_dir, exist_ok=True)
 
-    file_path = os.path.join(upload_dir, f"{textbook_id}.pdf")
+    staged_path = os.path.join(upload_dir, f"{textbook_id}.pdf")
+    file_size, content_hash = await _save_upload(file, staged_path)
+    file_size_mb = file_size / (1024 * 1024)
+
+    # Identical PDFs are stored once, under their content hash
+    file_path = os.path.join(upload_dir, f"{content_hash}.pdf")
 
-    with open(file_path, "wb") as f:
-        f.write(file_content)
+    existing = _find_textbook(content_hash)
+    if existing:
+        _promote_upload(staged_path, file_path)
+        return _reuse_textbook(existing, file_path, content_hash, background_tasks)
 
     # Parse textbook structure
     parser = TextbookParser()
     try:
-        structure = await parser.parse_textbook(file_path)
+        structure = await cancel_on_disconnect(
+            http_request, parser.parse_textbook(staged_path, content_hash=content_hash)
+        )
+    except ClientDisconnected:
+        _discard_upload(staged_path)
+        raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="Client closed request")
     except Exception as e:
         # Clean up file on parsing error
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        _discard_upload(staged_path)
         raise HTTPException(status_code=500, detail=f"Failed to parse PDF: {str(e)}")
 
     # Extract topics using Claude AI
@@ -87,14 +114,16 @@ async def upload_textbook(
     syllabus_text = _build_syllabus_from_structure(structure)
 
     try:
-        topics, _ = await topic_parser.parse_topics(
+        topics, _ = await cancel_on_disconnect(http_request, topic_parser.parse_topics(
             syllabus_text=syllabus_text,
             course_level=CourseLevel(course_level) if course_level else CourseLevel.UNDERGRADUATE
-        )
+        ))
+    except ClientDisconnected:
+        _discard_upload(staged_path)
+        raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="Client closed request")
     except Exception as e:
         # Clean up file on topic extraction error
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        _discard_upload(staged_path)
         raise HTTPException(status_code=500, detail=f"Failed to extract topics: {str(e)}")
 
     # Get title from filename (remove .pdf extension)
@@ -117,6 +146,9 @@ async def upload_textbook(
             }).execute()
             course_id = new_course.data[0]['id']
 
+        # The row points at the content-addressed file, so put it there first
+        _promote_upload(staged_path, file_path)
+
         # Insert textbook resource
         resource_data = {
             "id": textbook_id,
@@ -126,15 +158,21 @@ async def upload_textbook(
             "file_path": file_path,
             "file_name": file.filename,
             "file_size_mb": file_size_mb,
+            "content_hash": content_hash,
             "total_pages": structure.get('total_pages', 0),
             "metadata": {
                 "chapters": structure.get('chapters', []),
-                "title": structure.get('title', title)
+                "title": structure.get('title', title),
+                # This textbook's own topics (the topics table is per course)
+                "topics": [topic.model_dump() for topic in topics]
             },
             "indexed": True
         }
 
-        db.client.table("resources").insert(resource_data).execute()
+        existing = _insert_textbook(resource_data)
+        if existing:
+            # The same PDF was stored by a concurrent upload
+            return _reuse_textbook(existing, file_path, content_hash, background_tasks)
 
         # Store topics in database
         for topic in topics:
@@ -148,11 +186,14 @@ async def upload_textbook(
             db.client.table("topics").insert(topic_data).execute()
 
     except Exception as e:
-        # Clean up file on database error
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        # Clean up the staged file on database error (the content-addressed
+        # copy stays: other rows may reference it, and re-uploads reuse it)
+        _discard_upload(staged_path)
         raise HTTPException(status_code=500, detail=f"Failed to store in database: {str(e)}")
 
+    # Full text extraction takes a while on long books; don't hold the response for it
+    background_tasks.add_task(_store_pages, textbook_id, file_path, content_hash)
+
     return UploadTextbookResponse(
         textbook_id=textbook_id,
         title=title,
@@ -178,28 +219,10 @@ async def get_textbook_topics(textbook_id: str):
             raise HTTPException(status_code=404, detail="Textbook not found")
 
         resource = resource_result.data[0]
-        course_id = resource['course_id']
-
-        # Get topics for this textbook's course
-        topics_result = db.client.table("topics")\
-            .select("*")\
-            .eq("course_id", course_id)\
-            .order("order_index")\
-            .execute()
-
-        # Transform to Topic models
-        topics = []
-        for t in topics_result.data:
-            topics.append(Topic(
-                id=t['topic_id'],
-                name=t['name'],
-                weight=t.get('weight', 1.0),
-                prereqs=[]  # TODO: Fetch from topic_prerequisites table if needed
-            ))
 
         return TextbookTopicsResponse(
             textbook_id=textbook_id,
-            topics=topics
+            topics=_load_topics(resource['course_id'])
         )
 
     except HTTPException:
@@ -253,3 +276,168 @@ def _build_syllabus_from_structure(structure: dict) -> str:
         lines.append("")  # Blank line between chapters
 
     return "\n".join(lines)
+
+
+def _find_textbook(content_hash: str) -> Optional[dict]:
+    """Previously uploaded textbook with the same content, if any"""
+    try:
+        result = db.client.table("resources")\
+            .select("id, course_id, title, total_pages, metadata")\
+            .eq("content_hash", content_hash)\
+            .eq("resource_type", "textbook")\
+            .limit(1)\
+            .execute()
+    except Exception as e:
+        # e.g. migrations/add_resource_content_hash.sql not applied yet
+        print(f"[TEXTBOOK UPLOAD WARNING] Could not look up earlier uploads: {e}")
+        return None
+    return result.data[0] if result.data else None
+
+
+def _load_topics(course_id: str) -> List[Topic]:
+    """Topics stored for a course, in order"""
+    topics_result = db.client.table("topics")\
+        .select("*")\
+        .eq("course_id", course_id)\
+        .order("order_index")\
+        .execute()
+
+    # Transform to Topic models
+    return [
+        Topic(
+            id=t['topic_id'],
+            name=t['name'],
+            weight=t.get('weight', 1.0),
+            prereqs=[]  # TODO: Fetch from topic_prerequisites table if needed
+        )
+        for t in topics_result.data
+    ]
+
+
+def _insert_textbook(resource_data: dict) -> Optional[dict]:
+    """
+    Insert a textbook resource row
+
+    Returns:
+        None once inserted, or the existing row if another upload stored
+        the same content first (unique index on resources.content_hash)
+    """
+    table = db.client.table("resources")
+    try:
+        table.insert(resource_data).execute()
+        return None
+    except Exception as e:
+        code = getattr(e, "code", None)
+        if code == UNIQUE_VIOLATION:
+            existing = _find_textbook(resource_data["content_hash"])
+            if existing:
+                return existing
+            raise
+        if code != MISSING_COLUMN:
+            raise
+        print(f"[TEXTBOOK UPLOAD WARNING] Storing textbook without content_hash: {e}")
+
+    # migrations/add_resource_content_hash.sql not applied yet: store it without dedup
+    db.client.table("resources").insert(
+        {key: value for key, value in resource_data.items() if key != "content_hash"}
+    ).execute()
+    return None
+
+
+def _reuse_textbook(
+    existing: dict,
+    file_path: str,
+    content_hash: str,
+    background_tasks: BackgroundTasks
+) -> UploadTextbookResponse:
+    """Upload response for an identical PDF stored before"""
+    print(f"[TEXTBOOK UPLOAD] Same content as textbook {existing['id']} - reusing it")
+
+    # No-op if the pages are already stored
+    background_tasks.add_task(_store_pages, existing['id'], file_path, content_hash)
+    return UploadTextbookResponse(
+        textbook_id=existing['id'],
+        title=existing['title'],
+        total_pages=existing.get('total_pages') or 0,
+        file_path=file_path,
+        topics=_textbook_topics(existing)
+    )
+
+
+def _textbook_topics(resource: dict) -> List[Topic]:
+    """Topics extracted from one textbook, as stored with its resource row"""
+    topics = (resource.get('metadata') or {}).get('topics')
+    if topics is None:
+        print(f"[TEXTBOOK UPLOAD WARNING] Textbook {resource['id']} has no stored topics")
+        return []
+    return [Topic(**topic) for topic in topics]
+
+
+def _promote_upload(staged_path: str, file_path: str) -> None:
+    """Move a staged upload to its content-addressed path, or drop it if that copy exists"""
+    if os.path.exists(file_path):
+        _discard_upload(staged_path)
+    else:
+        os.replace(staged_path, file_path)
+
+
+def _discard_upload(staged_path: str) -> None:
+    """Remove a staged upload (never a content-addressed file another row may reference)"""
+    if os.path.exists(staged_path):
+        os.remove(staged_path)
+
+
+async def _save_upload(file: UploadFile, file_path: str) -> Tuple[int, str]:
+    """
+    Copy an uploaded PDF to file_path in chunks, hashing it on the way
+
+    Only one chunk is in memory at a time. By now FastAPI has already
+    received and spooled the whole body; uploads declaring more than
+    MAX_UPLOAD_SIZE_MB are turned away earlier, from their Content-Length,
+    by upload_size_guard (app/main.py). Here the copy stops at the first
+    chunk without the PDF header, or once the file itself passes the limit,
+    and the partial file is removed. The file only appears at file_path
+    once it is complete.
+
+    Returns:
+        (size in bytes, SHA-256 hex digest of the content)
+
+    Raises:
+        HTTPException: 400 if the file is not a PDF or is too large
+    """
+    max_bytes = settings.max_upload_size_mb * 1024 * 1024
+    digest = hashlib.sha256()
+    size = 0
+    part_path = f"{file_path}.part"
+
+    try:
+        with open(part_path, "wb") as f:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                # PDF readers accept the header anywhere in the first 1024 bytes
+                if size == 0 and b"%PDF-" not in chunk[:1024]:
+                    raise HTTPException(status_code=400, detail="File must be a PDF")
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"File size must be less than {settings.max_upload_size_mb}MB"
+                    )
+                digest.update(chunk)
+                f.write(chunk)
+
+        if size == 0:
+            raise HTTPException(status_code=400, detail="File must be a PDF")
+        os.replace(part_path, file_path)
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+
+    return size, digest.hexdigest()
+
+
+def _store_pages(textbook_id: str, file_path: str, content_hash: str) -> None:
+    """Extract every page of an uploaded textbook into the page store"""
+    try:
+        get_page_store().ingest(textbook_id, file_path, content_hash)
+    except Exception as e:
+        print(f"[PAGE STORE ERROR] Failed to store pages for textbook {textbook_id}: {e}")
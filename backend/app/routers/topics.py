@@ -5,24 +5,29 @@ Endpoints for extracting topics from syllabi
 
 import logging
 import traceback
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from typing import List
 
 from app.models.topic import Topic, ParseTopicsRequest, ParseTopicsResponse
 from app.models.course import CourseLevel
+from app.services.load_shedding import shed_llm_load
 from app.services.topic_parser import get_topic_parser
+from app.utils.disconnect import CLIENT_CLOSED_REQUEST, ClientDisconnected, cancel_on_disconnect
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/topics", tags=["topics"])
 
 
-@router.post("/parse", response_model=ParseTopicsResponse)
-async def parse_topics(request: ParseTopicsRequest):
+@router.post("/parse", response_model=ParseTopicsResponse, dependencies=[Depends(shed_llm_load)])
+async def parse_topics(request: ParseTopicsRequest, http_request: Request):
     """
     Parse topics from course syllabus text using AI
 
+    The LLM call is cancelled if the client disconnects.
+
     Args:
         request: ParseTopicsRequest with syllabus_text and optional course_level
+        http_request: Incoming HTTP request (watched for disconnects)
 
     Returns:
         ParseTopicsResponse with extracted topics
@@ -33,15 +38,18 @@ async def parse_topics(request: ParseTopicsRequest):
         parser = get_topic_parser()
         logger.info("[TOPICS API] Topic parser initialized")
 
-        topics, prerequisites = await parser.parse_topics(
+        topics, prerequisites = await cancel_on_disconnect(http_request, parser.parse_topics(
             syllabus_text=request.syllabus_text,
             course_level=request.course_level or CourseLevel.UNDERGRADUATE
-        )
+        ))
         
         logger.info(f"[TOPICS API] Successfully parsed {len(topics)} topics")
 
         return ParseTopicsResponse(topics=topics)
 
+    except ClientDisconnected:
+        logger.info("[TOPICS API] Client disconnected - parsing cancelled")
+        raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="Client closed request")
     except Exception as e:
         logger.error(f"[TOPICS API ERROR] {type(e).__name__}: {str(e)}")
         logger.error(f"[TOPICS API ERROR] Full traceback:\n{traceback.format_exc()}")
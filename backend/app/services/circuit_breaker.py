@@ -0,0 +1,99 @@
+"""
+Circuit Breaker
+Fail fast while the LLM provider is failing, and probe for recovery
+"""
+
+import time
+from typing import Any, Dict
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the provider while the circuit is open"""
+
+
+class CircuitBreaker:
+    """
+    Classic closed / open / half-open circuit breaker
+
+    closed    - calls go through; `failure_threshold` consecutive failures open it
+    open      - calls fail immediately with CircuitOpenError for `reset_timeout` seconds
+    half_open - up to `half_open_max_calls` probe calls go through; a success
+                closes the circuit, a failure re-opens it
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0, half_open_max_calls: int = 1):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = max(1, half_open_max_calls)
+
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self.stats = {"opened": 0, "rejected": 0}
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._probes = 0
+            print(f"[CIRCUIT] {self.name}: half-open, probing for recovery")
+        return self._state
+
+    def before_call(self) -> None:
+        """
+        Check whether a call may go through
+
+        Raises:
+            CircuitOpenError: If the circuit is open (or half-open with a probe already running)
+        """
+        state = self.state
+        if state == self.CLOSED:
+            return
+        if state == self.HALF_OPEN and self._probes < self.half_open_max_calls:
+            self._probes += 1
+            return
+
+        self.stats["rejected"] += 1
+        raise CircuitOpenError(
+            f"{self.name} circuit is open - failing fast (retry in {self.seconds_until_probe():.0f}s)"
+        )
+
+    def seconds_until_probe(self) -> float:
+        """Seconds until an open circuit lets a probe call through (0 if not open)"""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def on_success(self) -> None:
+        if self._state != self.CLOSED:
+            print(f"[CIRCUIT] {self.name}: recovered, closing circuit")
+        self._state = self.CLOSED
+        self._failures = 0
+        self._probes = 0
+
+    def on_abandoned(self) -> None:
+        """A call that passed before_call() was cancelled without an outcome"""
+        if self._state == self.HALF_OPEN and self._probes > 0:
+            self._probes -= 1
+
+    def on_failure(self) -> None:
+        self._failures += 1
+        if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            self._open()
+
+    def _open(self) -> None:
+        if self._state != self.OPEN:
+            self.stats["opened"] += 1
+            print(f"[CIRCUIT] {self.name}: opening after {self._failures} failure(s) for {self.reset_timeout:.0f}s")
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._probes = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "state": self.state, "consecutive_failures": self._failures}
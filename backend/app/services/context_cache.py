@@ -0,0 +1,139 @@
+"""
+Context Cache
+Reuse a cached context for the fixed prefix of prompts (local stand-in for provider-side caching)
+"""
+
+import asyncio
+import hashlib
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, Optional
+
+
+class LocalContextBackend:
+    """
+    Stand-in for provider context caching
+
+    Wraps the service's own model (live, recording or replaying): the prefix
+    is prepended locally and responses report it as cached input tokens,
+    the way Gemini reports cached_content_token_count. Lets the caching path
+    be exercised offline and measured in metrics.
+    """
+
+    def __init__(self, model: Any):
+        self.model = model
+
+    async def create(self, prefix: str, ttl_seconds: int) -> Any:
+        return _LocalCachedModel(self.model, prefix)
+
+
+class _LocalCachedModel:
+    """Model bound to a locally "cached" prefix"""
+
+    def __init__(self, model: Any, prefix: str):
+        self._model = model
+        self._prefix = prefix
+        self._cached_tokens = len(prefix) // 4
+
+    async def generate_content_async(self, suffix: str, stream: bool = False, **kwargs) -> Any:
+        prompt = self._prefix + suffix
+        response = await self._model.generate_content_async(prompt, stream=stream, **kwargs)
+        if stream:
+            return self._stream(response, prompt)
+        return _CachedResponse(response.text, self._usage(response, prompt, response.text))
+
+    async def _stream(self, response: Any, prompt: str):
+        # Hold one chunk back so usage can be attached to the final chunk
+        previous = None
+        text = []
+        async for chunk in response:
+            if previous is not None:
+                yield _CachedResponse(previous.text, None)
+            text.append(chunk.text)
+            previous = chunk
+        if previous is not None:
+            yield _CachedResponse(previous.text, self._usage(previous, prompt, "".join(text)))
+
+    def _usage(self, response: Any, prompt: str, text: str) -> SimpleNamespace:
+        usage = getattr(response, "usage_metadata", None)
+        prompt_tokens = getattr(usage, "prompt_token_count", 0) or len(prompt) // 4
+        completion_tokens = getattr(usage, "candidates_token_count", 0) or len(text) // 4
+        return SimpleNamespace(
+            prompt_token_count=prompt_tokens,
+            candidates_token_count=completion_tokens,
+            total_token_count=prompt_tokens + completion_tokens,
+            cached_content_token_count=min(self._cached_tokens, prompt_tokens),
+        )
+
+
+class _CachedResponse:
+    def __init__(self, text: str, usage_metadata: Optional[SimpleNamespace]):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+class ContextCache:
+    """
+    Prefix -> model bound to a provider-side cached context for that prefix
+
+    Cached contexts are created once per prefix (concurrent callers share the
+    creation), reused until shortly before their TTL runs out, then
+    recreated. A prefix whose creation failed is sent inline for a while
+    before trying again.
+    """
+
+    def __init__(self, backend: Any, ttl_seconds: int = 3600):
+        self.backend = backend
+        self.ttl_seconds = max(60, ttl_seconds)
+
+        # prefix hash -> {"model", "expires_at"}; model is None after a failed creation
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._pending: Dict[str, asyncio.Future] = {}
+        self.stats = {"created": 0, "reused": 0, "failed": 0}
+
+    async def model_for(self, prefix: str) -> Optional[Any]:
+        """
+        Model to send the suffix to, or None to send the full prompt inline
+
+        Args:
+            prefix: The stable part of the prompt
+
+        Returns:
+            Model bound to a cached context holding `prefix`, or None
+        """
+        if not prefix:
+            return None
+
+        key = hashlib.sha256(prefix.encode()).hexdigest()
+        entry = self._entries.get(key)
+        if entry and entry["expires_at"] > time.monotonic():
+            if entry["model"] is not None:
+                self.stats["reused"] += 1
+            return entry["model"]
+
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = asyncio.ensure_future(self._create(key, prefix))
+            self._pending[key] = pending
+            pending.add_done_callback(lambda _task: self._pending.pop(key, None))
+        return await asyncio.shield(pending)
+
+    async def _create(self, key: str, prefix: str) -> Optional[Any]:
+        now = time.monotonic()
+        self._entries = {k: e for k, e in self._entries.items() if e["expires_at"] > now}
+        try:
+            model = await self.backend.create(prefix, self.ttl_seconds)
+        except Exception as e:
+            self.stats["failed"] += 1
+            print(f"[CONTEXT CACHE WARNING] Could not cache prompt prefix ({len(prefix)} chars): {e}")
+            self._entries[key] = {"model": None, "expires_at": now + min(300, self.ttl_seconds)}
+            return None
+
+        self.stats["created"] += 1
+        print(f"[CONTEXT CACHE] Cached prompt prefix {key[:8]} ({len(prefix)} chars) for {self.ttl_seconds}s")
+        # Stop handing out the context a little before the provider expires it
+        self._entries[key] = {"model": model, "expires_at": now + self.ttl_seconds * 0.9}
+        return model
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "contexts": sum(1 for e in self._entries.values() if e["model"] is not None)}
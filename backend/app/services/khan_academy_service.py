@@ -4,6 +4,7 @@ Uses LLM to find relevant Khan Academy links for topics
 """
 
 from typing import List, Dict, Optional
+from app.services.llm_metrics import llm_caller
 from app.services.llm_service import get_llm_service
 
 
@@ -68,7 +69,8 @@ IMPORTANT:
 """
 
         try:
-            result = await self.llm.generate_json(prompt, max_tokens=2048)
+            with llm_caller("khan_academy"):
+                result = await self.llm.generate_json(prompt, max_tokens=2048)
 
             resources_list = result.get('resources', [])
 
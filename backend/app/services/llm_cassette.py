@@ -0,0 +1,231 @@
+"""
+LLM Cassettes
+Record real Gemini prompt→response pairs and replay them offline
+"""
+
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+from app.services.llm_metrics import usage_from_response
+from app.utils.schemas import schema_hash
+
+
+class CassetteMiss(KeyError):
+    """Raised in replay mode when a prompt was never recorded"""
+
+
+class Cassette:
+    """
+    Append-only JSONL file of recorded LLM calls
+
+    Each line holds the request key, a prompt preview, the generation
+    parameters, the response text, token usage and the latency observed
+    while recording.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self) -> None:
+        """(Re)load all entries from disk; later lines win for duplicate keys"""
+        self._entries = {}
+        if not self.path.exists():
+            return
+        with open(self.path, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                    self._entries[entry["key"]] = entry
+                except (ValueError, KeyError):
+                    continue
+        print(f"[CASSETTE] Loaded {len(self._entries)} recorded calls from {self.path}")
+
+    @staticmethod
+    def make_key(prompt: str, params: Dict[str, Any]) -> str:
+        cache_input = f"{prompt}:{json.dumps(params, sort_keys=True)}"
+        return hashlib.sha256(cache_input.encode()).hexdigest()
+
+    def lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._entries.get(key)
+
+    def record(
+        self,
+        key: str,
+        prompt: str,
+        params: Dict[str, Any],
+        response: str,
+        latency_ms: float,
+        usage: Optional[Dict[str, int]] = None,
+    ) -> None:
+        entry = {
+            "key": key,
+            "prompt_preview": prompt[:200],
+            "params": params,
+            "response": response,
+            "usage": usage,
+            "latency_ms": round(latency_ms, 1),
+        }
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(entry) + "\n")
+            self._entries[key] = entry
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class LatencyModel:
+    """
+    Synthetic latency for replayed calls
+
+    Modes:
+        none      - return immediately
+        recorded  - reuse the latency observed when the call was recorded
+        fixed     - always `median_ms`
+        lognormal - lognormal around `median_ms` with shape `sigma`
+    """
+
+    def __init__(self, mode: str = "recorded", median_ms: float = 1000, sigma: float = 0.5, seed: Optional[int] = None):
+        if mode not in ("none", "recorded", "fixed", "lognormal"):
+            raise ValueError(f"Unknown replay latency mode: {mode}")
+        self.mode = mode
+        self.median_ms = median_ms
+        self.sigma = sigma
+        self._random = random.Random(seed)
+
+    def sample_seconds(self, recorded_ms: Optional[float] = None) -> float:
+        if self.mode == "none":
+            return 0.0
+        if self.mode == "recorded":
+            return (recorded_ms if recorded_ms is not None else self.median_ms) / 1000
+        if self.mode == "fixed":
+            return self.median_ms / 1000
+        return self._random.lognormvariate(0, self.sigma) * self.median_ms / 1000
+
+
+def _generation_params(generation_config: Any) -> Dict[str, Any]:
+    """Pull the parameters that affect the output out of a GenerationConfig"""
+    params = {
+        "temperature": getattr(generation_config, "temperature", None),
+        "max_output_tokens": getattr(generation_config, "max_output_tokens", None),
+    }
+    # Only schema-constrained calls carry these, so older recordings keep their keys
+    schema = getattr(generation_config, "response_schema", None)
+    if schema is not None:
+        params["response_mime_type"] = getattr(generation_config, "response_mime_type", None)
+        params["response_schema"] = schema_hash(schema)
+    return params
+
+
+class _Response:
+    """Minimal stand-in for a Gemini response object"""
+
+    def __init__(self, text: str, usage: Optional[Dict[str, int]] = None):
+        self.text = text
+        self.usage_metadata = None
+        if usage:
+            self.usage_metadata = SimpleNamespace(
+                prompt_token_count=usage.get("prompt_tokens", 0),
+                candidates_token_count=usage.get("completion_tokens", 0),
+                total_token_count=usage.get("total_tokens", 0),
+                cached_content_token_count=usage.get("cached_tokens", 0),
+            )
+
+
+class _ReplayStream:
+    """Async iterator yielding a replayed response in chunks, spread over the latency"""
+
+    def __init__(self, text: str, delay: float, usage: Optional[Dict[str, int]] = None, chunk_chars: int = 80):
+        self._chunks: List[str] = [text[i:i + chunk_chars] for i in range(0, len(text), chunk_chars)] or [""]
+        self._delay = delay / len(self._chunks)
+        self._usage = usage
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        last = len(self._chunks) - 1
+        for i, chunk in enumerate(self._chunks):
+            await asyncio.sleep(self._delay)
+            yield _Response(chunk, self._usage if i == last else None)
+
+
+class ReplayModel:
+    """Drop-in for genai.GenerativeModel that answers from a cassette"""
+
+    def __init__(self, cassette: Cassette, latency: LatencyModel):
+        self.cassette = cassette
+        self.latency = latency
+
+    async def generate_content_async(self, prompt: str, generation_config: Any = None, stream: bool = False, **kwargs):
+        key = Cassette.make_key(prompt, _generation_params(generation_config))
+        entry = self.cassette.lookup(key)
+        if entry is None:
+            raise CassetteMiss(f"No cassette entry for prompt {key[:8]} ({prompt[:60]!r}...)")
+
+        delay = self.latency.sample_seconds(entry.get("latency_ms"))
+        if stream:
+            return _ReplayStream(entry["response"], delay, entry.get("usage"))
+
+        await asyncio.sleep(delay)
+        return _Response(entry["response"], entry.get("usage"))
+
+
+class _RecordingStream:
+    """Wraps a live response stream and records the full text once it ends"""
+
+    def __init__(self, stream, on_complete):
+        self._stream = stream
+        self._on_complete = on_complete
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        parts = []
+        usage = None
+        async for chunk in self._stream:
+            parts.append(chunk.text)
+            usage = usage_from_response(chunk) or usage
+            yield chunk
+        self._on_complete(''.join(parts), usage)
+
+
+class RecordingModel:
+    """Wraps a live genai.GenerativeModel and records every call to a cassette"""
+
+    def __init__(self, model: Any, cassette: Cassette):
+        self.model = model
+        self.cassette = cassette
+
+    async def generate_content_async(self, prompt: str, generation_config: Any = None, stream: bool = False, **kwargs):
+        params = _generation_params(generation_config)
+        key = Cassette.make_key(prompt, params)
+        started = time.monotonic()
+
+        response = await self.model.generate_content_async(
+            prompt, generation_config=generation_config, stream=stream, **kwargs
+        )
+
+        def save(text: str, usage: Optional[Dict[str, int]]) -> None:
+            self.cassette.record(key, prompt, params, text, (time.monotonic() - started) * 1000, usage)
+
+        if stream:
+            return _RecordingStream(response, save)
+
+        save(response.text, usage_from_response(response))
+        return response
@@ -0,0 +1,241 @@
+"""
+LLM Metrics
+Per-service / per-endpoint latency, token and cost histograms for LLM calls
+"""
+
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from fastapi import Request
+
+from app.config import settings
+
+# Attribution for the LLM call currently being made
+_current_service: ContextVar[str] = ContextVar("llm_service_name", default="unknown")
+_current_endpoint: ContextVar[str] = ContextVar("llm_endpoint", default="none")
+
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000)
+
+
+@contextmanager
+def llm_caller(service: str):
+    """Attribute LLM calls made inside this block to `service`"""
+    token = _current_service.set(service)
+    try:
+        yield
+    finally:
+        try:
+            _current_service.reset(token)
+        except ValueError:
+            # Async generators may resume in a different context; nothing to undo there
+            pass
+
+
+async def track_llm_endpoint(request: Request) -> None:
+    """App-wide dependency recording which route triggered an LLM call"""
+    route = request.scope.get("route")
+    path = getattr(route, "path", request.url.path)
+    _current_endpoint.set(f"{request.method} {path}")
+
+
+def current_attribution() -> Tuple[str, str]:
+    """(service, endpoint) for the call being made right now"""
+    return _current_service.get(), _current_endpoint.get()
+
+
+class Histogram:
+    """Fixed-bucket histogram keyed by label values (Prometheus-compatible)"""
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str], buckets: Sequence[float]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts..., +Inf count], sum
+        self._series: Dict[Tuple[str, ...], Dict[str, Any]] = {}
+
+    def observe(self, value: float, labels: Tuple[str, ...]) -> None:
+        series = self._series.setdefault(labels, {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0})
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series["counts"][i] += 1
+                break
+        else:
+            series["counts"][-1] += 1
+        series["sum"] += value
+
+    def quantile(self, q: float, match: Optional[Dict[str, str]] = None) -> Optional[float]:
+        """Estimate a quantile across all series matching the given labels"""
+        counts = [0] * (len(self.buckets) + 1)
+        for labels, series in self._series.items():
+            if match and any(labels[self.label_names.index(k)] != v for k, v in match.items()):
+                continue
+            counts = [a + b for a, b in zip(counts, series["counts"])]
+
+        total = sum(counts)
+        if total == 0:
+            return None
+
+        rank = q * total
+        seen = 0
+        lower = 0.0
+        for i, count in enumerate(counts):
+            upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+            if count and seen + count >= rank:
+                # Linear interpolation inside the bucket
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+            lower = upper
+        return self.buckets[-1]
+
+    def count(self, match: Optional[Dict[str, str]] = None) -> int:
+        return sum(
+            sum(series["counts"])
+            for labels, series in self._series.items()
+            if not match or all(labels[self.label_names.index(k)] == v for k, v in match.items())
+        )
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self._series.items()):
+            label_str = ",".join(f'{k}="{v}"' for k, v in zip(self.label_names, labels))
+            cumulative = 0
+            for bound, count in zip(list(self.buckets) + ["+Inf"], series["counts"]):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label_str},le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label_str}}} {series['sum']}")
+            lines.append(f"{self.name}_count{{{label_str}}} {cumulative}")
+        return lines
+
+
+class LLMMetrics:
+    """
+    Metrics for every LLM request and the Gemini API calls behind them
+
+    Requests are labelled by calling service, HTTP endpoint and cache outcome
+    (hit / miss / coalesced); API calls additionally record real token usage
+    from the response's usage metadata and an estimated cost.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.request_latency = Histogram(
+            "llm_request_latency_seconds",
+            "End-to-end LLMService.generate latency",
+            ("service", "endpoint", "cache"),
+            LATENCY_BUCKETS,
+        )
+        self.api_latency = Histogram(
+            "llm_api_latency_seconds",
+            "Latency of individual model API calls",
+            ("service", "endpoint", "provider", "outcome"),
+            LATENCY_BUCKETS,
+        )
+        self.tokens_in = Histogram(
+            "llm_input_tokens",
+            "Prompt tokens per API call",
+            ("service", "endpoint"),
+            TOKEN_BUCKETS,
+        )
+        self.tokens_out = Histogram(
+            "llm_output_tokens",
+            "Completion tokens per API call",
+            ("service", "endpoint"),
+            TOKEN_BUCKETS,
+        )
+        self.tokens_cached = Histogram(
+            "llm_cached_input_tokens",
+            "Prompt tokens served from a cached context per API call",
+            ("service", "endpoint"),
+            TOKEN_BUCKETS,
+        )
+        self.cost_usd: Dict[Tuple[str, str], float] = {}
+
+    def record_request(self, latency: float, cache: str) -> None:
+        service, endpoint = current_attribution()
+        with self._lock:
+            self.request_latency.observe(latency, (service, endpoint, cache))
+
+    def record_api_call(
+        self,
+        latency: float,
+        input_tokens: int = 0,
+        output_tokens: int = 0,
+        outcome: str = "ok",
+        cached_tokens: int = 0,
+        provider: str = "gemini",
+    ) -> None:
+        service, endpoint = current_attribution()
+        with self._lock:
+            self.api_latency.observe(latency, (service, endpoint, provider, outcome))
+            if outcome != "ok":
+                return
+            self.tokens_in.observe(input_tokens, (service, endpoint))
+            self.tokens_out.observe(output_tokens, (service, endpoint))
+            self.tokens_cached.observe(cached_tokens, (service, endpoint))
+            # Cached prompt tokens are billed at the discounted rate
+            cost = (
+                (input_tokens - cached_tokens) * settings.llm_input_cost_per_million
+                + cached_tokens * settings.llm_cached_input_cost_per_million
+                + output_tokens * settings.llm_output_cost_per_million
+            ) / 1_000_000
+            self.cost_usd[(service, endpoint)] = self.cost_usd.get((service, endpoint), 0.0) + cost
+
+    def render_prometheus(self) -> str:
+        """Prometheus text exposition of all LLM metrics"""
+        with self._lock:
+            lines = []
+            for histogram in (
+                self.request_latency, self.api_latency, self.tokens_in, self.tokens_out, self.tokens_cached
+            ):
+                lines.extend(histogram.render())
+            lines.append("# HELP llm_cost_usd_total Estimated spend on model API calls")
+            lines.append("# TYPE llm_cost_usd_total counter")
+            for (service, endpoint), cost in sorted(self.cost_usd.items()):
+                lines.append(f'llm_cost_usd_total{{service="{service}",endpoint="{endpoint}"}} {cost:.6f}')
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> Dict[str, Any]:
+        """Per-service call counts, p50/p99 latency and spend (for /health/llm)"""
+        with self._lock:
+            services = sorted({labels[0] for labels in self.request_latency._series})
+            return {
+                service: {
+                    "requests": self.request_latency.count({"service": service}),
+                    "api_calls": self.api_latency.count({"service": service}),
+                    "p50_seconds": self.request_latency.quantile(0.5, {"service": service}),
+                    "p99_seconds": self.request_latency.quantile(0.99, {"service": service}),
+                    "cost_usd": round(sum(
+                        cost for (svc, _), cost in self.cost_usd.items() if svc == service
+                    ), 6),
+                }
+                for service in services
+            }
+
+
+def usage_from_response(response: Any) -> Optional[Dict[str, int]]:
+    """Read token usage from a Gemini response's usage_metadata, if present"""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return None
+    return {
+        "prompt_tokens": getattr(usage, "prompt_token_count", 0) or 0,
+        "completion_tokens": getattr(usage, "candidates_token_count", 0) or 0,
+        "total_tokens": getattr(usage, "total_token_count", 0) or 0,
+        "cached_tokens": getattr(usage, "cached_content_token_count", 0) or 0,
+    }
+
+
+# Global instance
+_llm_metrics: Optional[LLMMetrics] = None
+
+
+def get_llm_metrics() -> LLMMetrics:
+    """Get or create global LLM metrics instance"""
+    global _llm_metrics
+    if _llm_metrics is None:
+        _llm_metrics = LLMMetrics()
+    return _llm_metrics
@@ -0,0 +1,294 @@
+"""
+LLM Providers
+Model backends LLMService can route calls to, and latency/error-based routing between them
+"""
+
+import asyncio
+import json
+import os
+import random
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+import google.generativeai as genai
+
+from app.services.circuit_breaker import CircuitBreaker
+from app.services.llm_cassette import LatencyModel
+from app.services.rate_limiter import RateLimiter
+
+
+class ProviderResponse:
+    """Response in the shape LLMService reads from Gemini (text + usage_metadata)"""
+
+    def __init__(self, text: str, usage_metadata: Optional[SimpleNamespace] = None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+def _usage(prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> SimpleNamespace:
+    return SimpleNamespace(
+        prompt_token_count=prompt_tokens,
+        candidates_token_count=completion_tokens,
+        total_token_count=prompt_tokens + completion_tokens,
+        cached_content_token_count=cached_tokens,
+    )
+
+
+def create_gemini_model(model_name: str) -> Any:
+    """
+    Google Gemini model (native async client)
+
+    Raises:
+        ValueError: If GOOGLE_API_KEY is not set
+    """
+    api_key = os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        raise ValueError("GOOGLE_API_KEY not found in environment variables")
+
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel(model_name)
+
+
+class AnthropicModel:
+    """
+    Anthropic Messages API behind the GenerativeModel call shape
+
+    Temperature and max_output_tokens are taken from the GenerationConfig.
+    Claude has no response_schema, so schema-constrained calls get the schema
+    appended to the prompt and the assistant turn prefilled with the opening
+    bracket, which keeps the answer bare JSON.
+    """
+
+    def __init__(self, model_name: str):
+        try:
+            import anthropic
+        except ImportError:
+            raise ImportError("anthropic not installed. Run: pip install anthropic")
+
+        api_key = os.getenv("ANTHROPIC_API_KEY")
+        if not api_key:
+            raise ValueError("ANTHROPIC_API_KEY not found in environment variables")
+
+        self.client = anthropic.AsyncAnthropic(api_key=api_key)
+        self.model_name = model_name
+
+    async def generate_content_async(self, prompt: str, generation_config: Any = None, stream: bool = False, **kwargs):
+        request, opener = self._request(prompt, generation_config)
+        if stream:
+            return self._stream(request, opener)
+
+        message = await self.client.messages.create(**request)
+        text = "".join(block.text for block in message.content if getattr(block, "type", "") == "text")
+        return ProviderResponse(opener + text, self._usage(message.usage))
+
+    def _request(self, prompt: str, generation_config: Any):
+        messages = [{"role": "user", "content": prompt}]
+        opener = ""
+
+        schema = getattr(generation_config, "response_schema", None)
+        if schema is not None:
+            messages[0]["content"] = (
+                f"{prompt}\n\nRespond with JSON only, matching this schema:\n{json.dumps(schema)}"
+            )
+            opener = "[" if schema.get("type") == "array" else "{"
+            messages.append({"role": "assistant", "content": opener})
+
+        request = {
+            "model": self.model_name,
+            "max_tokens": getattr(generation_config, "max_output_tokens", None) or 4096,
+            "messages": messages,
+        }
+        temperature = getattr(generation_config, "temperature", None)
+        if temperature is not None:
+            request["temperature"] = min(1.0, temperature)
+        return request, opener
+
+    async def _stream(self, request: Dict[str, Any], opener: str):
+        async with self.client.messages.stream(**request) as stream:
+            if opener:
+                yield ProviderResponse(opener)
+            async for text in stream.text_stream:
+                yield ProviderResponse(text)
+            message = await stream.get_final_message()
+        yield ProviderResponse("", self._usage(message.usage))
+
+    @staticmethod
+    def _usage(usage: Any) -> SimpleNamespace:
+        cached = getattr(usage, "cache_read_input_tokens", 0) or 0
+        created = getattr(usage, "cache_creation_input_tokens", 0) or 0
+        return _usage(usage.input_tokens + cached + created, usage.output_tokens, cached)
+
+
+class StubModel:
+    """
+    Local stub provider for tests and benchmarks
+
+    Answers after a synthetic latency without any network access, failing
+    with probability `error_rate`. Schema-constrained calls get a minimal
+    answer that matches the schema; free-form calls get an empty JSON array.
+    """
+
+    def __init__(self, latency: LatencyModel, error_rate: float = 0.0, seed: Optional[int] = None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+
+    async def generate_content_async(self, prompt: str, generation_config: Any = None, stream: bool = False, **kwargs):
+        delay = self.latency.sample_seconds()
+        schema = getattr(generation_config, "response_schema", None)
+        text = json.dumps(_sample_from_schema(schema)) if schema is not None else "[]"
+        usage = _usage(len(prompt) // 4, len(text) // 4)
+
+        if stream:
+            return self._stream(text, delay, usage)
+
+        await asyncio.sleep(delay)
+        self._maybe_fail()
+        return ProviderResponse(text, usage)
+
+    async def _stream(self, text: str, delay: float, usage: SimpleNamespace, chunk_chars: int = 80):
+        chunks = [text[i:i + chunk_chars] for i in range(0, len(text), chunk_chars)] or [""]
+        for i, chunk in enumerate(chunks):
+            await asyncio.sleep(delay / len(chunks))
+            if i == 0:
+                self._maybe_fail()
+            yield ProviderResponse(chunk, usage if i == len(chunks) - 1 else None)
+
+    def _maybe_fail(self) -> None:
+        if self.error_rate and self._random.random() < self.error_rate:
+            raise RuntimeError("500 Stub provider error (simulated)")
+
+
+def _sample_from_schema(schema: Dict[str, Any]) -> Any:
+    """Smallest value matching a Gemini response schema"""
+    if schema.get("enum"):
+        return schema["enum"][0]
+
+    schema_type = schema.get("type", "string")
+    if schema_type == "object":
+        return {name: _sample_from_schema(prop) for name, prop in schema.get("properties", {}).items()}
+    if schema_type == "array":
+        return [_sample_from_schema(schema.get("items", {})) for _ in range(max(1, schema.get("min_items", 1)))]
+    if schema_type == "integer":
+        return 0
+    if schema_type == "number":
+        return 1.0
+    if schema_type == "boolean":
+        return True
+    return "Stub answer"
+
+
+class LLMProvider:
+    """
+    One model backend behind LLMService
+
+    `model` has the GenerativeModel call shape (generate_content_async(prompt,
+    generation_config=..., stream=...)), like the cassette models. Each
+    provider has its own circuit breaker and rate limiter, and keeps
+    exponentially weighted latency and error-rate statistics for routing.
+    """
+
+    # Weight of the newest observation in the moving averages
+    ALPHA = 0.2
+    # Statistics older than this are treated as unknown, so the provider is probed again
+    STALE_SECONDS = 300.0
+
+    def __init__(
+        self,
+        name: str,
+        model: Any,
+        rate_limiter: RateLimiter,
+        breaker: CircuitBreaker,
+        context_cache: Any = None,
+    ):
+        self.name = name
+        self.model = model
+        self.rate_limiter = rate_limiter
+        self.breaker = breaker
+        self.context_cache = context_cache
+
+        self.latency_ewma: Optional[float] = None
+        self.error_ewma = 0.0
+        self.last_used = 0.0
+        self.stats = {"calls": 0, "errors": 0}
+
+    def record_success(self, latency: float) -> None:
+        self.stats["calls"] += 1
+        self.last_used = time.monotonic()
+        if self.latency_ewma is None:
+            self.latency_ewma = latency
+        else:
+            self.latency_ewma += self.ALPHA * (latency - self.latency_ewma)
+        self.error_ewma *= 1 - self.ALPHA
+
+    def record_failure(self) -> None:
+        self.stats["calls"] += 1
+        self.stats["errors"] += 1
+        self.last_used = time.monotonic()
+        self.error_ewma += self.ALPHA * (1 - self.error_ewma)
+
+    def expected_seconds(self) -> Optional[float]:
+        """
+        Expected time to a successful answer, or None if not measured recently
+
+        Latency is inflated by the error rate (a failed call has to be
+        retried) and the provider's current rate-limit wait is added.
+        """
+        if self.latency_ewma is None or time.monotonic() - self.last_used > self.STALE_SECONDS:
+            return None
+        return self.latency_ewma / max(0.1, 1 - self.error_ewma) + self.rate_limiter.estimated_wait()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "latency_ewma_seconds": round(self.latency_ewma, 3) if self.latency_ewma is not None else None,
+            "error_rate": round(self.error_ewma, 3),
+            "circuit": self.breaker.get_stats(),
+            "rate_limiter": self.rate_limiter.get_stats(),
+            "context_cache": self.context_cache.get_stats() if self.context_cache else {},
+        }
+
+
+class ProviderRouter:
+    """
+    Orders providers for each call by expected time to a successful answer
+
+    Providers with an open circuit are skipped. Providers listed later in
+    LLM_PROVIDERS must beat the earlier ones by `switch_margin` to be
+    preferred, so traffic does not flap between providers of similar speed.
+    A provider without recent statistics is ranked first once, to measure it.
+    """
+
+    def __init__(self, providers: List[LLMProvider], switch_margin: float = 0.25):
+        if not providers:
+            raise ValueError("At least one LLM provider is required")
+        self.providers = providers
+        self.switch_margin = max(0.0, switch_margin)
+
+    def ranked(self) -> List[LLMProvider]:
+        """Providers that may be called now, best first"""
+        scored = []
+        for index, provider in enumerate(self.providers):
+            if provider.breaker.state == CircuitBreaker.OPEN:
+                continue
+            expected = provider.expected_seconds()
+            score = 0.0 if expected is None else expected * (1 + self.switch_margin * index)
+            scored.append((score, index, provider))
+        return [provider for _, _, provider in sorted(scored, key=lambda item: item[:2])]
+
+    @property
+    def primary(self) -> LLMProvider:
+        """Best provider right now (the first configured one if all circuits are open)"""
+        ranked = self.ranked()
+        return ranked[0] if ranked else self.providers[0]
+
+    def all_open(self) -> bool:
+        return all(provider.breaker.state == CircuitBreaker.OPEN for provider in self.providers)
+
+    def seconds_until_probe(self) -> float:
+        """Seconds until the first open circuit lets a probe call through"""
+        return min(provider.breaker.seconds_until_probe() for provider in self.providers)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {provider.name: provider.get_stats() for provider in self.providers}
@@ -0,0 +1,228 @@
+"""
+LLM Scheduler
+Priority classes and per-teacher fair sharing for slots in front of the Gemini API
+"""
+
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Any, AsyncIterator, Deque, Dict, Optional, Tuple
+
+from fastapi import Request
+
+from app.config import get_settings
+from app.utils.tenant_token import verify_tenant_token
+
+
+class Priority(IntEnum):
+    """LLM priority classes (lower value is served first)"""
+    INTERACTIVE = 0   # A teacher is waiting on the response
+    BACKGROUND = 1    # Nobody is waiting (e.g. resource lookups for result emails)
+
+
+# Priority class and tenant (teacher) for the LLM call currently being made
+_current_priority: ContextVar[Priority] = ContextVar("llm_priority", default=Priority.INTERACTIVE)
+_current_tenant: ContextVar[str] = ContextVar("llm_tenant", default="anonymous")
+
+
+@contextmanager
+def llm_priority(priority: Priority, tenant: Optional[str] = None):
+    """Run LLM calls made inside this block at `priority` (and optionally as `tenant`)"""
+    priority_token = _current_priority.set(priority)
+    tenant_token = _current_tenant.set(tenant) if tenant else None
+    try:
+        yield
+    finally:
+        try:
+            _current_priority.reset(priority_token)
+            if tenant_token is not None:
+                _current_tenant.reset(tenant_token)
+        except ValueError:
+            # Async generators may resume in a different context; nothing to undo there
+            pass
+
+
+def current_priority() -> Priority:
+    """Priority class of the LLM call being made right now"""
+    return _current_priority.get()
+
+
+async def track_llm_tenant(request: Request) -> None:
+    """
+    App-wide dependency identifying whose request triggered an LLM call
+
+    The tenant is the signed-in teacher named by the tenant token in the
+    Authorization header, which the frontend obtains from its NextAuth session
+    (see app/utils/tenant_token.py). Client-set headers, query parameters and
+    client addresses are not trusted: requests without a valid token all share
+    the "anonymous" tenant, so they cannot claim extra fair shares.
+    """
+    authorization = request.headers.get("authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return
+    tenant = verify_tenant_token(token.strip(), get_settings().llm_tenant_secret)
+    if tenant:
+        _current_tenant.set(tenant)
+
+
+class LLMScheduler:
+    """
+    Grants a bounded number of concurrent LLM slots in priority / fair-share order
+
+    Waiters are queued per priority class and, inside a class, per tenant.
+    A free slot goes to the highest class with waiters; tenants of that class
+    take turns round-robin, so one teacher's 30-topic request cannot push
+    another teacher's single call to the back of the line.
+
+    Background work may hold at most `background_slots` slots at once so
+    interactive calls always find headroom, and a background waiter that has
+    been queued longer than `max_background_wait` seconds is served as if it
+    were interactive so it cannot starve.
+    """
+
+    def __init__(self, max_concurrency: int, background_slots: int, max_background_wait: float = 30.0):
+        self.max_concurrency = max(1, max_concurrency)
+        self.background_slots = max(1, min(background_slots, self.max_concurrency))
+        self.max_background_wait = max_background_wait
+
+        # priority -> tenant -> FIFO of (enqueued_at, future)
+        self._queues: Dict[Priority, "OrderedDict[str, Deque[Tuple[float, asyncio.Future]]]"] = {
+            priority: OrderedDict() for priority in Priority
+        }
+        self._running: Dict[Priority, int] = {priority: 0 for priority in Priority}
+        self.stats: Dict[str, Any] = {
+            "granted": {priority.name.lower(): 0 for priority in Priority},
+            "max_wait_seconds": {priority.name.lower(): 0.0 for priority in Priority},
+            "promoted": 0,
+        }
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Hold one LLM slot, scheduled by the caller's priority and tenant"""
+        priority = await self.acquire(_current_priority.get(), _current_tenant.get())
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    async def acquire(self, priority: Priority, tenant: str) -> Priority:
+        """
+        Wait for a slot
+
+        Returns:
+            The class the slot was charged to (pass it to release())
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._queues[priority].setdefault(tenant, deque()).append((time.monotonic(), future))
+        self._dispatch()
+        try:
+            return await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted just before the cancellation landed; hand the slot back
+                self.release(future.result())
+            else:
+                self._remove(priority, tenant, future)
+            raise
+
+    def release(self, priority: Priority) -> None:
+        self._running[priority] -= 1
+        self._dispatch()
+
+    def queue_depth(self, priority: Optional[Priority] = None) -> int:
+        """Number of callers waiting for a slot (in one class, or overall)"""
+        priorities = [priority] if priority is not None else list(Priority)
+        return sum(
+            len(waiters)
+            for p in priorities
+            for waiters in self._queues[p].values()
+        )
+
+    def in_use(self) -> int:
+        """Number of slots currently held"""
+        return sum(self._running.values())
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "max_wait_seconds": {k: round(v, 2) for k, v in self.stats["max_wait_seconds"].items()},
+            "running": {priority.name.lower(): n for priority, n in self._running.items()},
+            "queued": {priority.name.lower(): self.queue_depth(priority) for priority in Priority},
+            "tenants_waiting": sum(len(queue) for queue in self._queues.values()),
+        }
+
+    # Internal helpers
+
+    def _can_run(self, priority: Priority) -> bool:
+        if sum(self._running.values()) >= self.max_concurrency:
+            return False
+        if priority == Priority.BACKGROUND:
+            return self._running[Priority.BACKGROUND] < self.background_slots
+        return True
+
+    def _grant(self, priority: Priority, enqueued_at: float) -> Priority:
+        self._running[priority] += 1
+        name = priority.name.lower()
+        self.stats["granted"][name] += 1
+        waited = time.monotonic() - enqueued_at
+        self.stats["max_wait_seconds"][name] = max(self.stats["max_wait_seconds"][name], waited)
+        return priority
+
+    def _dispatch(self) -> None:
+        """Hand free slots to waiters: promoted background first, then by class"""
+        while sum(self._running.values()) < self.max_concurrency:
+            picked = self._pick_starved() or self._pick_next()
+            if picked is None:
+                return
+            priority, enqueued_at, future = picked
+            if future.done():
+                # Waiter was cancelled but has not removed itself yet
+                continue
+            future.set_result(self._grant(priority, enqueued_at))
+
+    def _pick_starved(self) -> Optional[Tuple[Priority, float, asyncio.Future]]:
+        """A background waiter queued past max_background_wait, if any"""
+        now = time.monotonic()
+        queues = self._queues[Priority.BACKGROUND]
+        for tenant, waiters in queues.items():
+            if waiters and now - waiters[0][0] >= self.max_background_wait:
+                enqueued_at, future = self._pop(Priority.BACKGROUND, tenant)
+                self.stats["promoted"] += 1
+                return Priority.BACKGROUND, enqueued_at, future
+        return None
+
+    def _pick_next(self) -> Optional[Tuple[Priority, float, asyncio.Future]]:
+        for priority in Priority:
+            queues = self._queues[priority]
+            if not queues or not self._can_run(priority):
+                continue
+            # Round-robin: serve the tenant at the front, then move it to the back
+            tenant = next(iter(queues))
+            enqueued_at, future = self._pop(priority, tenant)
+            return priority, enqueued_at, future
+        return None
+
+    def _pop(self, priority: Priority, tenant: str) -> Tuple[float, asyncio.Future]:
+        queues = self._queues[priority]
+        waiters = queues[tenant]
+        entry = waiters.popleft()
+        if waiters:
+            queues.move_to_end(tenant)
+        else:
+            del queues[tenant]
+        return entry
+
+    def _remove(self, priority: Priority, tenant: str, future: asyncio.Future) -> None:
+        waiters = self._queues[priority].get(tenant)
+        if not waiters:
+            return
+        for entry in list(waiters):
+            if entry[1] is future:
+                waiters.remove(entry)
+                break
+        if not waiters:
+            del self._queues[priority][tenant]
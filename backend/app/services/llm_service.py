@@ -1,161 +1,733 @@
 """
 LLM Service
-Google Gemini API client with retry logic and caching
+LLM client (Gemini, with routing to other providers) with retry logic and caching
 """
 
+import asyncio
 import json
 import hashlib
 import os
-from pathlib import Path
-from typing import Optional, Any, Dict
+import socket
+import time
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Optional, Any, AsyncIterator, Callable, Dict, List, Union
 
 import google.generativeai as genai
+from pydantic import ValidationError
 from tenacity import (
     retry,
+    retry_if_not_exception_type,
     stop_after_attempt,
     wait_exponential,
 )
 
 from app.config import settings
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError
+from app.services.context_cache import ContextCache, LocalContextBackend
+from app.services.llm_cassette import Cassette, CassetteMiss, LatencyModel, RecordingModel, ReplayModel
+from app.services.llm_metrics import get_llm_metrics, usage_from_response
+from app.services.llm_providers import (
+    AnthropicModel,
+    LLMProvider,
+    ProviderRouter,
+    StubModel,
+    create_gemini_model,
+)
+from app.services.llm_scheduler import LLMScheduler, Priority, current_priority
+from app.services.rate_limiter import RateLimiter, is_rate_limit_error, parse_retry_after
+from app.utils.cache import get_cache
+from app.utils.deadline import DeadlineExceeded, deadline_expired, run_within_deadline, time_remaining
+from app.utils.json_stream import JsonArrayStreamParser, extract_json_entries, extract_json_text
+from app.utils.prompts import PromptParts, split_prompt, template_hash
+from app.utils.schemas import list_item_type, response_schema, schema_hash, type_adapter, validate_response
+
+# Bump when the on-disk cache entry layout changes; older entries are ignored
+CACHE_FORMAT_VERSION = 2
+
+# Assumed Gemini call latency until real calls have been measured
+DEFAULT_CALL_SECONDS = 5.0
+
+
+def _worker_share(per_minute: int, workers: int) -> float:
+    """
+    One worker's share of an account-wide per-minute limit (0 = unlimited)
+
+    Divided as a float, so with more workers than the limit each worker gets
+    a fractional rate rather than 0, which would turn the limit off.
+    """
+    if per_minute <= 0:
+        return 0
+    return max(per_minute / workers, 1 / 60)
+
+
+def _stop_at_deadline(retry_state) -> bool:
+    """Tenacity stop condition: give up when the backoff would outlive the request deadline"""
+    remaining = time_remaining()
+    return remaining is not None and remaining <= (retry_state.upcoming_sleep or 0)
 
 
 class LLMService:
-    """Service for interacting with Google Gemini API"""
+    """Service for interacting with Google Gemini API (and fallback providers)"""
 
     def __init__(self):
-        api_key = os.getenv("GOOGLE_API_KEY")
-        if not api_key:
-            raise ValueError("GOOGLE_API_KEY not found in environment variables")
-        
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-2.0-flash-exp')
-        self.cache_dir = settings.cache_dir / "llm_responses"
-
-        if settings.cache_enabled:
-            self.cache_dir.mkdir(parents=True, exist_ok=True)
-        
-        print("[LLM] Initialized Google Gemini 2.0 Flash")
+        self.model_name = 'gemini-2.0-flash-exp'
+        self.mode = settings.llm_mode
+
+        if self.mode not in ("live", "record", "replay"):
+            raise ValueError(f"Unknown LLM_MODE '{self.mode}' (expected live, record or replay)")
+
+        # Record/replay must reach the model on every call, so the response
+        # cache is bypassed in those modes
+        self.cache_enabled = settings.cache_enabled and self.mode == "live"
+        self.cache = get_cache().namespace("llm_responses") if self.cache_enabled else None
+
+        # Bounds the number of Gemini calls in flight across the whole worker.
+        # Calls go through the native async client, so waiting on Gemini never
+        # blocks the event loop serving the student-facing endpoints.
+        self.max_concurrency = max(1, settings.llm_max_concurrency)
+        # Slots are handed out by priority class and round-robin across teachers
+        self.scheduler = LLMScheduler(
+            self.max_concurrency,
+            background_slots=settings.llm_background_slots,
+            max_background_wait=settings.llm_background_max_wait_seconds,
+        )
+
+        # Model backends (LLM_PROVIDERS), routed per call by observed latency
+        # and error rate; each has its own circuit breaker and rate limiter
+        self.router = ProviderRouter(self._create_providers(), switch_margin=settings.llm_provider_switch_margin)
+
+        # Single-flight: cache_key -> {"task", "waiters"} for requests in progress
+        self._inflight: Dict[str, Dict[str, Any]] = {}
+        self.stats = {
+            "cache_hits": 0,
+            "cache_misses": 0,
+            "coalesced": 0,
+            "coalesced_cross_worker": 0,
+            "api_calls": 0,
+            "abandoned": 0,
+            "shed": 0,
+            "hedged": 0,
+            "hedge_wins": 0,
+            "cached_input_tokens": 0,
+        }
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.metrics = get_llm_metrics()
+
+        # Entries from an older cache version, model or prompt template are
+        # dropped lazily when read (_read_cache); the size cap evicts the rest
+        if self.cache_enabled:
+            if not self.cache_self_test():
+                print("[CACHE ERROR] Self-test failed - LLM response caching disabled")
+                self.cache_enabled = False
+
+        names = ", ".join(provider.name for provider in self.router.providers)
+        print(f"[LLM] Initialized providers: {names} ({self.mode} mode)")
+
+    def _create_providers(self) -> List[LLMProvider]:
+        """Providers from LLM_PROVIDERS, or a single cassette-backed one in replay mode"""
+        if self.mode == "replay":
+            # Offline: answer from recorded calls, no API key needed
+            models = {"replay": ReplayModel(
+                Cassette(settings.llm_cassette_path),
+                LatencyModel(
+                    mode=settings.llm_replay_latency_mode,
+                    median_ms=settings.llm_replay_latency_ms,
+                    sigma=settings.llm_replay_latency_sigma,
+                ),
+            )}
+        else:
+            cassette = Cassette(settings.llm_cassette_path) if self.mode == "record" else None
+            names = [name.strip() for name in settings.llm_providers.split(",") if name.strip()]
+            models = {}
+            for name in names:
+                model = self._create_model(name)
+                models[name] = RecordingModel(model, cassette) if cassette else model
+
+        return [
+            LLMProvider(
+                name,
+                model,
+                rate_limiter=self._create_rate_limiter(name),
+                # Fail fast while a provider is erroring instead of running
+                # every call through the full retry schedule
+                breaker=CircuitBreaker(
+                    name,
+                    failure_threshold=settings.llm_circuit_failure_threshold,
+                    reset_timeout=settings.llm_circuit_reset_seconds,
+                ),
+                context_cache=self._create_context_cache(name, model),
+            )
+            for name, model in models.items()
+        ]
+
+    def _create_model(self, name: str) -> Any:
+        """Model object for a provider name"""
+        if name == "gemini":
+            return create_gemini_model(self.model_name)
+        if name == "anthropic":
+            return AnthropicModel(settings.anthropic_model)
+        if name == "stub":
+            return StubModel(
+                LatencyModel(mode="lognormal", median_ms=settings.llm_stub_latency_ms, sigma=settings.llm_replay_latency_sigma),
+                error_rate=settings.llm_stub_error_rate,
+            )
+        raise ValueError(f"Unknown LLM provider '{name}' (expected gemini, anthropic or stub)")
+
+    @staticmethod
+    def _create_rate_limiter(name: str) -> RateLimiter:
+        """
+        RPM/TPM limiter for a provider
+
+        The configured limits are Gemini's account limits (replay simulates
+        Gemini), split evenly across workers. Other providers are not
+        throttled up front but still back off when they answer 429.
+        """
+        if name not in ("gemini", "replay"):
+            return RateLimiter(requests_per_minute=0)
+        workers = max(1, settings.workers)
+        return RateLimiter(
+            requests_per_minute=_worker_share(settings.llm_requests_per_minute, workers),
+            tokens_per_minute=_worker_share(settings.llm_tokens_per_minute, workers),
+        )
+
+    def _create_context_cache(self, name: str, model: Any) -> Optional[ContextCache]:
+        """Context cache for a provider's shared prompt prefixes, per LLM_CONTEXT_CACHE"""
+        kind = settings.llm_context_cache
+        if kind not in ("off", "local"):
+            raise ValueError(f"Unknown LLM_CONTEXT_CACHE '{kind}' (expected off or local)")
+        if kind == "off":
+            return None
+
+        backend = LocalContextBackend(model)
+        print(f"[LLM] Context caching of prompt prefixes for {name}: {type(backend).__name__}")
+        return ContextCache(backend, ttl_seconds=settings.llm_context_cache_ttl_seconds)
+
+    def _cache_params(
+        self,
+        max_tokens: int,
+        temperature: float,
+        system: Optional[str],
+        template: Optional[str] = None,
+        **kwargs
+    ) -> Dict[str, Any]:
+        """
+        Generation parameters that identify a cached response
+
+        `template` is the name of a prompt builder in app/utils/prompts.py; it is
+        stored as "name@source_hash" so editing the template invalidates its entries.
+        """
+        return {
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "system": system,
+            "template": f"{template}@{template_hash(template)}" if template else None,
+            **kwargs,
+        }
 
     def _get_cache_key(self, prompt: str, **kwargs) -> str:
-        """Generate cache key from prompt and parameters"""
-        cache_input = f"{prompt}:{json.dumps(kwargs, sort_keys=True)}"
+        """Generate cache key from prompt, model, cache version and parameters"""
+        key_params = {"version": CACHE_FORMAT_VERSION, "model": self.model_name, **kwargs}
+        cache_input = f"{prompt}:{json.dumps(key_params, sort_keys=True)}"
         return hashlib.sha256(cache_input.encode()).hexdigest()
 
+    def _is_current_entry(self, cached: Dict) -> bool:
+        """Check an entry's version, model and template hash against the running code"""
+        if cached.get("version") != CACHE_FORMAT_VERSION or cached.get("model") != self.model_name:
+            return False
+
+        template = (cached.get("params") or {}).get("template")
+        if template:
+            name, _, stored_hash = template.partition("@")
+            try:
+                return template_hash(name) == stored_hash
+            except KeyError:
+                return False
+        return True
+
     def _read_cache(self, cache_key: str) -> Optional[str]:
         """Read response from cache"""
-        if not settings.cache_enabled:
+        if not self.cache_enabled:
             return None
 
-        cache_file = self.cache_dir / f"{cache_key}.json"
-        if cache_file.exists():
-            try:
-                with open(cache_file, 'r') as f:
-                    cached = json.load(f)
-                print(f"[CACHE HIT] Using cached response for {cache_key[:8]}...")
-                return cached.get("response")
-            except Exception as e:
-                print(f"[CACHE ERROR] Failed to read cache: {e}")
+        try:
+            cached = self.cache.get(cache_key)
+            if cached is None:
+                return None
+            if not self._is_current_entry(cached):
+                self.cache.delete(cache_key)
                 return None
-        return None
+            print(f"[CACHE HIT] Using cached response for {cache_key[:8]}...")
+            return cached.get("response")
+        except Exception as e:
+            print(f"[CACHE ERROR] Failed to read cache: {e}")
+            return None
 
-    def _write_cache(self, cache_key: str, response: str, metadata: Dict = None) -> None:
+    def _write_cache(
+        self,
+        cache_key: str,
+        response: str,
+        metadata: Dict = None,
+        params: Dict = None,
+    ) -> None:
         """Write response to cache"""
-        if not settings.cache_enabled:
+        if not self.cache_enabled:
             return
 
-        cache_file = self.cache_dir / f"{cache_key}.json"
         try:
-            with open(cache_file, 'w') as f:
-                json.dump({
-                    "response": response,
-                    "metadata": metadata or {},
-                    "model": self.model,
-                }, f, indent=2)
+            self.cache.set(cache_key, {
+                "version": CACHE_FORMAT_VERSION,
+                "model": self.model_name,
+                "params": params or {},
+                "response": response,
+                "metadata": metadata or {},
+                "cached_at": datetime.now().isoformat(),
+            })
             print(f"[CACHE WRITE] Cached response to {cache_key[:8]}...")
         except Exception as e:
             print(f"[CACHE ERROR] Failed to write cache: {e}")
 
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=2, max=10),
-    )
+    def cache_self_test(self) -> bool:
+        """
+        Prove the cache round-trips: write a sentinel entry, read it back, delete it
+
+        Returns:
+            True if the entry read back matches what was written
+        """
+        params = self._cache_params(1, 0.0, None, self_test=True)
+        cache_key = self._get_cache_key("__cache_self_test__", **params)
+        sentinel = f"self-test {datetime.now().isoformat()}"
+
+        try:
+            self._write_cache(cache_key, sentinel, {"self_test": True}, params)
+            return self._read_cache(cache_key) == sentinel
+        except Exception as e:
+            print(f"[CACHE ERROR] Self-test raised: {e}")
+            return False
+        finally:
+            try:
+                self.cache.delete(cache_key)
+            except Exception:
+                pass
+
     async def generate(
         self,
-        prompt: str,
+        prompt: Union[str, PromptParts],
         max_tokens: int = 4096,
         temperature: float = 1.0,
         system: Optional[str] = None,
+        template: Optional[str] = None,
+        schema: Optional[Dict[str, Any]] = None,
         **kwargs
     ) -> str:
         """
-        Generate text using Gemini API with retry logic
+        Generate text using Gemini API with caching and request coalescing
+
+        Concurrent calls with the same cache key share a single in-flight
+        Gemini request instead of each paying for their own. Waiting is bounded
+        by the request deadline (app.utils.deadline); a shared call keeps
+        running for other waiters when one caller's deadline passes.
+
+        A PromptParts prompt's fixed prefix is served from the context cache
+        when LLM_CONTEXT_CACHE is enabled; the response cache key covers the
+        full text either way.
 
         Args:
-            prompt: User prompt
+            prompt: User prompt (string, or PromptParts from app/utils/prompts.py)
             max_tokens: Maximum tokens to generate
             temperature: Sampling temperature (0-1)
             system: Optional system prompt
+            template: Name of the prompts.py builder that produced the prompt
+            schema: Gemini response_schema; constrains the output to matching JSON
             **kwargs: Additional parameters
 
         Returns:
             Generated text response
 
         Raises:
+            DeadlineExceeded: If the request deadline passes first
             Exception: If API call fails after retries
         """
+        started = time.monotonic()
+
         # Check cache first
-        cache_key = self._get_cache_key(
-            prompt,
-            max_tokens=max_tokens,
-            temperature=temperature,
-            system=system,
-            **kwargs
-        )
+        if schema is not None:
+            kwargs["schema"] = schema_hash(schema)
+        prompt = split_prompt(prompt)
+        params = self._cache_params(max_tokens, temperature, system, template, **kwargs)
+        cache_key = self._get_cache_key(str(prompt), **params)
 
         cached_response = self._read_cache(cache_key)
         if cached_response:
+            self.stats["cache_hits"] += 1
+            self.metrics.record_request(time.monotonic() - started, cache="hit")
             return cached_response
 
-        # Make API call
-        print(f"[LLM] Calling Gemini API...")
-        print(f"[LLM] Prompt length: {len(prompt)} chars")
+        return await run_within_deadline(self._single_flight(
+            cache_key,
+            lambda: self._call_shared(
+                cache_key,
+                lambda: self._call_llm(cache_key, params, prompt, max_tokens, temperature, system, schema),
+            ),
+        ))
 
-        # Combine system prompt and user prompt
-        full_prompt = prompt
-        if system:
-            full_prompt = f"{system}\n\n{prompt}"
+    async def _call_shared(self, cache_key: str, call) -> str:
+        """
+        Deduplicate a call across worker processes through the shared cache
+
+        The worker that takes the cache lock for this key makes the call and
+        writes the result to the shared cache, refreshing the lock while the
+        call (and its retries) runs. Other workers poll the cache until the
+        result appears or they take over the lock. A worker never waits longer
+        than the lock TTL (or the request deadline, if sooner); after that it
+        makes the call itself.
+        """
+        if not (self.cache_enabled and settings.llm_cross_worker_dedup):
+            return await call()
+
+        lock_name = f"llm:{cache_key}"
+        store = self.cache.cache
+        ttl = settings.llm_lock_ttl_seconds
+        wait_until = time.monotonic() + ttl
+
+        while time.monotonic() < wait_until:
+            if store.try_lock(lock_name, self.worker_id, ttl):
+                heartbeat = asyncio.ensure_future(self._refresh_lock(lock_name, ttl))
+                try:
+                    # Another worker may have finished just before we got the lock
+                    cached_response = self._read_cache(cache_key)
+                    if cached_response:
+                        self.stats["coalesced_cross_worker"] += 1
+                        return cached_response
+                    return await call()
+                finally:
+                    heartbeat.cancel()
+                    store.release_lock(lock_name, self.worker_id)
+
+            if deadline_expired():
+                raise DeadlineExceeded("Request deadline passed while waiting for another worker's LLM call")
+            await asyncio.sleep(0.25)
+
+            cached_response = self._read_cache(cache_key)
+            if cached_response:
+                self.stats["coalesced_cross_worker"] += 1
+                print(f"[LLM] Reused response from another worker for {cache_key[:8]}...")
+                return cached_response
+
+        print(f"[LLM] Gave up waiting {ttl}s on another worker for {cache_key[:8]}... - calling directly")
+        return await call()
+
+    async def _refresh_lock(self, lock_name: str, ttl: float) -> None:
+        """Keep a cross-worker lock alive while its holder's call runs"""
+        store = self.cache.cache
+        while True:
+            await asyncio.sleep(ttl / 3)
+            if not store.try_lock(lock_name, self.worker_id, ttl):
+                print(f"[LLM] Lost lock {lock_name[:12]}... to another worker")
+                return
+
+    async def _single_flight(self, cache_key: str, call) -> str:
+        """
+        Run call() once per cache key; concurrent callers await the same task
+
+        The shared task is only cancelled once every waiter has gone away,
+        so one caller disconnecting never fails the others.
+        """
+        started = time.monotonic()
+        outcome = "miss"
+
+        entry = self._inflight.get(cache_key)
+        if entry is None:
+            self.stats["cache_misses"] += 1
+            entry = {"task": asyncio.ensure_future(call()), "waiters": 0}
+            self._inflight[cache_key] = entry
 
+            def _forget(_task, entry=entry):
+                if self._inflight.get(cache_key) is entry:
+                    del self._inflight[cache_key]
+
+            entry["task"].add_done_callback(_forget)
+        else:
+            outcome = "coalesced"
+            self.stats["coalesced"] += 1
+            print(f"[LLM] Coalescing with in-flight request {cache_key[:8]}...")
+
+        entry["waiters"] += 1
         try:
-            response = self.model.generate_content(
-                full_prompt,
-                generation_config=genai.types.GenerationConfig(
-                    temperature=temperature,
-                    max_output_tokens=max_tokens,
-                )
-            )
+            result = await asyncio.shield(entry["task"])
+            self.metrics.record_request(time.monotonic() - started, cache=outcome)
+            return result
+        except asyncio.CancelledError:
+            if entry["waiters"] == 1 and not entry["task"].done():
+                # Last interested caller is gone (disconnect or deadline)
+                self.stats["abandoned"] += 1
+                entry["task"].cancel()
+            raise
+        finally:
+            entry["waiters"] -= 1
+
+    def estimated_wait(self) -> float:
+        """
+        Rough seconds a new interactive call would wait before reaching Gemini
+
+        The larger of the slot wait (calls that must finish before a slot
+        frees up, spread across the concurrency limit, at the median measured
+        call latency) and the time the rate limiter needs to admit every
+        queued call.
+        """
+        queued = self.scheduler.queue_depth(Priority.INTERACTIVE)
+        typical = self.metrics.api_latency.quantile(0.5) or DEFAULT_CALL_SECONDS
+        ahead = max(0, queued + self.scheduler.in_use() + 1 - self.max_concurrency)
+        by_slots = ahead / self.max_concurrency * typical
+        return max(by_slots, self.router.primary.rate_limiter.estimated_wait(queued + 1))
 
-            text_content = response.text
+    def get_stats(self) -> Dict[str, Any]:
+        """Cache, coalescing, scheduler and per-provider counters since startup"""
+        return {
+            **self.stats,
+            "in_flight": len(self._inflight),
+            "scheduler": self.scheduler.get_stats(),
+            "providers": self.router.get_stats(),
+            "cache": self.cache.cache.get_stats() if self.cache else {},
+            "by_service": self.metrics.summary(),
+        }
+
+    @retry(
+        stop=stop_after_attempt(3) | _stop_at_deadline,
+        wait=wait_exponential(multiplier=1, min=2, max=10),
+        # Tenacity sees BaseExceptions too: a cancelled call must not be retried
+        retry=retry_if_not_exception_type(
+            (CassetteMiss, CircuitOpenError, DeadlineExceeded, asyncio.CancelledError)
+        ),
+        reraise=True,
+    )
+    async def _call_llm(
+        self,
+        cache_key: str,
+        params: Dict[str, Any],
+        prompt: PromptParts,
+        max_tokens: int,
+        temperature: float,
+        system: Optional[str],
+        schema: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """
+        Call the best available provider, falling over to the next on failure
+
+        Each attempt walks the providers in routing order, so a failing
+        provider is skipped within the same attempt rather than after a
+        backoff. The response is cached whichever provider produced it.
+        """
+        providers = self.router.ranked()
+        if not providers:
+            raise CircuitOpenError("All LLM provider circuits are open - failing fast")
+
+        # The system prompt is as stable as the instructions, so it joins the prefix
+        prefix, suffix = prompt
+        if system:
+            prefix = f"{system}\n\n{prefix}"
+        full_prompt = prefix + suffix
+
+        # Rough input estimate (~4 chars/token) for the TPM bucket
+        estimated_input = len(full_prompt) // 4
+        generation_config = self._generation_config(temperature, max_tokens, schema)
+
+        errors: List[Exception] = []
+        for provider in providers:
+            try:
+                provider.breaker.before_call()
+            except CircuitOpenError as e:
+                errors.append(e)
+                continue
+
+            print(f"[LLM] Calling {provider.name}...")
+            print(f"[LLM] Prompt length: {len(full_prompt)} chars ({len(prefix)} in shared prefix)")
+
+            api_started = None
+            try:
+                model, model_prompt = await self._model_for(provider, prefix, full_prompt)
+
+                # Take a scheduler slot before the rate limiter so the RPM/TPM
+                # budget is spent in priority / fair-share order
+                async with self.scheduler.slot():
+                    await provider.rate_limiter.acquire(tokens=estimated_input)
+                    self.stats["api_calls"] += 1
+                    api_started = time.monotonic()
+                    response = await self._hedged(
+                        provider,
+                        lambda: model.generate_content_async(model_prompt, generation_config=generation_config),
+                        estimated_input,
+                    )
+                text_content = response.text
+
+            except (CassetteMiss, asyncio.CancelledError):
+                provider.breaker.on_abandoned()
+                raise
+            except Exception as e:
+                self._record_failure(provider, e, api_started)
+                print(f"[LLM ERROR] {provider.name}: {type(e).__name__}: {str(e)}")
+                errors.append(e)
+                continue
+
+            provider.breaker.on_success()
+            usage = self._settle_usage(
+                provider, usage_from_response(response), estimated_input, text_content, time.monotonic() - api_started
+            )
 
             # Cache the response
-            metadata = {
-                "usage": {
-                    "prompt_tokens": len(prompt.split()),
-                    "completion_tokens": len(text_content.split()),
-                },
-                "model": "gemini-2.0-flash-exp",
-            }
-            self._write_cache(cache_key, text_content, metadata)
+            self._write_cache(cache_key, text_content, {"usage": usage, "provider": provider.name}, params)
 
-            print(f"[LLM] ✓ Success - Response: {len(text_content)} chars")
+            print(f"[LLM] ✓ Success ({provider.name}) - Response: {len(text_content)} chars")
             return text_content
 
-        except Exception as e:
-            print(f"[LLM ERROR] {type(e).__name__}: {str(e)}")
-            raise Exception(f"LLM API call failed: {str(e)}")
+        failures = [e for e in errors if not isinstance(e, CircuitOpenError)]
+        if not failures:
+            raise errors[-1]
+        raise Exception(f"LLM API call failed: {str(failures[-1])}")
+
+    async def _model_for(self, provider: LLMProvider, prefix: str, full_prompt: str):
+        """(model, prompt to send): the suffix to a cached context if one is available"""
+        if provider.context_cache is None:
+            return provider.model, full_prompt
+        cached_model = await provider.context_cache.model_for(prefix)
+        if cached_model is None:
+            return provider.model, full_prompt
+        return cached_model, full_prompt[len(prefix):]
+
+    def _settle_usage(
+        self,
+        provider: LLMProvider,
+        usage: Optional[Dict[str, int]],
+        estimated_input: int,
+        text_content: str,
+        latency: float,
+    ) -> Dict[str, int]:
+        """
+        Charge real token usage to the provider's rate limiter and statistics, and to metrics
+
+        Falls back to a ~4 chars/token estimate when the response carries no
+        usage metadata (e.g. replayed cassettes recorded without it).
+        """
+        if not usage:
+            usage = {
+                "prompt_tokens": estimated_input,
+                "completion_tokens": len(text_content) // 4,
+                "estimated": True,
+            }
+
+        # The input estimate was charged up front; settle the difference
+        provider.rate_limiter.consume_tokens(
+            usage["prompt_tokens"] - estimated_input + usage["completion_tokens"]
+        )
+        provider.rate_limiter.on_success()
+        provider.record_success(latency)
+        self.metrics.record_api_call(
+            latency,
+            provider=provider.name,
+            input_tokens=usage["prompt_tokens"],
+            output_tokens=usage["completion_tokens"],
+            cached_tokens=usage.get("cached_tokens", 0),
+        )
+        self.stats["cached_input_tokens"] += usage.get("cached_tokens", 0)
+        return usage
+
+    @staticmethod
+    def _generation_config(
+        temperature: float,
+        max_tokens: int,
+        schema: Optional[Dict[str, Any]] = None,
+    ) -> genai.types.GenerationConfig:
+        """GenerationConfig, switched to schema-constrained JSON output when a schema is given"""
+        if schema is None:
+            return genai.types.GenerationConfig(temperature=temperature, max_output_tokens=max_tokens)
+        return genai.types.GenerationConfig(
+            temperature=temperature,
+            max_output_tokens=max_tokens,
+            response_mime_type="application/json",
+            response_schema=schema,
+        )
+
+    async def _hedged(self, provider: LLMProvider, call: Callable[[], Any], estimated_input: int) -> Any:
+        """
+        Run call(); if it outlives the provider's p95 latency, race a duplicate against it
+
+        Hedging only applies to interactive calls, only once enough calls have
+        been measured (LLM_HEDGE_MIN_SAMPLES), and only when a spare slot and
+        rate budget are free right now, so it never delays queued work. The
+        first successful response wins and the other request is cancelled.
+        """
+        delay = self._hedge_delay(provider)
+        if delay is None:
+            return await call()
+
+        primary = asyncio.ensure_future(call())
+        pending = {primary}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if not done and self._can_hedge(provider):
+                print(f"[LLM] Call exceeded p95 ({delay:.1f}s) - sending hedged request")
+                self.stats["hedged"] += 1
+                pending.add(asyncio.ensure_future(self._hedge_call(provider, call, estimated_input)))
+
+            errors = []
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.stats["hedge_wins"] += 1
+                        return task.result()
+                    errors.append(task.exception())
+            raise errors[0]
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _hedge_delay(self, provider: LLMProvider) -> Optional[float]:
+        """p95 of the provider's successful call latency, or None if this call should not be hedged"""
+        if not settings.llm_hedge_enabled or current_priority() != Priority.INTERACTIVE:
+            return None
+        match = {"provider": provider.name, "outcome": "ok"}
+        if self.metrics.api_latency.count(match) < settings.llm_hedge_min_samples:
+            return None
+        return self.metrics.api_latency.quantile(0.95, match)
+
+    def _can_hedge(self, provider: LLMProvider) -> bool:
+        """Only hedge with capacity nobody else is waiting for"""
+        return (
+            self.scheduler.in_use() < self.max_concurrency
+            and not self.scheduler.queue_depth()
+            and provider.rate_limiter.estimated_wait() == 0
+        )
+
+    async def _hedge_call(self, provider: LLMProvider, call: Callable[[], Any], estimated_input: int) -> Any:
+        async with self.scheduler.slot():
+            await provider.rate_limiter.acquire(tokens=estimated_input)
+            self.stats["api_calls"] += 1
+            return await call()
+
+    def _record_failure(self, provider: LLMProvider, error: Exception, api_started: Optional[float]) -> None:
+        """Feed a failed API call into the provider's rate limiter, circuit breaker and statistics, and metrics"""
+        rate_limited = is_rate_limit_error(error)
+        if rate_limited:
+            # Throttling is handled by the rate limiter, not the breaker
+            provider.rate_limiter.on_rate_limited(parse_retry_after(error))
+            provider.breaker.on_abandoned()
+        elif api_started is not None:
+            provider.breaker.on_failure()
+        else:
+            provider.breaker.on_abandoned()
+        if api_started is not None:
+            provider.record_failure()
+            self.metrics.record_api_call(
+                time.monotonic() - api_started,
+                provider=provider.name,
+                outcome="rate_limited" if rate_limited else "error",
+            )
 
     async def generate_json(
         self,
-        prompt: str,
+        prompt: Union[str, PromptParts],
         max_tokens: int = 4096,
         **kwargs
     ) -> Any:
@@ -179,7 +751,16 @@ class LLMService:
             temperature=0.5,  # Lower temperature for structured output
             **kwargs
         )
+        return self._parse_json(response_text)
+
+    @staticmethod
+    def _parse_json(response_text: str) -> Any:
+        """
+        Parse JSON from a model response, tolerating markdown fences and surrounding text
 
+        Raises:
+            ValueError: If no valid JSON can be found
+        """
         # Try to extract JSON from response
         # Sometimes Claude wraps JSON in markdown code blocks or adds explanatory text
         response_text = response_text.strip()
@@ -194,13 +775,11 @@ class LLMService:
                 lines = lines[:-1]
             response_text = '\n'.join(lines).strip()
 
-        # Try to find JSON object in text (look for first { and last })
+        # Find the first balanced JSON object/array if there is surrounding text
         if not response_text.startswith('{') and not response_text.startswith('['):
-            # Search for JSON object
-            import re
-            json_match = re.search(r'(\{[\s\S]*\}|\[[\s\S]*\])', response_text)
-            if json_match:
-                response_text = json_match.group(1)
+            json_text = extract_json_text(response_text)
+            if json_text:
+                response_text = json_text
 
         try:
             return json.loads(response_text)
@@ -209,6 +788,427 @@ class LLMService:
             print(f"[LLM ERROR] Response text: {response_text[:500]}...")
             raise ValueError(f"LLM did not return valid JSON: {str(e)}")
 
+    async def generate_structured(
+        self,
+        prompt: Union[str, PromptParts],
+        response_type: Any,
+        max_tokens: int = 4096,
+        template: Optional[str] = None,
+    ) -> Any:
+        """
+        Generate a response constrained to a Pydantic type
+
+        The model is called in JSON mode with a response_schema derived from
+        `response_type`, so the answer needs no markdown stripping or regex
+        extraction. It is then validated in one pass with a cached TypeAdapter;
+        for List[...] types, invalid elements are dropped individually.
+
+        Args:
+            prompt: User prompt
+            response_type: Pydantic model, or List[...] of one
+            max_tokens: Maximum tokens to generate
+            template: Name of the prompts.py builder that produced the prompt
+
+        Returns:
+            Validated instance(s) of response_type
+
+        Raises:
+            ValueError: If the response does not match response_type
+        """
+        response_text = await self.generate(
+            prompt=prompt,
+            max_tokens=max_tokens,
+            temperature=0.5,
+            template=template,
+            schema=response_schema(response_type),
+        )
+        return validate_response(response_text, response_type)
+
+    async def generate_json_many(
+        self,
+        prompts: Dict[str, Union[str, PromptParts]],
+        max_tokens_per_item: int = 1024,
+        validate: Optional[Callable[[Any], bool]] = None,
+        template: Optional[str] = None,
+        response_type: Any = None,
+    ) -> Dict[str, Any]:
+        """
+        Answer many independent JSON prompts with as few LLM calls as possible
+
+        Sub-prompts are packed into batched prompts that stay within the input
+        token budget (LLM_BATCH_TOKEN_BUDGET) and output limit
+        (LLM_BATCH_MAX_OUTPUT_TOKENS). The model answers each batch with one
+        JSON object keyed by task, which is split back out per key. Only the
+        sub-requests that are missing or fail `validate` are retried
+        individually.
+
+        With `response_type`, calls run in JSON mode under a response schema
+        and each answer is validated against the type (see generate_structured).
+
+        Args:
+            prompts: Mapping of key (e.g. topic name) -> prompt requesting JSON
+            max_tokens_per_item: Expected output tokens for a single answer
+            validate: Optional check run on each answer; False triggers a retry
+            template: Name of the prompts.py builder that produced the prompts
+            response_type: Optional Pydantic type every answer must match
+
+        Returns:
+            Dict mapping key -> parsed (or validated) answer. Keys whose individual retry
+            also failed, or that were unfinished when the request deadline
+            passed, are omitted.
+        """
+        if not prompts:
+            return {}
+
+        batches = self._pack_batches(prompts, max_tokens_per_item)
+        print(f"[LLM] Packed {len(prompts)} sub-requests into {len(batches)} batched call(s)")
+
+        batch_results = await asyncio.gather(*[
+            self._generate_batch(batch, prompts, max_tokens_per_item, template, response_type)
+            for batch in batches
+        ])
+
+        results: Dict[str, Any] = {}
+        failed: List[str] = []
+        for batch_result in batch_results:
+            for key, value in batch_result.items():
+                if value is None or (validate and not self._is_valid(validate, value)):
+                    failed.append(key)
+                else:
+                    results[key] = value
+
+        if failed and deadline_expired():
+            print(f"[LLM] Deadline reached - skipping retry of {len(failed)} sub-request(s)")
+        elif failed:
+            print(f"[LLM] Retrying {len(failed)} sub-request(s) individually")
+            retried = await asyncio.gather(*[
+                self._generate_one(prompts[key], max_tokens_per_item, template, response_type)
+                for key in failed
+            ], return_exceptions=True)
+
+            for key, value in zip(failed, retried):
+                if isinstance(value, Exception):
+                    print(f"[LLM ERROR] Sub-request '{key}' failed: {value}")
+                elif validate and not self._is_valid(validate, value):
+                    print(f"[LLM ERROR] Sub-request '{key}' failed validation")
+                else:
+                    results[key] = value
+
+        return results
+
+    def _pack_batches(self, prompts: Dict[str, Union[str, PromptParts]], max_tokens_per_item: int) -> List[List[str]]:
+        """Greedily group keys so each batch fits the input and output budgets"""
+        batches: List[List[str]] = []
+        current: List[str] = []
+        input_tokens = 0
+
+        for key, prompt in prompts.items():
+            # A shared prefix is sent once per batch; only suffixes add up
+            prompt_tokens = len(split_prompt(prompt).suffix) // 4
+            too_much_input = input_tokens + prompt_tokens > settings.llm_batch_token_budget
+            too_much_output = (len(current) + 1) * max_tokens_per_item > settings.llm_batch_max_output_tokens
+            if current and (too_much_input or too_much_output):
+                batches.append(current)
+                current = []
+                input_tokens = 0
+            current.append(key)
+            input_tokens += prompt_tokens
+
+        if current:
+            batches.append(current)
+        return batches
+
+    async def _generate_batch(
+        self,
+        keys: List[str],
+        prompts: Dict[str, Union[str, PromptParts]],
+        max_tokens_per_item: int,
+        template: Optional[str] = None,
+        response_type: Any = None,
+    ) -> Dict[str, Any]:
+        """Run one packed batch, returning key -> answer (None if missing)"""
+        if len(keys) == 1:
+            try:
+                return {keys[0]: await self._generate_one(
+                    prompts[keys[0]], max_tokens_per_item, template, response_type
+                )}
+            except Exception as e:
+                print(f"[LLM ERROR] Sub-request '{keys[0]}' failed: {e}")
+                return {keys[0]: None}
+
+        task_ids = {f"task_{i + 1}": key for i, key in enumerate(keys)}
+        parts = {key: split_prompt(prompts[key]) for key in keys}
+        example = ", ".join(f'"{task_id}": <answer>' for task_id in task_ids)
+
+        # Tasks built from the same template share their instructions: send them
+        # once, as the (context-cacheable) prefix, followed by the task suffixes
+        prefixes = {part.prefix for part in parts.values()}
+        shared_prefix = prefixes.pop() if len(prefixes) == 1 else ""
+        tasks = "\n\n".join(
+            f"### TASK {task_id}\n{parts[key].suffix if shared_prefix else str(parts[key])}"
+            for task_id, key in task_ids.items()
+        )
+        instructions = (
+            "Follow the instructions above for every task"
+            if shared_prefix else "Follow each task's own instructions"
+        )
+
+        batch_prompt = PromptParts(shared_prefix, f"""
+You will complete {len(keys)} independent tasks. Each task starts with a "### TASK <id>" header.
+
+{instructions} for the shape of its answer, but return ONE JSON object
+whose keys are the task ids and whose values are the JSON answers for those tasks:
+{{{example}}}
+
+Return ONLY that JSON object, no markdown or explanatory text.
+
+{tasks}""")
+
+        max_tokens = min(settings.llm_batch_max_output_tokens, max_tokens_per_item * len(keys))
+        schema = None
+        if response_type is not None:
+            item_schema = response_schema(response_type)
+            schema = {
+                "type": "object",
+                "properties": {task_id: item_schema for task_id in task_ids},
+                "required": list(task_ids),
+            }
+        try:
+            response_text = await self.generate(
+                prompt=batch_prompt,
+                max_tokens=max_tokens,
+                temperature=0.5,
+                template=template,
+                schema=schema,
+            )
+        except Exception as e:
+            print(f"[LLM ERROR] Batched call failed: {e}")
+            return {key: None for key in keys}
+
+        try:
+            result = self._parse_json(response_text)
+        except ValueError:
+            # One truncated or malformed task must not cost the others
+            result = extract_json_entries(response_text, task_ids)
+            print(f"[LLM WARNING] Batched response is not valid JSON - kept {len(result)} of {len(keys)} task(s)")
+
+        if not isinstance(result, dict):
+            return {key: None for key in keys}
+
+        answers = {key: result.get(task_id) for task_id, key in task_ids.items()}
+        if response_type is not None:
+            for key, value in answers.items():
+                try:
+                    answers[key] = None if value is None else validate_response(value, response_type)
+                except ValueError as e:
+                    print(f"[LLM ERROR] Sub-request '{key}' failed validation: {e}")
+                    answers[key] = None
+        return answers
+
+    async def _generate_one(
+        self,
+        prompt: Union[str, PromptParts],
+        max_tokens: int,
+        template: Optional[str],
+        response_type: Any,
+    ) -> Any:
+        if response_type is None:
+            return await self.generate_json(prompt, max_tokens=max_tokens, template=template)
+        return await self.generate_structured(prompt, response_type, max_tokens=max_tokens, template=template)
+
+    @staticmethod
+    def _is_valid(validate: Callable[[Any], bool], value: Any) -> bool:
+        try:
+            return bool(validate(value))
+        except Exception:
+            return False
+
+    async def generate_json_stream(
+        self,
+        prompt: Union[str, PromptParts],
+        max_tokens: int = 4096,
+        temperature: float = 0.5,
+        template: Optional[str] = None,
+        response_type: Any = None,
+    ) -> AsyncIterator[Any]:
+        """
+        Stream the elements of a JSON array response as they are generated
+
+        Each array element (e.g. one question or topic object) is yielded as
+        soon as its closing bracket arrives. The full response is cached under
+        the same key as generate_json, so a cached prompt replays instantly.
+
+        With a List[...] `response_type`, the stream runs in JSON mode under
+        its response schema and each element is validated as it arrives;
+        invalid elements are skipped.
+
+        The model stream is read by a separate task that holds the LLM slot
+        only while the model is generating; elements reach the caller
+        through a queue, so a slow reader never keeps a slot busy.
+
+        Args:
+            prompt: User prompt (should request a JSON array)
+            max_tokens: Maximum tokens to generate
+            temperature: Sampling temperature (0-1)
+            template: Name of the prompts.py builder that produced the prompt
+            response_type: Optional List[...] type the array must match
+
+        Yields:
+            Parsed (or validated) array elements in order
+
+        Raises:
+            Exception: If the API call fails
+        """
+        parser = JsonArrayStreamParser()
+        schema = None
+        extra_params = {}
+        if response_type is not None:
+            schema = response_schema(response_type)
+            extra_params["schema"] = schema_hash(schema)
+        prefix, suffix = split_prompt(prompt)
+        full_prompt = prefix + suffix
+        params = self._cache_params(max_tokens, temperature, None, template, **extra_params)
+        cache_key = self._get_cache_key(full_prompt, **params)
+
+        cached_response = self._read_cache(cache_key)
+        if cached_response:
+            self.stats["cache_hits"] += 1
+            self.metrics.record_request(0.0, cache="hit")
+            for item in self._validated_items(parser.feed(cached_response), response_type):
+                yield item
+            return
+
+        if deadline_expired():
+            raise DeadlineExceeded("Request deadline exceeded")
+        providers = self.router.ranked()
+        if not providers:
+            raise CircuitOpenError("All LLM provider circuits are open - failing fast")
+
+        self.stats["cache_misses"] += 1
+        estimated_input = len(full_prompt) // 4
+        generation_config = self._generation_config(temperature, max_tokens, schema)
+
+        for attempt, provider in enumerate(providers, start=1):
+            last_provider = attempt == len(providers)
+            try:
+                provider.breaker.before_call()
+            except CircuitOpenError:
+                if last_provider:
+                    raise
+                continue
+
+            print(f"[LLM] Streaming from {provider.name}...")
+            print(f"[LLM] Prompt length: {len(full_prompt)} chars ({len(prefix)} in shared prefix)")
+
+            parser = JsonArrayStreamParser()
+            chunks = []
+            yielded = False
+            usage = None
+            # Every chunk carries at least one token; room for a usage-only chunk and the end marker
+            queue: asyncio.Queue = asyncio.Queue(maxsize=max_tokens + 2)
+            state = SimpleNamespace(api_started=None, api_finished=None)
+            producer = None
+            try:
+                model, model_prompt = await self._model_for(provider, prefix, full_prompt)
+                producer = asyncio.ensure_future(self._drain_stream(
+                    provider, model, model_prompt, generation_config, estimated_input, queue, state
+                ))
+                while (entry := await queue.get()) is not None:
+                    if isinstance(entry, Exception):
+                        raise entry
+                    text, chunk_usage = entry
+                    # Usage metadata arrives with the final chunk
+                    usage = chunk_usage or usage
+                    chunks.append(text)
+                    for item in self._validated_items(parser.feed(text), response_type):
+                        yielded = True
+                        yield item
+
+            except (asyncio.CancelledError, GeneratorExit):
+                # Consumer went away mid-stream
+                provider.breaker.on_abandoned()
+                raise
+            except Exception as e:
+                self._record_failure(provider, e, state.api_started)
+                print(f"[LLM ERROR] {provider.name}: {type(e).__name__}: {str(e)}")
+                # Elements already handed out cannot be taken back, so fall
+                # over to the next provider only if none were
+                if yielded or last_provider:
+                    raise Exception(f"LLM API call failed: {str(e)}")
+                continue
+            finally:
+                # Stops the model stream (and frees the slot) if we leave early
+                if producer is not None and not producer.done():
+                    producer.cancel()
+
+            break
+
+        provider.breaker.on_success()
+        text_content = ''.join(chunks)
+        latency = state.api_finished - state.api_started
+        usage = self._settle_usage(provider, usage, estimated_input, text_content, latency)
+        self.metrics.record_request(latency, cache="miss")
+
+        if not parser.started:
+            raise ValueError("LLM did not return a JSON array")
+
+        self._write_cache(cache_key, text_content, {"usage": usage, "provider": provider.name, "streamed": True}, params)
+        print(f"[LLM] ✓ Stream complete - Response: {len(text_content)} chars")
+
+    async def _drain_stream(
+        self,
+        provider: LLMProvider,
+        model: Any,
+        model_prompt: str,
+        generation_config: Any,
+        estimated_input: int,
+        queue: asyncio.Queue,
+        state: SimpleNamespace,
+    ) -> None:
+        """
+        Read a streamed model response into `queue` while holding an LLM slot
+
+        Puts (text, usage) per chunk, then None at the end or the exception
+        the call failed with. The queue is sized for the largest possible
+        response, so the slot is released as soon as the model finishes,
+        however slowly the consumer reads.
+        """
+        try:
+            async with self.scheduler.slot():
+                await provider.rate_limiter.acquire(tokens=estimated_input)
+                self.stats["api_calls"] += 1
+                state.api_started = time.monotonic()
+                response = await model.generate_content_async(
+                    model_prompt,
+                    generation_config=generation_config,
+                    stream=True,
+                )
+                async for chunk in response:
+                    if queue.qsize() >= queue.maxsize - 1:
+                        raise RuntimeError("Stream produced more chunks than max_tokens allows")
+                    queue.put_nowait((chunk.text, usage_from_response(chunk)))
+                state.api_finished = time.monotonic()
+        except Exception as e:
+            queue.put_nowait(e)
+        else:
+            queue.put_nowait(None)
+
+    @staticmethod
+    def _validated_items(items: List[Any], response_type: Any) -> List[Any]:
+        """Validate streamed array elements against List[...]'s item type, skipping invalid ones"""
+        item_type = list_item_type(response_type) if response_type is not None else None
+        if item_type is None:
+            return items
+
+        adapter = type_adapter(item_type)
+        valid = []
+        for item in items:
+            try:
+                valid.append(adapter.validate_python(item))
+            except ValidationError as e:
+                print(f"[SCHEMA WARNING] Skipping invalid streamed element: {e.errors()[0]['msg']}")
+        return valid
+
 
 # Global instance
 _llm_service: Optional[LLMService] = None
@@ -220,3 +1220,10 @@ def get_llm_service() -> LLMService:
     if _llm_service is None:
         _llm_service = LLMService()
     return _llm_service
+
+
+def get_llm_stats() -> Dict[str, Any]:
+    """Get LLM counters without forcing the service (and API key) to load"""
+    if _llm_service is None:
+        return {}
+    return _llm_service.get_stats()
@@ -0,0 +1,84 @@
+"""
+Load Shedding
+Fast 503 + Retry-After for LLM-backed endpoints when the LLM queue is saturated
+"""
+
+import math
+from typing import Awaitable, Callable, Iterable
+
+from fastapi import HTTPException, Request
+from fastapi.responses import JSONResponse, Response
+
+from app.config import settings
+from app.services.llm_scheduler import Priority
+from app.services.llm_service import get_llm_service
+
+
+async def shed_llm_load() -> None:
+    """
+    Route dependency rejecting new LLM work while the queue is saturated
+
+    A request is turned away before it does any work when more interactive
+    calls are queued than LLM_MAX_QUEUE_DEPTH, or when the estimated wait
+    for an LLM slot exceeds LLM_MAX_ESTIMATED_WAIT_SECONDS, or while the
+    circuit breakers of all LLM providers are open. Clients get a 503 with a Retry-After hint
+    instead of holding a connection for minutes. Student-facing form
+    endpoints do not use this dependency.
+
+    Raises:
+        HTTPException: 503 when the request is shed
+    """
+    llm = get_llm_service()
+
+    if llm.router.all_open():
+        llm.stats["shed"] += 1
+        raise HTTPException(
+            status_code=503,
+            detail="The AI service is temporarily unavailable. Please try again shortly.",
+            headers={"Retry-After": str(max(1, math.ceil(llm.router.seconds_until_probe())))},
+        )
+
+    queued = llm.scheduler.queue_depth(Priority.INTERACTIVE)
+    estimated_wait = llm.estimated_wait()
+
+    if queued < settings.llm_max_queue_depth and estimated_wait <= settings.llm_max_estimated_wait_seconds:
+        return
+
+    llm.stats["shed"] += 1
+    retry_after = min(120, max(1, math.ceil(estimated_wait)))
+    print(f"[LOAD SHED] Rejecting request: {queued} queued, ~{estimated_wait:.1f}s estimated wait")
+    raise HTTPException(
+        status_code=503,
+        detail="The AI service is busy right now. Please try again shortly.",
+        headers={"Retry-After": str(retry_after)},
+    )
+
+
+def shed_llm_load_before_body(
+    paths: Iterable[str],
+) -> Callable[[Request, Callable[[Request], Awaitable[Response]]], Awaitable[Response]]:
+    """
+    HTTP middleware applying shed_llm_load before the request body is received
+
+    FastAPI parses form bodies before it resolves route dependencies, so as a
+    dependency shed_llm_load would only turn an upload away after receiving
+    and storing the whole file. For the endpoints in `paths` it runs here
+    instead, straight from the headers.
+
+    Args:
+        paths: Request paths to shed (e.g. "/api/textbooks/upload")
+
+    Returns:
+        Middleware function for app.middleware("http")
+    """
+    shed = set(paths)
+
+    async def middleware(request: Request, call_next: Callable[[Request], Awaitable[Response]]) -> Response:
+        if request.method == "POST" and request.url.path in shed:
+            try:
+                await shed_llm_load()
+            except HTTPException as e:
+                return JSONResponse(status_code=e.status_code, content={"detail": e.detail}, headers=e.headers)
+        return await call_next(request)
+
+    return middleware
@@ -3,15 +3,24 @@ Question Generator Service
 Generates MCQ diagnostic questions using LLM
 """
 
-from typing import List, Optional
+from contextlib import aclosing
+from typing import AsyncIterator, List, Optional, Tuple
 from uuid import UUID
 
+from pydantic import BaseModel
+
 from app.models.question import Question, Difficulty, GenerateQuestionsRequest
 from app.models.course import CourseLevel
+from app.services.llm_metrics import llm_caller
 from app.services.llm_service import get_llm_service
+from app.utils.deadline import DeadlineExceeded, deadline_expired
 from app.utils.prompts import question_generation_prompt
+from app.utils.schemas import draft_model
 from app.database import db
 
+# What the LLM returns per topic: questions without the server-assigned id and topic
+QUESTION_DRAFTS = List[draft_model(Question, ("id", "topic"))]
+
 
 class QuestionGeneratorService:
     """Service for generating diagnostic questions"""
@@ -26,10 +35,14 @@ class QuestionGeneratorService:
         difficulty: Optional[Difficulty] = None,
         course_level: Optional[CourseLevel] = None,
         context: Optional[str] = None,
-    ) -> List[Question]:
+    ) -> Tuple[List[Question], List[str]]:
         """
         Generate MCQ questions for given topics
 
+        Bounded by the request deadline (app.utils.deadline): when it runs out,
+        the questions finished so far are returned along with the topics that
+        were not.
+
         Args:
             topics: List of topic names
             count_per_topic: Number of questions per topic
@@ -38,84 +51,174 @@ class QuestionGeneratorService:
             context: Additional context (e.g., textbook information)
 
         Returns:
-            List of generated Question objects
+            (generated Question objects, names of topics without questions)
 
         Raises:
+            DeadlineExceeded: If the deadline passed before any topic finished
             ValueError: If generation fails
         """
         print(f"\n[QUESTION GEN] Generating {count_per_topic} questions for {len(topics)} topics...")
         if context:
             print(f"[QUESTION GEN] Using context: {context}")
 
+        # One prompt per topic; LLMService packs them into as few calls as fit
+        prompts = {
+            topic_name: question_generation_prompt(
+                topic=topic_name,
+                count=count_per_topic,
+                course_level=course_level.value if course_level else None,
+                difficulty=difficulty.value if hasattr(difficulty, 'value') else difficulty,
+                context=context,
+            )
+            for topic_name in topics
+        }
+
+        with llm_caller("question_generator"):
+            results = await self.llm.generate_json_many(
+                prompts,
+                max_tokens_per_item=min(4096, 300 * count_per_topic + 256),
+                validate=self._has_valid_question,
+                template="question_generation",
+                response_type=QUESTION_DRAFTS,
+            )
+
         all_questions = []
+        unfinished_topics = []
+        question_counter = 1
+
+        for topic_name in prompts:
+            questions_data = results.get(topic_name)
+            if questions_data is None:
+                print(f"[QUESTION GEN ERROR] Failed to generate questions for {topic_name}")
+                # Continue to next topic rather than failing completely
+                unfinished_topics.append(topic_name)
+                continue
+
+            topic_questions = []
+            for item in questions_data:
+                question = self._build_question(item, topic_name, question_counter)
+                if question:
+                    question_counter += 1
+                    topic_questions.append(question)
+
+            print(f"[QUESTION GEN] Generated {len(topic_questions)} questions for {topic_name}")
+            if not topic_questions:
+                unfinished_topics.append(topic_name)
+            all_questions.extend(topic_questions)
+
+        if not all_questions:
+            if deadline_expired():
+                raise DeadlineExceeded("No topic finished before the request deadline")
+            raise ValueError("No valid questions were generated for any topic")
+
+        if unfinished_topics:
+            print(f"[QUESTION GEN] {len(unfinished_topics)} topic(s) unfinished: {unfinished_topics}")
+        print(f"\n[QUESTION GEN] Successfully generated {len(all_questions)} total questions")
+        return all_questions, unfinished_topics
+
+    async def stream_questions(
+        self,
+        topics: List[str],
+        count_per_topic: int = 5,
+        difficulty: Optional[Difficulty] = None,
+        course_level: Optional[CourseLevel] = None,
+        context: Optional[str] = None,
+    ) -> AsyncIterator[Question]:
+        """
+        Generate MCQ questions, yielding each one as soon as it is parsed
+
+        Same arguments as generate_questions. Topics are processed in order and
+        a failing topic is skipped rather than ending the stream. No new topic
+        is started once the request deadline has passed.
+
+        Yields:
+            Validated Question objects
+        """
+        print(f"\n[QUESTION GEN] Streaming {count_per_topic} questions for {len(topics)} topics...")
+
         question_counter = 1
 
         for topic_name in topics:
-            print(f"\n[QUESTION GEN] Generating questions for topic: {topic_name}")
+            if deadline_expired():
+                print(f"[QUESTION GEN] Deadline reached - stopping before {topic_name}")
+                return
+
+            prompt = question_generation_prompt(
+                topic=topic_name,
+                count=count_per_topic,
+                course_level=course_level.value if course_level else None,
+                difficulty=difficulty.value if hasattr(difficulty, 'value') else difficulty,
+                context=context,
+            )
 
             try:
-                # Create prompt for this topic
-                prompt = question_generation_prompt(
-                    topic=topic_name,
-                    count=count_per_topic,
-                    course_level=course_level.value if course_level else None,
-                    difficulty=difficulty.value if hasattr(difficulty, 'value') else difficulty,
-                    context=context,
-                )
-
-                # Call LLM
-                questions_data = await self.llm.generate_json(prompt, max_tokens=4096)
-
-                # Validate and convert to Question objects
-                if not isinstance(questions_data, list):
-                    raise ValueError(f"LLM response for {topic_name} is not a list")
-
-                topic_questions = []
-                for item in questions_data:
-                    try:
-                        # Ensure the question has the topic field set
-                        if "topic" not in item or not item["topic"]:
-                            item["topic"] = topic_name
-
-                        # Renumber question IDs to be sequential
-                        item["id"] = f"q_{question_counter:03d}"
-                        question_counter += 1
-
-                        question = Question(**item)
-
-                        # Validation happens automatically in Pydantic model
-
-                        # Quality check
-                        if len(question.options) < 2 or len(question.options) > 6:
-                            print(f"[QUESTION GEN WARNING] Question {question.id} has invalid number of options: {len(question.options)}")
-                            continue
-
-                        if not question.stem or len(question.stem) < 5:
-                            print(f"[QUESTION GEN WARNING] Question {question.id} has invalid stem")
-                            continue
-
-                        topic_questions.append(question)
-
-                    except Exception as e:
-                        print(f"[QUESTION GEN WARNING] Skipping invalid question: {e}")
-                        continue
-
-                if not topic_questions:
-                    print(f"[QUESTION GEN WARNING] No valid questions generated for {topic_name}")
-                else:
-                    print(f"[QUESTION GEN] Generated {len(topic_questions)} questions for {topic_name}")
-                    all_questions.extend(topic_questions)
+                with llm_caller("question_generator"):
+                    stream = self.llm.generate_json_stream(
+                        prompt, max_tokens=4096, template="question_generation", response_type=QUESTION_DRAFTS
+                    )
+                    # Close the LLM stream right away if our consumer stops early
+                    async with aclosing(stream):
+                        async for item in stream:
+                            question = self._build_question(item, topic_name, question_counter)
+                            if question:
+                                question_counter += 1
+                                yield question
 
             except Exception as e:
-                print(f"[QUESTION GEN ERROR] Failed to generate questions for {topic_name}: {e}")
-                # Continue to next topic rather than failing completely
+                print(f"[QUESTION GEN ERROR] Failed to stream questions for {topic_name}: {e}")
                 continue
 
-        if not all_questions:
-            raise ValueError("No valid questions were generated for any topic")
+    def _has_valid_question(self, questions_data) -> bool:
+        """Check that an LLM answer is a list holding at least one usable question"""
+        if not isinstance(questions_data, list):
+            return False
+        return any(self._build_question(item, "topic", 1) for item in questions_data)
 
-        print(f"\n[QUESTION GEN] Successfully generated {len(all_questions)} total questions")
-        return all_questions
+    def _build_question(self, item, topic_name: str, number: int) -> Optional[Question]:
+        """
+        Validate one LLM question object, returning None if it is unusable
+
+        Args:
+            item: Question draft (or raw question dict) from the LLM
+            topic_name: Topic the question was generated for
+            number: Sequential question number used for the ID
+
+        Returns:
+            Question, or None if the item fails validation
+        """
+        try:
+            if isinstance(item, BaseModel):
+                item = item.model_dump()
+            elif not isinstance(item, dict):
+                return None
+            else:
+                item = dict(item)
+
+            # Ensure the question has the topic field set
+            if "topic" not in item or not item["topic"]:
+                item["topic"] = topic_name
+
+            # Renumber question IDs to be sequential
+            item["id"] = f"q_{number:03d}"
+
+            question = Question(**item)
+
+            # Validation happens automatically in Pydantic model
+
+            # Quality check
+            if len(question.options) < 2 or len(question.options) > 6:
+                print(f"[QUESTION GEN WARNING] Question {question.id} has invalid number of options: {len(question.options)}")
+                return None
+
+            if not question.stem or len(question.stem) < 5:
+                print(f"[QUESTION GEN WARNING] Question {question.id} has invalid stem")
+                return None
+
+            return question
+
+        except Exception as e:
+            print(f"[QUESTION GEN WARNING] Skipping invalid question: {e}")
+            return None
 
     async def save_questions_to_db(
         self,
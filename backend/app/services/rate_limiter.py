@@ -0,0 +1,145 @@
+"""
+Rate Limiter
+Shared token-bucket limiter for LLM requests/minute and tokens/minute
+"""
+
+import asyncio
+import re
+import time
+from typing import Any, Dict, Optional
+
+
+class _Bucket:
+    """Token bucket refilled continuously at a per-minute rate"""
+
+    def __init__(self, per_minute: float, burst_seconds: float):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float, scale: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate * scale)
+        self.updated = now
+
+    def wait_time(self, amount: float, scale: float) -> float:
+        # A single request larger than the bucket is admitted once the bucket is full
+        needed = min(amount, self.capacity) - self.level
+        if needed <= 0:
+            return 0.0
+        return needed / (self.rate * scale)
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute limiter for Gemini calls
+
+    Callers await acquire() before each request. When the API answers with a
+    429 the effective rate is halved and new requests are held back for the
+    suggested retry delay; successful calls slowly restore the full rate.
+    """
+
+    MIN_SCALE = 0.1
+    RECOVERY_STEP = 0.05
+
+    def __init__(
+        self,
+        requests_per_minute: float,
+        tokens_per_minute: float = 0,
+        burst_seconds: float = 10.0,
+    ):
+        self._requests = _Bucket(requests_per_minute, burst_seconds) if requests_per_minute > 0 else None
+        self._tokens = _Bucket(tokens_per_minute, burst_seconds) if tokens_per_minute > 0 else None
+        self._lock = asyncio.Lock()
+        self._scale = 1.0
+        self._blocked_until = 0.0
+        self._backoff = 0.0
+        self.stats = {"acquired": 0, "throttled": 0, "wait_seconds": 0.0, "rate_limited": 0}
+
+    async def acquire(self, tokens: int = 0) -> None:
+        """Wait until a request estimated at `tokens` input tokens may be sent"""
+        async with self._lock:
+            waited = 0.0
+            while True:
+                now = time.monotonic()
+                wait = max(0.0, self._blocked_until - now)
+                for bucket, amount in ((self._requests, 1), (self._tokens, tokens)):
+                    if bucket is not None:
+                        bucket.refill(now, self._scale)
+                        wait = max(wait, bucket.wait_time(amount, self._scale))
+
+                if wait <= 0:
+                    break
+
+                await asyncio.sleep(wait)
+                waited += wait
+
+            if self._requests is not None:
+                self._requests.level -= 1
+            if self._tokens is not None:
+                self._tokens.level -= tokens
+
+            self.stats["acquired"] += 1
+            if waited:
+                self.stats["throttled"] += 1
+                self.stats["wait_seconds"] += waited
+
+    def consume_tokens(self, tokens: int) -> None:
+        """Charge tokens only known after the call (e.g. output tokens)"""
+        if self._tokens is not None and tokens > 0:
+            self._tokens.refill(time.monotonic(), self._scale)
+            self._tokens.level -= tokens
+
+    def on_success(self) -> None:
+        """Additively restore the rate after a successful call"""
+        self._scale = min(1.0, self._scale + self.RECOVERY_STEP)
+        self._backoff = 0.0
+
+    def on_rate_limited(self, retry_after: Optional[float] = None) -> None:
+        """Halve the rate and pause new requests after a 429"""
+        self.stats["rate_limited"] += 1
+        self._scale = max(self.MIN_SCALE, self._scale / 2)
+        self._backoff = min(60.0, max(2.0, self._backoff * 2))
+        delay = retry_after if retry_after is not None else self._backoff
+        self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+        print(f"[RATE LIMIT] 429 from LLM - backing off {delay:.1f}s, rate at {self._scale:.0%}")
+
+    def estimated_wait(self, requests: int = 1) -> float:
+        """Seconds until `requests` more calls could be admitted (ignores the TPM budget)"""
+        now = time.monotonic()
+        wait = max(0.0, self._blocked_until - now)
+        if self._requests is not None:
+            bucket = self._requests
+            level = min(bucket.capacity, bucket.level + (now - bucket.updated) * bucket.rate * self._scale)
+            wait = max(wait, (requests - level) / (bucket.rate * self._scale))
+        return wait
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "wait_seconds": round(self.stats["wait_seconds"], 2),
+            "rate_scale": round(self._scale, 2),
+        }
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """
+    Check if an API error is a 429 / quota exhausted response
+
+    Decided by the exception type or its HTTP status only; message text is
+    not trusted, since any error may quote a 429 or mention a quota.
+    """
+    if type(error).__name__ in ("ResourceExhausted", "TooManyRequests", "RateLimitError"):
+        return True
+    return getattr(error, "code", None) == 429 or getattr(error, "status_code", None) == 429
+
+
+def parse_retry_after(error: Exception) -> Optional[float]:
+    """Extract the server-suggested retry delay (seconds) from an API error"""
+    match = re.search(r"retry(?:_delay)?\s*(?:in|\{)\s*(?:seconds:\s*)?([\d.]+)", str(error), re.IGNORECASE)
+    if match:
+        try:
+            return float(match.group(1))
+        except ValueError:
+            return None
+    return None
@@ -3,8 +3,8 @@ AI-Based Section Mapper
 Maps course topics to textbook sections using Claude AI for intelligent matching
 """
 
-import asyncio
 from typing import List, Dict, Optional
+from app.services.llm_metrics import llm_caller
 from app.services.llm_service import get_llm_service
 
 
@@ -38,32 +38,42 @@ class SectionMapper:
         if prerequisites:
             print(f"[SECTION MAPPER] Using prerequisites for context: {', '.join(prerequisites)}")
 
-        topic_mappings = {}
-
-        for i, topic in enumerate(topics):
-            topic_id = topic['id']
-            topic_name = topic['name']
-
-            print(f"  → Mapping: {topic_name}")
-
-            # Get AI to select relevant sections
-            relevant_sections = await self._find_relevant_sections(
-                topic_name=topic_name,
+        # One prompt per topic with keyword matches; LLMService packs them into
+        # as few calls as fit the token budget, paced by its shared rate limiter
+        prompts = {}
+        for topic in topics:
+            prompt = self._build_mapping_prompt(
+                topic_name=topic['name'],
                 sections=textbook_sections,
                 textbook_title=textbook_title,
                 prerequisites=prerequisites
             )
+            if prompt:
+                prompts[topic['id']] = prompt
+
+        with llm_caller("section_mapper"):
+            ai_results = await self.llm.generate_json_many(
+                prompts,
+                max_tokens_per_item=1024,
+                validate=lambda r: isinstance(r, dict) and isinstance(r.get('relevant_sections'), list)
+            )
+
+        results = [
+            self._sections_from_result(ai_results.get(topic['id']), textbook_sections)
+            for topic in topics
+        ]
+
+        topic_mappings = {}
+
+        for topic, relevant_sections in zip(topics, results):
+            print(f"  → Mapped: {topic['name']}")
 
             if relevant_sections:
-                topic_mappings[topic_id] = relevant_sections
+                topic_mappings[topic['id']] = relevant_sections
                 print(f"    ✓ Found {len(relevant_sections)} relevant section(s)")
             else:
                 print(f"    ⚠ No relevant sections found")
 
-            # Rate limiting: wait 2 seconds between AI calls to avoid rate limits
-            if i < len(topics) - 1:  # Don't wait after last topic
-                await asyncio.sleep(2)
-
         return topic_mappings
 
     def _keyword_filter(self, topic_name: str, sections: List[Dict], top_k: int = 50) -> List[Dict]:
@@ -123,14 +133,40 @@ class SectionMapper:
         Returns:
             List of relevant section dicts with page ranges
         """
+        prompt = self._build_mapping_prompt(topic_name, sections, textbook_title, prerequisites)
+        if not prompt:
+            return []
+
+        try:
+            with llm_caller("section_mapper"):
+                result = await self.llm.generate_json(prompt, max_tokens=1024)
+            return self._sections_from_result(result, sections, max_sections)
+
+        except Exception as e:
+            print(f"    ✗ Error in AI mapping: {e}")
+            return []
+
+    def _build_mapping_prompt(
+        self,
+        topic_name: str,
+        sections: List[Dict],
+        textbook_title: str,
+        prerequisites: List[str] = None
+    ) -> Optional[str]:
+        """
+        Build the section-selection prompt for one topic
+
+        Returns:
+            Prompt string, or None if no sections pass the keyword pre-filter
+        """
         # First pass: keyword filtering to reduce token usage
         filtered = self._keyword_filter(topic_name, sections, top_k=50)
 
         if not filtered:
-            print(f"    ⚠ No keyword matches found")
-            return []
+            print(f"    ⚠ No keyword matches found for {topic_name}")
+            return None
 
-        print(f"    → Pre-filtered to {len(filtered)} candidate sections")
+        print(f"    → Pre-filtered to {len(filtered)} candidate sections for {topic_name}")
 
         # Format filtered sections for AI
         section_list = []
@@ -151,7 +187,7 @@ class SectionMapper:
             context += f'\nCourse Prerequisites: {", ".join(prerequisites)}'
             context += '\nNote: This topic builds on these prerequisites.'
 
-        prompt = f"""You are helping map a course topic to relevant sections in a textbook.
+        return f"""You are helping map a course topic to relevant sections in a textbook.
 
 {context}
 
@@ -176,24 +212,29 @@ Return ONLY this JSON structure (no other text):
 }}
 """
 
-        try:
-            result = await self.llm.generate_json(prompt, max_tokens=1024)
+    def _sections_from_result(
+        self,
+        result: Optional[Dict],
+        sections: List[Dict],
+        max_sections: int = 3
+    ) -> List[Dict]:
+        """Convert AI section picks back to full section objects"""
+        if not result:
+            return []
 
-            # Convert AI results back to full section objects
-            relevant_sections = []
-            for match in result.get('relevant_sections', [])[:max_sections]:
+        relevant_sections = []
+        for match in result.get('relevant_sections', [])[:max_sections]:
+            try:
                 idx = match['index']
                 if idx < len(sections):
                     section = sections[idx].copy()
                     section['relevance'] = match.get('relevance', '')
                     section['confidence'] = match.get('confidence', 'medium')
                     relevant_sections.append(section)
+            except (KeyError, TypeError) as e:
+                print(f"    ⚠ Skipping malformed section match: {e}")
 
-            return relevant_sections
-
-        except Exception as e:
-            print(f"    ✗ Error in AI mapping: {e}")
-            return []
+        return relevant_sections
 
     def _format_sections_for_prompt(self, sections: List[Dict]) -> str:
         """Format sections as a numbered list for the AI prompt"""
@@ -3,73 +3,60 @@ Textbook Parser Service
 Register textbooks and extract structure (ToC, chapters, sections) with caching
 """
 
+import asyncio
 from typing import List, Dict, Optional
 from uuid import uuid4
 from pathlib import Path
-import json
-import hashlib
 from datetime import datetime
 
 from app.models.resource import Resource, ResourceType
-from app.utils.pdf_utils import parse_textbook_structure, get_pdf_metadata, extract_text_from_pdf
+from app.utils.pdf_utils import analyze_textbook
+from app.config import settings
+from app.utils.cache import file_sha256, get_cache, make_key
 from app.database import db
 
-# Cache directory for textbook structures
-CACHE_DIR = Path(__file__).parent.parent.parent / ".cache" / "textbooks"
-CACHE_DIR.mkdir(parents=True, exist_ok=True)
-
 
 class TextbookParser:
     """Service for parsing and registering textbooks"""
 
-    def _get_cache_key(self, pdf_path: str) -> str:
-        """Generate cache key from PDF path and file modification time"""
-        path_obj = Path(pdf_path)
-        if not path_obj.exists():
+    def __init__(self):
+        self.cache = get_cache().namespace("textbooks") if settings.cache_enabled else None
+
+    def _get_cache_key(self, pdf_path: str, content_hash: Optional[str] = None) -> Optional[str]:
+        """Generate cache key from the PDF's content, so copies of one PDF share an entry"""
+        if not Path(pdf_path).exists():
             return None
 
-        # Use file path + modification time for cache key
-        mtime = path_obj.stat().st_mtime
-        key_str = f"{pdf_path}_{mtime}"
-        return hashlib.md5(key_str.encode()).hexdigest()[:16]
+        return make_key("content", content_hash or file_sha256(pdf_path))
 
-    def _read_cache(self, pdf_path: str) -> Optional[Dict]:
+    def _read_cache(self, cache_key: Optional[str]) -> Optional[Dict]:
         """Read cached textbook structure"""
-        cache_key = self._get_cache_key(pdf_path)
-        if not cache_key:
-            return None
-
-        cache_file = CACHE_DIR / f"{cache_key}.json"
-        if not cache_file.exists():
+        if not cache_key or self.cache is None:
             return None
 
         try:
-            with open(cache_file, 'r') as f:
-                data = json.load(f)
-            print(f"[TEXTBOOK CACHE HIT] Using cached structure for textbook")
+            data = self.cache.get(cache_key)
+            if data:
+                print(f"[TEXTBOOK CACHE HIT] Using cached structure for textbook")
             return data
         except Exception as e:
             print(f"[TEXTBOOK CACHE ERROR] Failed to read: {e}")
             return None
 
-    def _write_cache(self, pdf_path: str, textbook_data: Dict):
+    def _write_cache(self, cache_key: Optional[str], textbook_data: Dict):
         """Write textbook structure to cache"""
-        cache_key = self._get_cache_key(pdf_path)
-        if not cache_key:
+        if not cache_key or self.cache is None:
             return
 
-        cache_file = CACHE_DIR / f"{cache_key}.json"
-
         try:
             # Add cache metadata
             cache_data = {
                 **textbook_data,
                 'cached_at': datetime.now().isoformat(),
-                'cache_version': '1.0'
+                'cache_version': '2.0'
             }
 
-            with open(cache_file, 'w') as f:
-                json.dump(cache_data, f, indent=2)
+            self.cache.set(cache_key, cache_data)
 
             print(f"[TEXTBOOK CACHE WRITE] Cached structure with {len(textbook_data['sections'])} sections")
         except Exception as e:
@@ -79,7 +66,8 @@ class TextbookParser:
         self,
         pdf_path: str,
         title: Optional[str] = None,
-        subject: Optional[str] = None
+        subject: Optional[str] = None,
+        content_hash: Optional[str] = None
     ) -> Dict:
         """
         Register a new textbook in the library with caching
@@ -88,6 +76,7 @@ class TextbookParser:
             pdf_path: Path to textbook PDF
             title: Optional title (defaults to filename)
             subject: Optional subject (e.g., "Calculus")
+            content_hash: SHA-256 of the PDF, if already known (computed otherwise)
 
         Returns:
             Dict with textbook info and parsed structure
@@ -95,8 +84,11 @@ class TextbookParser:
         print(f"\n[TEXTBOOK PARSER] Registering textbook: {pdf_path}")
 
         # Check cache first
-        cached_data = self._read_cache(pdf_path)
+        cache_key = self._get_cache_key(pdf_path, content_hash)
+        cached_data = self._read_cache(cache_key)
         if cached_data:
+            # The same content may have been registered from another path
+            cached_data['file_path'] = pdf_path
             # Update title if provided
             if title:
                 cached_data['title'] = title
@@ -109,37 +101,57 @@ class TextbookParser:
         # Not in cache - parse the textbook
         print(f"[TEXTBOOK PARSER] Cache miss - parsing textbook structure...")
 
-        # Extract metadata
-        metadata = get_pdf_metadata(pdf_path)
+        # Metadata and structure in one pass over the PDF (the slow part - 716 sections);
+        # in a thread so parsing does not block the event loop
+        analysis = await asyncio.to_thread(analyze_textbook, pdf_path)
 
         # Use provided title or fallback to PDF title/filename
-        final_title = title or metadata['title']
-
-        # Parse structure (this is the slow part - 716 sections)
-        structure = parse_textbook_structure(pdf_path)
+        final_title = title or analysis['title']
 
         # Prepare textbook data
         textbook_data = {
             'id': str(uuid4()),
             'title': final_title,
             'file_path': pdf_path,
-            'total_pages': metadata['total_pages'],
-            'file_size_mb': metadata['file_size_mb'],
+            'total_pages': analysis['total_pages'],
+            'file_size_mb': analysis['file_size_mb'],
             'parsed': True,
-            'parsing_method': structure['parsing_method'],
-            'sections': structure['sections']
+            'parsing_method': analysis['parsing_method'],
+            'sections': analysis['sections']
         }
 
         # Cache the structure
-        self._write_cache(pdf_path, textbook_data)
+        self._write_cache(cache_key, textbook_data)
 
         print(f"\n[TEXTBOOK PARSER] ✓ Registered: {final_title}")
-        print(f"[TEXTBOOK PARSER]   Pages: {metadata['total_pages']}")
-        print(f"[TEXTBOOK PARSER]   Sections: {len(structure['sections'])}")
-        print(f"[TEXTBOOK PARSER]   Method: {structure['parsing_method']}")
+        print(f"[TEXTBOOK PARSER]   Pages: {analysis['total_pages']}")
+        print(f"[TEXTBOOK PARSER]   Sections: {len(analysis['sections'])}")
+        print(f"[TEXTBOOK PARSER]   Method: {analysis['parsing_method']}")
 
         return textbook_data
 
+    async def parse_textbook(
+        self,
+        pdf_path: str,
+        title: Optional[str] = None,
+        content_hash: Optional[str] = None
+    ) -> Dict:
+        """
+        Parse an uploaded textbook into chapters with their sections
+
+        Args:
+            pdf_path: Path to textbook PDF
+            title: Optional title (defaults to the PDF title or filename)
+            content_hash: SHA-256 of the PDF, if already known
+
+        Returns:
+            Textbook info from register_textbook plus 'chapters': each top-level
+            section (number, title, page_start, page_end) with its subsections
+            under 'sections'
+        """
+        textbook = await self.register_textbook(pdf_path, title, content_hash=content_hash)
+        return {**textbook, 'chapters': _group_chapters(textbook['sections'])}
+
     def get_section_by_keywords(
         self,
         textbook: Dict,
@@ -182,6 +194,23 @@ class TextbookParser:
         return scored_sections[:top_k]
 
 
+def _group_chapters(sections: List[Dict]) -> List[Dict]:
+    """Nest deeper sections under the top-level section before them"""
+    chapters = []
+    for section in sections:
+        entry = {
+            'number': section['section_number'],
+            'title': section['title'],
+            'page_start': section['page_start'],
+            'page_end': section['page_end'],
+        }
+        if section.get('level', 1) > 1 and chapters:
+            chapters[-1]['sections'].append(entry)
+        else:
+            chapters.append({**entry, 'sections': []})
+    return chapters
+
+
 # Global instance
 _textbook_parser: Optional[TextbookParser] = None
 
@@ -6,6 +6,7 @@ Maps course topics to textbook sections
 from typing import List, Dict, Optional
 
 from app.models.topic import Topic
+from app.services.llm_metrics import llm_caller
 from app.services.llm_service import get_llm_service
 from app.utils.pdf_utils import _extract_keywords
 
@@ -34,10 +35,10 @@ class TopicMapper:
         print(f"\n[TOPIC MAPPER] Mapping {len(topics)} topics to textbook sections...")
 
         mappings = {}
+        candidates = {}
+        prompts = {}
 
         for topic in topics:
-            print(f"  → Mapping: {topic.name}")
-
             # Extract keywords from topic name
             topic_keywords = _extract_keywords(topic.name)
 
@@ -48,17 +49,30 @@ class TopicMapper:
             )
 
             if matches:
-                # Use Claude to pick the best match(es)
-                best_matches = await self._refine_matches_with_llm(
-                    topic=topic,
-                    candidate_sections=matches[:5]  # Top 5 candidates
-                )
-                mappings[topic.id] = best_matches
-                print(f"    ✓ Mapped to {len(best_matches)} section(s)")
+                candidates[topic.id] = matches[:5]  # Top 5 candidates
+                prompts[topic.id] = self._refine_prompt(topic, candidates[topic.id])
             else:
+                print(f"  → Mapping: {topic.name}")
                 print(f"    ⚠ No matching sections found")
                 mappings[topic.id] = []
 
+        # Use the LLM to pick the best match(es) for all topics in batched calls
+        with llm_caller("topic_mapper"):
+            results = await self.llm.generate_json_many(
+                prompts,
+                max_tokens_per_item=512,
+                validate=lambda r: isinstance(r, dict) and isinstance(r.get('relevant_sections'), list)
+            )
+
+        for topic in topics:
+            if topic.id not in candidates:
+                continue
+
+            print(f"  → Mapping: {topic.name}")
+            best_matches = self._select_candidates(results.get(topic.id), candidates[topic.id])
+            mappings[topic.id] = best_matches
+            print(f"    ✓ Mapped to {len(best_matches)} section(s)")
+
         return mappings
 
     def _find_matching_sections(
@@ -110,13 +124,28 @@ class TopicMapper:
         if not candidate_sections:
             return []
 
+        try:
+            with llm_caller("topic_mapper"):
+                result = await self.llm.generate_json(
+                    self._refine_prompt(topic, candidate_sections),
+                    max_tokens=512
+                )
+            return self._select_candidates(result, candidate_sections)
+
+        except Exception as e:
+            print(f"    [TOPIC MAPPER] LLM refinement failed: {e}")
+            # Fallback: return top candidate
+            return [candidate_sections[0]] if candidate_sections else []
+
+    def _refine_prompt(self, topic: Topic, candidate_sections: List[Dict]) -> str:
+        """Build the prompt asking the LLM to pick the best candidate section(s)"""
         # Prepare section summaries for Claude
         sections_summary = "\n".join([
             f"{i+1}. Section {s.get('section_number', '?')}: {s['title']} (pages {s['page_start']}-{s.get('page_end', '?')})"
             for i, s in enumerate(candidate_sections)
         ])
 
-        prompt = f"""Given the course topic "{topic.name}", which textbook section(s) are most relevant?
+        return f"""Given the course topic "{topic.name}", which textbook section(s) are most relevant?
 
 Candidate sections:
 {sections_summary}
@@ -129,23 +158,21 @@ Return ONLY a JSON array of section numbers (1-based index) that are relevant:
 
 Pick 1-2 most relevant sections. If none are truly relevant, return empty array."""
 
-        try:
-            result = await self.llm.generate_json(prompt, max_tokens=512)
-
-            selected_indices = result.get('relevant_sections', [])
+    def _select_candidates(self, result: Optional[Dict], candidate_sections: List[Dict]) -> List[Dict]:
+        """
+        Map the LLM's 1-based picks back to candidate sections
 
-            # Return selected sections
-            selected = []
-            for idx in selected_indices:
-                if 1 <= idx <= len(candidate_sections):
-                    selected.append(candidate_sections[idx - 1])
+        Falls back to the top candidate when the LLM gave no usable answer.
+        """
+        if not result:
+            return [candidate_sections[0]] if candidate_sections else []
 
-            return selected
+        selected = []
+        for idx in result.get('relevant_sections', []):
+            if isinstance(idx, int) and 1 <= idx <= len(candidate_sections):
+                selected.append(candidate_sections[idx - 1])
 
-        except Exception as e:
-            print(f"    [TOPIC MAPPER] LLM refinement failed: {e}")
-            # Fallback: return top candidate
-            return [candidate_sections[0]] if candidate_sections else []
+        return selected
 
 
 # Global instance
@@ -9,6 +9,7 @@ import re
 
 from app.models.topic import Topic, ParseTopicsRequest, ParseTopicsResponse
 from app.models.course import CourseLevel
+from app.services.llm_metrics import llm_caller
 from app.services.llm_service import get_llm_service
 from app.utils.prompts import topic_extraction_prompt, fallback_topics_from_headings
 from app.database import db
@@ -52,21 +53,11 @@ class TopicParserService:
         )
 
         try:
-            # Call Claude LLM for structured JSON response
-            topics_data = await self.llm.generate_json(prompt, max_tokens=2048)
-
-            # Validate and convert to Topic objects
-            if not isinstance(topics_data, list):
-                raise ValueError("LLM response is not a list")
-
-            topics = []
-            for item in topics_data:
-                try:
-                    topic = Topic(**item)
-                    topics.append(topic)
-                except Exception as e:
-                    print(f"[TOPIC PARSER WARNING] Skipping invalid topic: {e}")
-                    continue
+            # Schema-constrained call; invalid topics are dropped during validation
+            with llm_caller("topic_parser"):
+                topics = await self.llm.generate_structured(
+                    prompt, List[Topic], max_tokens=2048, template="topic_extraction"
+                )
 
             if not topics:
                 raise ValueError("No valid prerequisite topics extracted")
@@ -0,0 +1,351 @@
+"""
+Cache
+Namespaced key/value cache: in-memory LRU tier in front of a SQLite (WAL) store
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from app.config import settings
+
+# Memory hits are written back to the disk tier's accessed_at in batches,
+# at most this often (or sooner once this many keys are pending)
+TOUCH_FLUSH_SECONDS = 30.0
+TOUCH_FLUSH_MAX_KEYS = 1000
+
+
+class Cache:
+    """
+    Shared cache for LLM responses, textbook structures and resource lookups
+
+    Values are JSON-serialized and stored in one SQLite file (WAL mode, so
+    readers never block the writer). A bounded in-memory LRU sits in front so
+    hot lookups skip the filesystem. The memory tier keeps the serialized
+    form, so callers always get their own copy to mutate. Both tiers are
+    limited in bytes; the disk tier evicts least-recently-used entries once
+    it grows past its limit, counting memory hits, which are written back
+    in batches. Entries may carry a TTL, after which they are
+    treated as missing.
+    """
+
+    def __init__(self, path: Path, max_bytes: int, memory_max_bytes: int):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.memory_max_bytes = memory_max_bytes
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                expires_at REAL,
+                accessed_at REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_accessed ON entries(accessed_at)")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS locks (
+                name TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+            """
+        )
+
+        # (namespace, key) -> (serialized value, size, expires_at)
+        self._memory: "OrderedDict[Tuple[str, str], Tuple[str, int, Optional[float]]]" = OrderedDict()
+        self._memory_bytes = 0
+        # (namespace, key) -> time of the last memory hit not yet written to disk
+        self._touched: Dict[Tuple[str, str], float] = {}
+        self._touched_flushed_at = time.monotonic()
+        self._disk_bytes = self._query_disk_bytes()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+        self.purge_expired()
+
+    def namespace(self, name: str, ttl: Optional[float] = None) -> "CacheNamespace":
+        """Get a view of the cache bound to one namespace and default TTL (seconds)"""
+        return CacheNamespace(self, name, ttl)
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        """Return the cached value, or None if missing or expired"""
+        now = time.time()
+        mem_key = (namespace, key)
+
+        with self._lock:
+            hit = self._memory.get(mem_key)
+            if hit is not None:
+                raw, size, expires_at = hit
+                if expires_at is None or expires_at > now:
+                    self._memory.move_to_end(mem_key)
+                    self._touch(mem_key, now)
+                    self.stats["memory_hits"] += 1
+                    return json.loads(raw)
+                self._drop_memory(mem_key)
+
+            row = self._conn.execute(
+                "SELECT value, size, expires_at FROM entries WHERE namespace = ? AND key = ?",
+                (namespace, key),
+            ).fetchone()
+
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+
+            raw, size, expires_at = row
+            if expires_at is not None and expires_at <= now:
+                self._delete_row(namespace, key, size)
+                self.stats["misses"] += 1
+                return None
+
+            self._conn.execute(
+                "UPDATE entries SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                (now, namespace, key),
+            )
+            self._remember(mem_key, raw, size, expires_at)
+            self.stats["disk_hits"] += 1
+            return json.loads(raw)
+
+    def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """Store a JSON-serializable value, optionally expiring after ttl seconds"""
+        raw = json.dumps(value)
+        size = len(raw.encode())
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+
+        with self._lock:
+            old = self._conn.execute(
+                "SELECT size FROM entries WHERE namespace = ? AND key = ?",
+                (namespace, key),
+            ).fetchone()
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO entries (namespace, key, value, size, expires_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (namespace, key, raw, size, expires_at, now),
+            )
+            self._disk_bytes += size - (old[0] if old else 0)
+            self._remember((namespace, key), raw, size, expires_at)
+            self.stats["writes"] += 1
+
+            if self._disk_bytes > self.max_bytes:
+                self._evict_disk()
+
+    def delete(self, namespace: str, key: str) -> None:
+        """Remove one entry from both tiers"""
+        with self._lock:
+            self._drop_memory((namespace, key))
+            row = self._conn.execute(
+                "SELECT size FROM entries WHERE namespace = ? AND key = ?",
+                (namespace, key),
+            ).fetchone()
+            if row:
+                self._delete_row(namespace, key, row[0])
+
+    def clear(self, namespace: Optional[str] = None) -> None:
+        """Remove every entry, or every entry in one namespace"""
+        with self._lock:
+            if namespace is None:
+                self._conn.execute("DELETE FROM entries")
+                self._memory.clear()
+                self._memory_bytes = 0
+            else:
+                self._conn.execute("DELETE FROM entries WHERE namespace = ?", (namespace,))
+                for mem_key in [k for k in self._memory if k[0] == namespace]:
+                    self._drop_memory(mem_key)
+            self._disk_bytes = self._query_disk_bytes()
+
+    def items(self, namespace: str) -> Iterator[Tuple[str, Any]]:
+        """Iterate over (key, value) pairs stored on disk for a namespace"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, value FROM entries WHERE namespace = ?", (namespace,)
+            ).fetchall()
+        for key, raw in rows:
+            try:
+                yield key, json.loads(raw)
+            except ValueError:
+                continue
+
+    def purge_expired(self) -> int:
+        """Delete all expired entries; returns the number removed"""
+        with self._lock:
+            removed = self._conn.execute(
+                "DELETE FROM entries WHERE expires_at IS NOT NULL AND expires_at <= ?",
+                (time.time(),),
+            ).rowcount
+            if removed:
+                self._disk_bytes = self._query_disk_bytes()
+        return removed
+
+    def try_lock(self, name: str, owner: str, ttl: float) -> bool:
+        """
+        Try to take a named lock shared by every process using this cache file
+
+        The lock expires after ttl seconds so a crashed holder cannot block
+        others forever. Re-acquiring a lock you already own refreshes it.
+
+        Returns:
+            True if `owner` now holds the lock
+        """
+        now = time.time()
+        with self._lock:
+            acquired = self._conn.execute(
+                "INSERT OR IGNORE INTO locks (name, owner, expires_at) VALUES (?, ?, ?)",
+                (name, owner, now + ttl),
+            ).rowcount
+            if not acquired:
+                # Take over an expired lock, or refresh our own
+                acquired = self._conn.execute(
+                    "UPDATE locks SET owner = ?, expires_at = ? WHERE name = ? AND (expires_at <= ? OR owner = ?)",
+                    (owner, now + ttl, name, now, owner),
+                ).rowcount
+        return bool(acquired)
+
+    def release_lock(self, name: str, owner: str) -> None:
+        """Release a lock taken with try_lock (no-op if someone else holds it)"""
+        with self._lock:
+            self._conn.execute("DELETE FROM locks WHERE name = ? AND owner = ?", (name, owner))
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+            "disk_bytes": self._disk_bytes,
+        }
+
+    # Internal helpers (call with self._lock held)
+
+    def _remember(self, mem_key: Tuple[str, str], raw: str, size: int, expires_at: Optional[float]) -> None:
+        self._drop_memory(mem_key)
+        if size > self.memory_max_bytes:
+            return
+        self._memory[mem_key] = (raw, size, expires_at)
+        self._memory_bytes += size
+        while self._memory_bytes > self.memory_max_bytes:
+            _, (_, old_size, _) = self._memory.popitem(last=False)
+            self._memory_bytes -= old_size
+
+    def _touch(self, mem_key: Tuple[str, str], now: float) -> None:
+        """Note a memory hit, writing pending hits to disk once enough accumulate"""
+        self._touched[mem_key] = now
+        if (
+            len(self._touched) >= TOUCH_FLUSH_MAX_KEYS
+            or time.monotonic() - self._touched_flushed_at >= TOUCH_FLUSH_SECONDS
+        ):
+            self._flush_touched()
+
+    def _flush_touched(self) -> None:
+        """Write pending memory-hit times to accessed_at, so disk eviction sees hot keys"""
+        self._touched_flushed_at = time.monotonic()
+        if not self._touched:
+            return
+        self._conn.executemany(
+            "UPDATE entries SET accessed_at = MAX(accessed_at, ?) WHERE namespace = ? AND key = ?",
+            [(accessed_at, namespace, key) for (namespace, key), accessed_at in self._touched.items()],
+        )
+        self._touched.clear()
+
+    def _drop_memory(self, mem_key: Tuple[str, str]) -> None:
+        old = self._memory.pop(mem_key, None)
+        if old is not None:
+            self._memory_bytes -= old[1]
+
+    def _delete_row(self, namespace: str, key: str, size: int) -> None:
+        self._conn.execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+        self._drop_memory((namespace, key))
+        self._disk_bytes -= size
+
+    def _query_disk_bytes(self) -> int:
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def _evict_disk(self) -> None:
+        """Evict least-recently-used entries until the store is back under 90% of its limit"""
+        # Another process may have written or evicted since our last count
+        self._disk_bytes = self._query_disk_bytes()
+        target = int(self.max_bytes * 0.9)
+        if self._disk_bytes <= self.max_bytes:
+            return
+
+        self._flush_touched()
+
+        rows = self._conn.execute(
+            "SELECT namespace, key, size FROM entries ORDER BY accessed_at ASC"
+        ).fetchall()
+        for namespace, key, size in rows:
+            if self._disk_bytes <= target:
+                break
+            self._delete_row(namespace, key, size)
+            self.stats["evictions"] += 1
+
+
+class CacheNamespace:
+    """A Cache view bound to one namespace, with an optional default TTL"""
+
+    def __init__(self, cache: Cache, name: str, ttl: Optional[float] = None):
+        self.cache = cache
+        self.name = name
+        self.ttl = ttl
+
+    def get(self, key: str) -> Optional[Any]:
+        return self.cache.get(self.name, key)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self.cache.set(self.name, key, value, ttl if ttl is not None else self.ttl)
+
+    def delete(self, key: str) -> None:
+        self.cache.delete(self.name, key)
+
+    def clear(self) -> None:
+        self.cache.clear(self.name)
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        return self.cache.items(self.name)
+
+
+def make_key(*parts: Any) -> str:
+    """Build a full-length SHA-256 cache key from arbitrary parts"""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """SHA-256 of a file's content, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Global instance
+_cache: Optional[Cache] = None
+
+
+def get_cache() -> Cache:
+    """Get or create the global cache instance"""
+    global _cache
+    if _cache is None:
+        _cache = Cache(
+            path=settings.cache_dir / "cache.sqlite3",
+            max_bytes=settings.cache_max_mb * 1024 * 1024,
+            memory_max_bytes=settings.cache_memory_mb * 1024 * 1024,
+        )
+    return _cache
@@ -0,0 +1,79 @@
+"""
+Request Deadlines
+Request-scoped time budgets that flow from routers down to LLM calls
+"""
+
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Optional
+
+# Absolute time.monotonic() by which the current request must finish
+_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """Raised when the current request's time budget has run out"""
+
+
+@contextmanager
+def deadline(seconds: Optional[float]):
+    """
+    Give the work inside this block at most `seconds` to finish
+
+    Nested deadlines can only shorten the budget, never extend it. None
+    leaves the current deadline (if any) unchanged.
+    """
+    if seconds is None:
+        yield
+        return
+
+    expires_at = time.monotonic() + seconds
+    current = _deadline.get()
+    if current is not None:
+        expires_at = min(current, expires_at)
+
+    token = _deadline.set(expires_at)
+    try:
+        yield
+    finally:
+        try:
+            _deadline.reset(token)
+        except ValueError:
+            # Async generators may resume in a different context; nothing to undo there
+            pass
+
+
+def time_remaining() -> Optional[float]:
+    """Seconds left before the current deadline (None if there is no deadline)"""
+    expires_at = _deadline.get()
+    if expires_at is None:
+        return None
+    return max(0.0, expires_at - time.monotonic())
+
+
+def deadline_expired() -> bool:
+    remaining = time_remaining()
+    return remaining is not None and remaining <= 0
+
+
+async def run_within_deadline(awaitable: Awaitable[Any]) -> Any:
+    """
+    Await `awaitable`, cancelling it when the current deadline passes
+
+    Raises:
+        DeadlineExceeded: If the deadline passed before or while waiting
+    """
+    remaining = time_remaining()
+    if remaining is None:
+        return await awaitable
+    if remaining <= 0:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise DeadlineExceeded("Request deadline exceeded")
+
+    try:
+        return await asyncio.wait_for(awaitable, timeout=remaining)
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded("Request deadline exceeded") from None
@@ -0,0 +1,116 @@
+"""
+Client Disconnect Handling
+Cancel request work (and the LLM calls under it) when the HTTP client goes away
+"""
+
+import asyncio
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Awaitable
+
+from fastapi import Request
+
+# Non-standard status (nginx convention) logged when the client closed the request
+CLIENT_CLOSED_REQUEST = 499
+
+
+class ClientDisconnected(Exception):
+    """Raised when the HTTP client disconnected before the work finished"""
+
+
+async def cancel_on_disconnect(request: Request, awaitable: Awaitable[Any], poll_interval: float = 0.5) -> Any:
+    """
+    Await `awaitable` while watching for the client to disconnect
+
+    The work runs as a task (inheriting the request's context variables) and
+    is cancelled as soon as the client goes away. Cancellation propagates
+    down through the services into LLMService, which drops LLM calls no
+    other request is waiting on.
+
+    Args:
+        request: The incoming request to watch
+        awaitable: The work to run
+        poll_interval: Seconds between disconnect checks
+
+    Returns:
+        The result of `awaitable`
+
+    Raises:
+        ClientDisconnected: If the client disconnected first
+    """
+    work = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({work}, timeout=poll_interval)
+            if done:
+                return work.result()
+            if await request.is_disconnected():
+                print(f"[DISCONNECT] Client left {request.method} {request.url.path} - cancelling work")
+                work.cancel()
+                await asyncio.gather(work, return_exceptions=True)
+                raise ClientDisconnected(f"Client disconnected from {request.url.path}")
+    finally:
+        if not work.done():
+            work.cancel()
+
+
+async def stream_until_disconnect(
+    request: Request,
+    items: AsyncIterator[Any],
+    poll_interval: float = 0.5,
+) -> AsyncIterator[Any]:
+    """
+    Re-yield `items` while watching for the client to disconnect
+
+    The streaming counterpart of cancel_on_disconnect: `items` is consumed
+    by one task (inheriting the request's context variables) that hands
+    each item over as it arrives. When the client goes away, that task is
+    cancelled, even while it is waiting on an LLM call between items, and
+    `items` is closed.
+
+    Args:
+        request: The incoming request to watch
+        items: The async iterator producing the response items
+        poll_interval: Seconds between disconnect checks
+
+    Yields:
+        The items of `items`, in order
+
+    Raises:
+        ClientDisconnected: If the client disconnected first
+    """
+    # One item in flight, so the producer never runs ahead of the client
+    queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+    done = object()
+
+    async def produce() -> None:
+        try:
+            async with aclosing(items):
+                async for item in items:
+                    await queue.put(item)
+        except Exception as e:
+            await queue.put(e)
+        else:
+            await queue.put(done)
+
+    producer = asyncio.ensure_future(produce())
+    try:
+        while True:
+            getter = asyncio.ensure_future(queue.get())
+            while not getter.done():
+                await asyncio.wait({getter}, timeout=poll_interval)
+                if not getter.done() and await request.is_disconnected():
+                    getter.cancel()
+                    print(f"[DISCONNECT] Client left {request.method} {request.url.path} - cancelling stream")
+                    producer.cancel()
+                    await asyncio.gather(producer, return_exceptions=True)
+                    raise ClientDisconnected(f"Client disconnected from {request.url.path}")
+            item = getter.result()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        if not producer.done():
+            producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
@@ -0,0 +1,183 @@
+"""
+Incremental JSON Parsing
+Bracket-matching helpers for pulling JSON out of (streamed) LLM output
+"""
+
+import json
+import re
+from typing import Any, Dict, Iterable, List, Optional
+
+
+class JsonArrayStreamParser:
+    """
+    Incrementally parse the elements of the first JSON array in a text stream
+
+    Feed chunks as they arrive; every element whose closing bracket has been
+    seen is returned immediately. The array must open at the start of a
+    line or right after a markdown fence, so brackets in a preamble ("Here
+    are [5] questions:") are not mistaken for it. Text before the opening
+    '[' is skipped, and everything after the closing ']' is ignored.
+
+    Example:
+        parser = JsonArrayStreamParser()
+        parser.feed('```json\\n[{"a": 1}, {"b"')  # -> [{"a": 1}]
+        parser.feed(': 2}]\\n```')                 # -> [{"b": 2}]
+    """
+
+    def __init__(self):
+        self.started = False
+        self.done = False
+        self.errors: List[str] = []
+        self._current: Optional[List[str]] = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        # Start of the current line while looking for the array (capped)
+        self._line = ""
+
+    def feed(self, chunk: str) -> List[Any]:
+        """Consume a chunk of text and return the elements completed by it"""
+        items: List[Any] = []
+
+        for ch in chunk:
+            if self.done:
+                break
+
+            if not self.started:
+                if ch == '\n':
+                    self._line = ""
+                elif ch == '[' and self._opens_array():
+                    self.started = True
+                elif len(self._line) < 16:
+                    self._line += ch
+                continue
+
+            if self._current is None:
+                # Between elements
+                if ch in ' \t\r\n,':
+                    continue
+                if ch == ']':
+                    self.done = True
+                    continue
+                self._current = []
+                self._depth = 0
+                self._in_string = False
+                self._escape = False
+
+            if self._in_string:
+                self._current.append(ch)
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._current.append(ch)
+            elif ch in '{[':
+                self._depth += 1
+                self._current.append(ch)
+            elif ch in '}]':
+                if self._depth == 0:
+                    # Closing bracket of the outer array after a scalar element
+                    self._finish(items)
+                    self.done = True
+                    continue
+                self._depth -= 1
+                self._current.append(ch)
+                if self._depth == 0:
+                    self._finish(items)
+            elif ch == ',' and self._depth == 0:
+                self._finish(items)
+            else:
+                self._current.append(ch)
+
+        return items
+
+    def _opens_array(self) -> bool:
+        """Whether a '[' here opens the array: nothing but whitespace or a fence before it on its line"""
+        head = self._line.strip()
+        if not head:
+            return True
+        # "```" or "```json"
+        return head.startswith("```") and (head[3:] == "" or head[3:].isalpha())
+
+    def _finish(self, items: List[Any]) -> None:
+        text = ''.join(self._current).strip()
+        self._current = None
+        if not text:
+            return
+        try:
+            items.append(json.loads(text))
+        except json.JSONDecodeError as e:
+            print(f"[JSON STREAM WARNING] Skipping malformed array element: {e}")
+            self.errors.append(text[:200])
+
+
+def extract_json_text(text: str) -> Optional[str]:
+    """
+    Return the first balanced JSON object/array in text, or None
+
+    Linear-time replacement for a greedy `(\\{[\\s\\S]*\\}|\\[[\\s\\S]*\\])`
+    regex: scans from the first '{' or '[' to its matching closing bracket,
+    ignoring brackets inside strings.
+    """
+    starts = [i for i in (text.find('{'), text.find('[')) if i != -1]
+    if not starts:
+        return None
+    start = min(starts)
+
+    depth = 0
+    in_string = False
+    escape = False
+
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == '\\':
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in '{[':
+            depth += 1
+        elif ch in '}]':
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+
+    return None
+
+
+def extract_json_entries(text: str, keys: Iterable[str]) -> Dict[str, Any]:
+    """
+    Salvage the well-formed `"key": value` entries of a broken JSON object
+
+    For a response that is one JSON object but does not parse as a whole
+    (a truncated or malformed entry somewhere), each key's value is decoded
+    on its own. Keys that are missing or whose value is malformed are left out.
+
+    Args:
+        text: The (invalid) JSON object text
+        keys: The keys to look for
+
+    Returns:
+        Dict of key -> decoded value for every entry that parsed
+    """
+    decoder = json.JSONDecoder()
+    entries = {}
+    for key in keys:
+        match = re.search(r'"' + re.escape(key) + r'"\s*:\s*', text)
+        if not match:
+            continue
+        try:
+            entries[key], _ = decoder.raw_decode(text, match.end())
+        except json.JSONDecodeError:
+            continue
+    return entries
@@ -0,0 +1,257 @@
+"""
+Page Store
+Per-textbook page text written once at ingestion, with random-access page-range reads
+"""
+
+import os
+import re
+import struct
+import threading
+import uuid
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.config import settings
+from app.utils.cache import file_sha256
+
+# Trailer at the end of every store file: magic + page count
+_MAGIC = b"RTPAGES1"
+_TRAILER = struct.Struct("<8sQ")
+_OFFSET = struct.Struct("<Q")
+
+_TEXTBOOK_ID = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+class PageStore:
+    """
+    Extracted page text of each textbook, stored once per PDF content hash
+
+    One file per content hash holds every page's text compressed on its
+    own, followed by an index of (pages + 1) byte offsets and a fixed-size
+    trailer:
+
+        [zlib page 1][zlib page 2]...[offset 0]...[offset n][magic, n]
+
+    Reading pages start..end therefore costs three small reads (trailer,
+    the range's slice of the index, one contiguous blob slice) no matter
+    how long the book is. A textbook id maps to its content hash
+    through a small ref file, so re-uploads of the same PDF share a store.
+    A bounded in-memory LRU of decompressed pages sits in front.
+    """
+
+    def __init__(self, root: Path, memory_max_bytes: int):
+        self.root = Path(root)
+        self.memory_max_bytes = memory_max_bytes
+
+        (self.root / "refs").mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        # (content hash, page number) -> page text
+        self._memory: "OrderedDict[Tuple[str, int], str]" = OrderedDict()
+        self._memory_bytes = 0
+        self.stats = {"memory_hits": 0, "disk_reads": 0, "stores_written": 0, "pages_written": 0}
+
+    def ingest(self, textbook_id: str, pdf_path: str, content_hash: Optional[str] = None) -> str:
+        """
+        Extract a textbook's pages into the store and link it to textbook_id
+
+        Extraction is skipped when a store for the same content already exists.
+
+        Args:
+            textbook_id: Textbook (resource) ID
+            pdf_path: Path to the textbook PDF
+            content_hash: SHA-256 of the PDF, if already known
+
+        Returns:
+            The content hash the textbook is stored under
+        """
+        from app.utils.pdf_utils import iter_page_texts
+
+        content_hash = content_hash or file_sha256(pdf_path)
+        if self.has(content_hash):
+            print(f"[PAGE STORE] Reusing stored pages for {content_hash[:12]}")
+        else:
+            pages = self.write(content_hash, iter_page_texts(pdf_path))
+            print(f"[PAGE STORE] ✓ Stored {pages} pages for {content_hash[:12]}")
+
+        self.link(textbook_id, content_hash)
+        return content_hash
+
+    def write(self, content_hash: str, pages: Iterable[str]) -> int:
+        """
+        Write the pages of one PDF (streamed, one page in memory at a time)
+
+        Args:
+            content_hash: SHA-256 of the PDF
+            pages: Text of every page in order
+
+        Returns:
+            Number of pages written
+        """
+        path = self._path(content_hash)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}-{uuid.uuid4().hex[:8]}.tmp")
+
+        offsets = [0]
+        try:
+            with open(tmp_path, "wb") as f:
+                for text in pages:
+                    f.write(zlib.compress(text.encode("utf-8")))
+                    offsets.append(f.tell())
+                for offset in offsets:
+                    f.write(_OFFSET.pack(offset))
+                f.write(_TRAILER.pack(_MAGIC, len(offsets) - 1))
+            # Atomic: readers never see a half-written store
+            os.replace(tmp_path, path)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+
+        with self._lock:
+            self.stats["stores_written"] += 1
+            self.stats["pages_written"] += len(offsets) - 1
+        return len(offsets) - 1
+
+    def link(self, textbook_id: str, content_hash: str) -> None:
+        """Point textbook_id at the store for content_hash"""
+        ref = self._ref_path(textbook_id)
+        tmp_ref = ref.with_name(f"{ref.name}.{os.getpid()}-{uuid.uuid4().hex[:8]}.tmp")
+        tmp_ref.write_text(content_hash)
+        os.replace(tmp_ref, ref)
+
+    def has(self, content_hash: str) -> bool:
+        return self._path(content_hash).exists()
+
+    def content_hash(self, textbook_id: str) -> Optional[str]:
+        """Content hash a textbook is stored under, or None if it has no pages stored"""
+        ref = self._ref_path(textbook_id)
+        if not ref.exists():
+            return None
+        return ref.read_text().strip()
+
+    def page_count(self, textbook_id: str) -> int:
+        """
+        Number of pages stored for a textbook
+
+        Raises:
+            FileNotFoundError: If the textbook has no pages stored
+        """
+        with open(self._store_path(textbook_id), "rb") as f:
+            return self._read_trailer(f)
+
+    def get_pages(self, textbook_id: str, start: int, end: int) -> List[str]:
+        """
+        Text of pages start..end (1-based, inclusive, like section page ranges)
+
+        `end` is clamped to the last page, since section ranges from ToC
+        parsing may run past the end of the book.
+
+        Args:
+            textbook_id: Textbook (resource) ID
+            start: First page
+            end: Last page
+
+        Returns:
+            The text of each page in the range ("" for pages without text)
+
+        Raises:
+            FileNotFoundError: If the textbook has no pages stored
+            ValueError: If start is not a page of the textbook
+        """
+        path = self._store_path(textbook_id)
+        content_hash = path.stem
+
+        with self._lock:
+            cached = [self._memory.get((content_hash, page)) for page in range(start, end + 1)]
+            if start >= 1 and cached and all(text is not None for text in cached):
+                for page in range(start, end + 1):
+                    self._memory.move_to_end((content_hash, page))
+                self.stats["memory_hits"] += 1
+                return cached
+
+        with open(path, "rb") as f:
+            total_pages = self._read_trailer(f)
+            if not 1 <= start <= total_pages:
+                raise ValueError(f"Page {start} out of range (textbook has {total_pages} pages)")
+            end = max(start, min(end, total_pages))
+
+            index_start = f.seek(0, os.SEEK_END) - _TRAILER.size - _OFFSET.size * (total_pages + 1)
+            f.seek(index_start + _OFFSET.size * (start - 1))
+            raw_offsets = f.read(_OFFSET.size * (end - start + 2))
+            offsets = [offset for (offset,) in _OFFSET.iter_unpack(raw_offsets)]
+
+            f.seek(offsets[0])
+            blob = f.read(offsets[-1] - offsets[0])
+
+        texts = [
+            zlib.decompress(blob[offsets[i] - offsets[0]:offsets[i + 1] - offsets[0]]).decode("utf-8")
+            for i in range(len(offsets) - 1)
+        ]
+
+        with self._lock:
+            self.stats["disk_reads"] += 1
+            for page, text in zip(range(start, end + 1), texts):
+                self._remember((content_hash, page), text)
+        return texts
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "memory_pages": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+        }
+
+    # Internal helpers
+
+    def _path(self, content_hash: str) -> Path:
+        if not re.fullmatch(r"[0-9a-f]{64}", content_hash):
+            raise ValueError(f"Invalid content hash: {content_hash!r}")
+        return self.root / content_hash[:2] / f"{content_hash}.pages"
+
+    def _ref_path(self, textbook_id: str) -> Path:
+        if not _TEXTBOOK_ID.match(textbook_id):
+            raise ValueError(f"Invalid textbook ID: {textbook_id!r}")
+        return self.root / "refs" / textbook_id
+
+    def _store_path(self, textbook_id: str) -> Path:
+        content_hash = self.content_hash(textbook_id)
+        if content_hash is None or not self.has(content_hash):
+            raise FileNotFoundError(f"No pages stored for textbook {textbook_id}")
+        return self._path(content_hash)
+
+    @staticmethod
+    def _read_trailer(f) -> int:
+        f.seek(-_TRAILER.size, os.SEEK_END)
+        magic, total_pages = _TRAILER.unpack(f.read(_TRAILER.size))
+        if magic != _MAGIC:
+            raise ValueError("Corrupt page store file")
+        return total_pages
+
+    def _remember(self, key: Tuple[str, int], text: str) -> None:
+        """Add a page to the LRU (call with self._lock held)"""
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old)
+        if len(text) > self.memory_max_bytes:
+            return
+        self._memory[key] = text
+        self._memory_bytes += len(text)
+        while self._memory_bytes > self.memory_max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+
+# Global instance
+_page_store: Optional[PageStore] = None
+
+
+def get_page_store() -> PageStore:
+    """Get or create the global page store instance"""
+    global _page_store
+    if _page_store is None:
+        _page_store = PageStore(
+            root=settings.page_store_dir,
+            memory_max_bytes=settings.page_store_memory_mb * 1024 * 1024,
+        )
+    return _page_store
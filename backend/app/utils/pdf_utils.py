@@ -3,17 +3,37 @@ PDF Utilities
 Functions for extracting text and structure from PDF files
 """
 
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List, Dict, Optional, Tuple
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 import re
 
+# Pages per extraction task: enough tasks to balance the workers, few enough
+# that reopening the PDF for each task stays cheap. Each task opens the PDF
+# fresh, so pdfminer's per-document object cache never outgrows one task.
+PAGES_PER_TASK = 25
 
-def extract_text_from_pdf(pdf_path: str) -> str:
+# Separator between the text of consecutive pages in extracted text
+PAGE_SEPARATOR = "\n\n"
+
+# Fewer outline entries than this is a cover/bookmark stub, not a section tree
+MIN_OUTLINE_ENTRIES = 3
+
+
+def extract_text_from_pdf(pdf_path: str, workers: Optional[int] = None) -> str:
     """
     Extract all text from a PDF file
 
+    Collects stream_text_from_pdf into one string; use that directly to
+    write very large books somewhere without holding all of their text.
+
     Args:
         pdf_path: Path to PDF file
+        workers: Worker processes (default: PDF_EXTRACT_WORKERS; 0 = one per CPU core, 1 = serial)
 
     Returns:
         Extracted text as string
@@ -22,6 +42,78 @@ def extract_text_from_pdf(pdf_path: str) -> str:
         FileNotFoundError: If PDF doesn't exist
         Exception: If extraction fails
     """
+    text_parts: List[str] = []
+    stream_text_from_pdf(pdf_path, text_parts.append, workers)
+    return "".join(text_parts)
+
+
+def stream_text_from_pdf(pdf_path: str, sink: Callable[[str], Any], workers: Optional[int] = None) -> int:
+    """
+    Extract all text from a PDF file into a sink, page by page
+
+    The sink (e.g. a file's write method) gets the text of each page with
+    text, separated by PAGE_SEPARATOR. Peak memory is bounded by the pages
+    in flight, not by the length of the book.
+
+    Args:
+        pdf_path: Path to PDF file
+        sink: Called with each chunk of text in order
+        workers: Worker processes (default: PDF_EXTRACT_WORKERS; 0 = one per CPU core, 1 = serial)
+
+    Returns:
+        Number of characters written to the sink
+
+    Raises:
+        FileNotFoundError: If PDF doesn't exist
+        Exception: If extraction fails
+    """
+    started = time.monotonic()
+    chars = 0
+    pages = 0
+
+    try:
+        for text in iter_page_texts(pdf_path, workers):
+            pages += 1
+            if not text:
+                continue
+            if chars:
+                sink(PAGE_SEPARATOR)
+                chars += len(PAGE_SEPARATOR)
+            sink(text)
+            chars += len(text)
+    except (FileNotFoundError, ImportError):
+        raise
+    except Exception as e:
+        raise Exception(f"Failed to extract text from PDF: {e}")
+
+    elapsed = time.monotonic() - started
+    print(
+        f"[PDF] ✓ Extracted {chars} characters from {pages} pages in {elapsed:.1f}s "
+        f"({pages / max(elapsed, 1e-6):.1f} pages/sec)"
+    )
+    return chars
+
+
+def iter_page_texts(pdf_path: str, workers: Optional[int] = None) -> Iterator[str]:
+    """
+    Text of every page in order ("" for pages without text)
+
+    Pages are extracted in chunks of PAGES_PER_TASK, each from a freshly
+    opened PDF, and every page's parsed layout is released as soon as its
+    text is read. With more than one worker the chunks are spread over a
+    process pool with at most two chunks per worker in flight; small PDFs
+    (a single chunk) are always extracted in-process.
+
+    Args:
+        pdf_path: Path to PDF file
+        workers: Worker processes (default: PDF_EXTRACT_WORKERS; 0 = one per CPU core, 1 = serial)
+
+    Yields:
+        The text of each page
+
+    Raises:
+        FileNotFoundError: If PDF doesn't exist
+    """
     try:
         import pdfplumber
     except ImportError:
@@ -31,27 +123,140 @@ def extract_text_from_pdf(pdf_path: str) -> str:
     if not pdf_file.exists():
         raise FileNotFoundError(f"PDF not found: {pdf_path}")
 
-    text_parts = []
+    if workers is None:
+        from app.config import settings
+        workers = settings.pdf_extract_workers
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+
+    with pdfplumber.open(pdf_path) as pdf:
+        total_pages = len(pdf.pages)
 
+    ranges = [
+        (start, min(start + PAGES_PER_TASK, total_pages))
+        for start in range(0, total_pages, PAGES_PER_TASK)
+    ]
+    workers = max(1, min(workers, len(ranges)))
+    print(f"[PDF] Extracting text from {total_pages} pages ({workers} worker(s))...")
+
+    for done, chunk in enumerate(_page_chunks(pdf_path, ranges, workers), 1):
+        yield from chunk
+        if done % 4 == 0 and done < len(ranges):
+            print(f"[PDF] Processed {ranges[done - 1][1]}/{total_pages} pages...")
+
+
+def _page_chunks(pdf_path: str, ranges: List[Tuple[int, int]], workers: int) -> Iterator[Iterable[str]]:
+    """Page texts per range, in order: lazily in-process, or from a bounded window of pool tasks"""
+    if workers == 1:
+        for start, end in ranges:
+            yield _iter_page_range(pdf_path, start, end)
+        return
+
+    # spawn, not fork: the server process has threads (cache, event loop)
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        pending = deque()
+        try:
+            for start, end in ranges:
+                pending.append(pool.submit(_extract_page_range, pdf_path, start, end))
+                if len(pending) >= 2 * workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # The consumer stopped early or a task failed: don't run the rest
+            for future in pending:
+                future.cancel()
+
+
+def _iter_page_range(pdf_path: str, start: int, end: int) -> Iterator[str]:
+    """Text of pages [start, end) in order, from the PDF opened just for them"""
+    import pdfplumber
+
+    with pdfplumber.open(pdf_path, pages=range(start + 1, end + 1)) as pdf:
+        for page in pdf.pages:
+            text = page.extract_text() or ""
+            # Drop the parsed layout objects before moving to the next page
+            page.close()
+            yield text
+
+
+def _extract_page_range(pdf_path: str, start: int, end: int) -> List[str]:
+    """
+    Text of pages [start, end) in order ("" for pages without text)
+
+    Runs inside extraction worker processes.
+    """
+    return list(_iter_page_range(pdf_path, start, end))
+
+
+class PageTextCache:
+    """
+    An open PDF whose page text is extracted at most once
+
+    Page numbers are 1-based, like the page numbers in ToC entries. Pages
+    are closed after extraction so only their text stays in memory.
+    """
+
+    def __init__(self, pdf):
+        self.pdf = pdf
+        self.total_pages = len(pdf.pages)
+        self.extractions = 0
+        self._text: Dict[int, str] = {}
+
+    def text(self, page_num: int) -> str:
+        if page_num not in self._text:
+            page = self.pdf.pages[page_num - 1]
+            self._text[page_num] = page.extract_text() or ""
+            page.close()
+            self.extractions += 1
+        return self._text[page_num]
+
+
+def analyze_textbook(pdf_path: str, max_pages_to_scan: int = 50) -> Dict:
+    """
+    Metadata and structure of a textbook in a single pass over the PDF
+
+    The embedded outline (bookmarks) is used when the PDF has one, without
+    extracting any page text. Otherwise the PDF is opened once and each
+    page's text is extracted at most once:
+    metadata, ToC detection and the header scan all read from one shared
+    PageTextCache, so the header scan reuses the pages the ToC search read.
+
+    Args:
+        pdf_path: Path to textbook PDF
+        max_pages_to_scan: Max pages to scan for headers (default: 50)
+
+    Returns:
+        Dict with title, author, total_pages, file_size_mb, parsing_method and sections
+    """
     try:
-        with pdfplumber.open(pdf_path) as pdf:
-            print(f"[PDF] Extracting text from {len(pdf.pages)} pages...")
+        import pdfplumber
+    except ImportError:
+        raise ImportError("pdfplumber not installed. Run: pip install pdfplumber")
 
-            for page_num, page in enumerate(pdf.pages, 1):
-                text = page.extract_text()
-                if text:
-                    text_parts.append(text)
+    pdf_file = Path(pdf_path)
+    if not pdf_file.exists():
+        raise FileNotFoundError(f"PDF not found: {pdf_path}")
 
-                if page_num % 50 == 0:
-                    print(f"[PDF] Processed {page_num}/{len(pdf.pages)} pages...")
+    print(f"\n[TEXTBOOK PARSER] Analyzing textbook...")
+    print(f"[TEXTBOOK PARSER] File: {pdf_file.name}")
 
-    except Exception as e:
-        raise Exception(f"Failed to extract text from PDF: {e}")
+    outline = _read_outline(pdf_file)
+    if outline:
+        metadata, structure = outline
+        return {**metadata, **structure}
 
-    full_text = "\n\n".join(text_parts)
-    print(f"[PDF] ✓ Extracted {len(full_text)} characters from PDF")
+    try:
+        with pdfplumber.open(pdf_path) as pdf:
+            pages = PageTextCache(pdf)
+            metadata = _read_metadata(pdf, pdf_file)
+            structure = _parse_structure(pages, max_pages_to_scan)
+    except Exception as e:
+        raise Exception(f"Failed to analyze textbook: {e}")
 
-    return full_text
+    print(f"[TEXTBOOK PARSER] Extracted text from {pages.extractions}/{pages.total_pages} pages")
+    return {**metadata, **structure}
 
 
 def parse_textbook_structure(pdf_path: str, max_pages_to_scan: int = 50) -> Dict:
@@ -59,9 +264,10 @@ def parse_textbook_structure(pdf_path: str, max_pages_to_scan: int = 50) -> Dict
     Parse textbook structure by extracting headers from pages
 
     Strategy:
-    1. Look for ToC (Table of Contents) in first 20 pages
-    2. If found, parse ToC for chapter/section structure
-    3. If not found, scan pages for large text (headers)
+    1. Use the PDF outline (bookmarks) if it has one
+    2. Otherwise look for ToC (Table of Contents) in first 20 pages
+    3. If found, parse ToC for chapter/section structure
+    4. If not found, scan pages for large text (headers)
 
     Args:
         pdf_path: Path to textbook PDF
@@ -82,40 +288,154 @@ def parse_textbook_structure(pdf_path: str, max_pages_to_scan: int = 50) -> Dict
     print(f"\n[TEXTBOOK PARSER] Analyzing textbook structure...")
     print(f"[TEXTBOOK PARSER] File: {pdf_file.name}")
 
+    outline = _read_outline(pdf_file)
+    if outline:
+        return {'title': pdf_file.stem, **outline[1]}
+
     try:
         with pdfplumber.open(pdf_path) as pdf:
-            total_pages = len(pdf.pages)
-            print(f"[TEXTBOOK PARSER] Total pages: {total_pages}")
-
-            # Try to find and parse ToC first
-            toc_data = _extract_toc(pdf)
-
-            if toc_data:
-                print(f"[TEXTBOOK PARSER] ✓ Found Table of Contents with {len(toc_data)} entries")
-                return {
-                    'title': pdf_file.stem,
-                    'total_pages': total_pages,
-                    'parsing_method': 'toc',
-                    'sections': toc_data
-                }
+            structure = _parse_structure(PageTextCache(pdf), max_pages_to_scan)
+    except Exception as e:
+        raise Exception(f"Failed to parse textbook structure: {e}")
 
-            # Fallback: Scan pages for headers
-            print(f"[TEXTBOOK PARSER] ToC not found, scanning pages for headers...")
-            header_data = _scan_for_headers(pdf, max_pages_to_scan)
+    return {'title': pdf_file.stem, **structure}
 
-            print(f"[TEXTBOOK PARSER] ✓ Found {len(header_data)} sections via header scanning")
-            return {
-                'title': pdf_file.stem,
-                'total_pages': total_pages,
-                'parsing_method': 'headers',
-                'sections': header_data
-            }
 
+def _read_outline(pdf_file: Path) -> Optional[Tuple[Dict, Dict]]:
+    """
+    Metadata and structure from the PDF outline (bookmarks), if it has one
+
+    Only the document catalog and page tree are read, so this takes
+    milliseconds even for a 1000-page book. Any problem with the outline
+    returns None and the text heuristics are used instead.
+
+    Returns:
+        (metadata, structure) in the shapes of get_pdf_metadata and
+        _parse_structure, or None
+    """
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise ImportError("pypdf not installed. Run: pip install pypdf")
+
+    start = time.perf_counter()
+    try:
+        reader = PdfReader(str(pdf_file))
+        total_pages = len(reader.pages)
+        sections = _outline_sections(reader, reader.outline, total_pages)
+        info = reader.metadata or {}
     except Exception as e:
-        raise Exception(f"Failed to parse textbook structure: {e}")
+        print(f"[TEXTBOOK PARSER] Could not read PDF outline: {e}")
+        return None
+
+    if len(sections) < MIN_OUTLINE_ENTRIES:
+        return None
+
+    print(f"[TEXTBOOK PARSER] Total pages: {total_pages}")
+    print(
+        f"[TEXTBOOK PARSER] ✓ Found PDF outline with {len(sections)} entries "
+        f"in {(time.perf_counter() - start) * 1000:.0f}ms"
+    )
+    metadata = {
+        'title': str(info.get('/Title') or pdf_file.stem),
+        'author': str(info.get('/Author') or 'Unknown'),
+        'total_pages': total_pages,
+        'file_size_mb': round(pdf_file.stat().st_size / (1024 * 1024), 2)
+    }
+    structure = {
+        'total_pages': total_pages,
+        'parsing_method': 'outline',
+        'sections': sections
+    }
+    return metadata, structure
+
+
+def _outline_sections(reader, outline: list, total_pages: int) -> List[Dict]:
+    """
+    Flatten the outline tree into section entries
+
+    In pypdf's outline a nested list holds the children of the item before
+    it. Titles that start with a number ("2.3 The Chain Rule", "Chapter 4
+    Limits") keep it as section_number, others are numbered by position.
+    A section ends where the next section at the same or a higher level
+    starts.
+    """
+    sections = []
+    counters: List[int] = []
+    open_sections: List[Dict] = []
+
+    def walk(items: list, level: int) -> None:
+        for item in items:
+            if isinstance(item, list):
+                walk(item, level + 1)
+                continue
+
+            page = reader.get_destination_page_number(item)
+            title = re.sub(r'\s+', ' ', str(item.title or '')).strip()
+            if page is None or page < 0 or not title:
+                continue
 
+            del counters[level:]
+            counters.extend([0] * (level - len(counters)))
+            counters[level - 1] += 1
 
-def _extract_toc(pdf) -> Optional[List[Dict]]:
+            match = re.match(r'^(?:Chapter\s+)?(\d+(?:\.\d+)*)\.?\s+(.{3,})$', title, re.IGNORECASE)
+            if match:
+                section_number, title = match.group(1), match.group(2).strip()
+            else:
+                section_number = '.'.join(str(n) for n in counters)
+
+            section = {
+                'section_number': section_number,
+                'title': title[:100],
+                'page_start': page + 1,
+                'page_end': None,  # Filled when the next sibling or ancestor starts
+                'level': level,
+                'keywords': _extract_keywords(title)
+            }
+
+            while open_sections and open_sections[-1]['level'] >= level:
+                ended = open_sections.pop()
+                ended['page_end'] = max(ended['page_start'], section['page_start'] - 1)
+            open_sections.append(section)
+            sections.append(section)
+
+    walk(outline, 1)
+
+    for section in open_sections:
+        section['page_end'] = total_pages
+
+    return sections
+
+
+def _parse_structure(pages: PageTextCache, max_pages_to_scan: int) -> Dict:
+    """ToC-based structure, falling back to header scanning"""
+    print(f"[TEXTBOOK PARSER] Total pages: {pages.total_pages}")
+
+    # Try to find and parse ToC first
+    toc_data = _extract_toc(pages)
+
+    if toc_data:
+        print(f"[TEXTBOOK PARSER] ✓ Found Table of Contents with {len(toc_data)} entries")
+        return {
+            'total_pages': pages.total_pages,
+            'parsing_method': 'toc',
+            'sections': toc_data
+        }
+
+    # Fallback: Scan pages for headers
+    print(f"[TEXTBOOK PARSER] ToC not found, scanning pages for headers...")
+    header_data = _scan_for_headers(pages, max_pages_to_scan)
+
+    print(f"[TEXTBOOK PARSER] ✓ Found {len(header_data)} sections via header scanning")
+    return {
+        'total_pages': pages.total_pages,
+        'parsing_method': 'headers',
+        'sections': header_data
+    }
+
+
+def _extract_toc(pages: PageTextCache) -> Optional[List[Dict]]:
     """
     Try to extract Table of Contents from first 20 pages
 
@@ -132,8 +452,8 @@ def _extract_toc(pdf) -> Optional[List[Dict]]:
     toc_keywords = ['table of contents', 'contents', 'overview']
 
     # Scan first 20 pages
-    for page_num, page in enumerate(pdf.pages[:20], 1):
-        text = page.extract_text()
+    for page_num in range(1, min(20, pages.total_pages) + 1):
+        text = pages.text(page_num)
         if not text:
             continue
 
@@ -226,7 +546,7 @@ def _parse_toc_text(text: str, page_num: int) -> List[Dict]:
     return entries
 
 
-def _scan_for_headers(pdf, max_pages: int) -> List[Dict]:
+def _scan_for_headers(pages: PageTextCache, max_pages: int) -> List[Dict]:
     """
     Scan pages for headers by detecting large/bold text
 
@@ -238,11 +558,10 @@ def _scan_for_headers(pdf, max_pages: int) -> List[Dict]:
     current_section = None
     section_counter = 1
 
-    pages_to_scan = min(max_pages, len(pdf.pages))
+    pages_to_scan = min(max_pages, pages.total_pages)
 
-    for page_num, page in enumerate(pdf.pages[:pages_to_scan], 1):
-        # Extract text with layout info
-        text = page.extract_text()
+    for page_num in range(1, pages_to_scan + 1):
+        text = pages.text(page_num)
         if not text:
             continue
 
@@ -342,11 +661,15 @@ def get_pdf_metadata(pdf_path: str) -> Dict:
         raise FileNotFoundError(f"PDF not found: {pdf_path}")
 
     with pdfplumber.open(pdf_path) as pdf:
-        metadata = pdf.metadata or {}
+        return _read_metadata(pdf, pdf_file)
 
-        return {
-            'title': metadata.get('Title', pdf_file.stem),
-            'author': metadata.get('Author', 'Unknown'),
-            'total_pages': len(pdf.pages),
-            'file_size_mb': round(pdf_file.stat().st_size / (1024 * 1024), 2)
-        }
+
+def _read_metadata(pdf, pdf_file: Path) -> Dict:
+    metadata = pdf.metadata or {}
+
+    return {
+        'title': metadata.get('Title', pdf_file.stem),
+        'author': metadata.get('Author', 'Unknown'),
+        'total_pages': len(pdf.pages),
+        'file_size_mb': round(pdf_file.stat().st_size / (1024 * 1024), 2)
+    }
@@ -3,35 +3,36 @@ LLM Prompt Templates
 Centralized prompt definitions for Claude API
 """
 
-from typing import Optional, List
+import hashlib
+import inspect
+from functools import lru_cache
+from typing import List, NamedTuple, Optional, Union
 
 
-def topic_extraction_prompt(
-    syllabus_text: str,
-    course_level: Optional[str] = None,
-    prerequisites: Optional[List[str]] = None,
-    candidate_sections: Optional[List[str]] = None
-) -> str:
+class PromptParts(NamedTuple):
     """
-    Prompt for extracting PREREQUISITE topics from a syllabus
+    A prompt split into a stable prefix and a request-specific suffix
 
-    This extracts what students need to KNOW BEFORE taking the course,
-    NOT the topics taught IN the course.
+    The prefix (instructions, rules, example JSON) is identical for every
+    call of a template, so LLMService can serve it from a context cache
+    (LLM_CONTEXT_CACHE) and send it once per batched call. str() gives the
+    full prompt text.
+    """
+    prefix: str
+    suffix: str
 
-    Args:
-        syllabus_text: The course syllabus text
-        course_level: Educational level (hs, ug, grad)
-        prerequisites: Explicit prerequisites detected in syllabus
-        candidate_sections: Ignored (not used for prerequisites)
+    def __str__(self) -> str:
+        return self.prefix + self.suffix
 
-    Returns:
-        Formatted prompt string for LLM
-    """
-    level_context = f"Course level: {course_level.upper()} (high school/undergraduate/graduate). " if course_level else ""
 
-    return f"""You are analyzing a course syllabus to identify PREREQUISITE knowledge that students must have BEFORE taking this course.
+def split_prompt(prompt: Union[str, PromptParts]) -> PromptParts:
+    """Treat a plain string prompt as having no cacheable prefix"""
+    if isinstance(prompt, PromptParts):
+        return prompt
+    return PromptParts("", prompt)
 
-{level_context}
+
+TOPIC_EXTRACTION_PREFIX = """You are analyzing a course syllabus to identify PREREQUISITE knowledge that students must have BEFORE taking this course.
 
 Your task: Extract 6-12 specific prerequisite topics that students are expected to already know on day 1 of this course.
 
@@ -41,6 +42,7 @@ CRITICAL RULES:
 3. Infer foundational skills from course content (e.g., if course uses calculus, then calculus is a prerequisite)
 4. Break down broad prerequisites into specific testable skills
 5. Order topics from most fundamental to most advanced
+6. Pitch the topics at the course level, if one is given with the syllabus
 
 EXAMPLE for an AP Physics course:
 - "Algebra" → Break into: "Linear equations", "Quadratic equations", "Systems of equations"
@@ -54,30 +56,30 @@ DO NOT INCLUDE course content like:
 
 Return ONLY a JSON array with this EXACT structure:
 [
-  {{
+  {
     "id": "t_001",
     "name": "Linear equations and inequalities",
     "weight": 1.0,
     "prereqs": []
-  }},
-  {{
+  },
+  {
     "id": "t_002",
     "name": "Quadratic equations and graphing",
     "weight": 1.2,
     "prereqs": ["t_001"]
-  }},
-  {{
+  },
+  {
     "id": "t_003",
     "name": "Right triangle trigonometry",
     "weight": 1.5,
     "prereqs": ["t_001"]
-  }},
-  {{
+  },
+  {
     "id": "t_004",
     "name": "Derivatives and differentiation",
     "weight": 2.0,
     "prereqs": ["t_002"]
-  }}
+  }
 ]
 
 Field requirements:
@@ -87,43 +89,53 @@ Field requirements:
 - "prereqs": Array of topic IDs that must be learned first (can be empty for foundational topics)
 
 Output ONLY the JSON array. No markdown, no explanations, no extra text.
-
-SYLLABUS:
-{syllabus_text[:4000]}"""
+"""
 
 
-def question_generation_prompt(
-    topic: str,
-    count: int,
+def topic_extraction_prompt(
+    syllabus_text: str,
     course_level: Optional[str] = None,
-    difficulty: Optional[str] = None,
-    context: Optional[str] = None,
-) -> str:
+    prerequisites: Optional[List[str]] = None,
+    candidate_sections: Optional[List[str]] = None
+) -> PromptParts:
     """
-    Prompt for generating self-assessment survey items for a topic.
+    Prompt for extracting PREREQUISITE topics from a syllabus
+
+    This extracts what students need to KNOW BEFORE taking the course,
+    NOT the topics taught IN the course.
+
+    Args:
+        syllabus_text: The course syllabus text
+        course_level: Educational level (hs, ug, grad)
+        prerequisites: Explicit prerequisites detected in syllabus
+        candidate_sections: Ignored (not used for prerequisites)
+
+    Returns:
+        Fixed instructions (prefix) and this syllabus (suffix)
     """
-    level_context = f"Audience: {course_level}. " if course_level else ""
-    context_note = f"\nContext: {context}\n" if context else ""
+    level_context = f"Course level: {course_level.upper()} (high school/undergraduate/graduate)\n" if course_level else ""
+
+    return PromptParts(TOPIC_EXTRACTION_PREFIX, f"""
+{level_context}
+SYLLABUS:
+{syllabus_text[:4000]}""")
 
-    return f"""Create {count} brief self-assessment survey items for the topic "{topic}".
 
-{level_context}{context_note}
+QUESTION_GENERATION_PREFIX = """You create brief self-assessment survey items for one topic of a course.
 
 Each item should be phrased as a learner-facing statement beginning with "I can...", "I know how to...", or "I understand...".
-Focus on concrete skills for this topic. Avoid generic phrasing.
+Focus on concrete skills for the topic. Avoid generic phrasing.
 
 Return ONLY a JSON array of question objects with this EXACT structure:
 [
-  {{
-    "id": "q_001",
-    "topic": "{topic}",
+  {
     "stem": "I can convert between SI base and derived units without help.",
     "options": ["Yes", "Maybe", "No"],
     "answerIndex": 0,
     "rationale": "Self-assessment: choose Yes if you feel confident, Maybe if you need more practice, or No if you need support.",
     "difficulty": "med",
     "bloom": "understand"
-  }}
+  }
 ]
 
 Rules:
@@ -133,10 +145,30 @@ Rules:
 - bloom level must be one of: "remember", "understand", "apply", "analyze", "evaluate", "create"
 - Provide a short, encouraging rationale indicating this is a self-assessment.
 - Keep stems specific to the skills within the topic; reuse wording from the syllabus when possible.
-- Use sequential IDs: q_001, q_002, etc.
 - Return ONLY the JSON array, no other text or markdown formatting.
+"""
+
+
+def question_generation_prompt(
+    topic: str,
+    count: int,
+    course_level: Optional[str] = None,
+    difficulty: Optional[str] = None,
+    context: Optional[str] = None,
+) -> PromptParts:
+    """
+    Prompt for generating self-assessment survey items for a topic.
 
-Generate {count} learner-facing survey statements now:"""
+    The rules and example are the shared prefix; the topic, count, audience
+    and context form the suffix.
+    """
+    level_context = f"Audience: {course_level}\n" if course_level else ""
+    context_note = f"Context: {context}\n" if context else ""
+
+    return PromptParts(QUESTION_GENERATION_PREFIX, f"""
+Topic: "{topic}"
+{level_context}{context_note}
+Generate {count} learner-facing survey statements for "{topic}" now:""")
 
 
 def fallback_topics_from_headings(syllabus_text: str) -> list:
@@ -199,3 +231,34 @@ def fallback_topics_from_headings(syllabus_text: str) -> list:
         }]
 
     return topics
+
+
+# Prompt builders whose output is cached by LLMService, by template name
+PROMPT_TEMPLATES = {
+    "topic_extraction": topic_extraction_prompt,
+    "question_generation": question_generation_prompt,
+}
+
+# The fixed instruction prefix each template builds on
+PROMPT_PREFIXES = {
+    "topic_extraction": TOPIC_EXTRACTION_PREFIX,
+    "question_generation": QUESTION_GENERATION_PREFIX,
+}
+
+
+@lru_cache(maxsize=None)
+def template_hash(name: str) -> str:
+    """
+    Short hash of a prompt builder's source code and instruction prefix
+
+    Stored with cached LLM responses so that editing a template invalidates
+    the responses generated from its old wording.
+
+    Args:
+        name: Key in PROMPT_TEMPLATES
+
+    Raises:
+        KeyError: If the template name is unknown
+    """
+    source = inspect.getsource(PROMPT_TEMPLATES[name]) + PROMPT_PREFIXES[name]
+    return hashlib.sha256(source.encode()).hexdigest()[:12]
@@ -0,0 +1,156 @@
+"""
+Structured Output Schemas
+Gemini response schemas and cached validators derived from the Pydantic models
+"""
+
+import hashlib
+import json
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple, Type, get_args, get_origin
+
+from pydantic import BaseModel, TypeAdapter, ValidationError, create_model
+
+# Scalar JSON Schema types Gemini's response_schema supports
+_SCALAR_TYPES = {"string", "integer", "number", "boolean"}
+
+
+@lru_cache(maxsize=None)
+def type_adapter(response_type: Any) -> TypeAdapter:
+    """Cached TypeAdapter for a response type (building one is expensive)"""
+    return TypeAdapter(response_type)
+
+
+@lru_cache(maxsize=None)
+def draft_model(model: Type[BaseModel], exclude: Tuple[str, ...]) -> Type[BaseModel]:
+    """
+    Copy of `model` without the fields the server fills in itself
+
+    e.g. draft_model(SurveyQuestion, ("id", "topic_id")) is what the LLM
+    should produce for a survey question.
+    """
+    fields = {
+        name: (field.annotation, field)
+        for name, field in model.model_fields.items()
+        if name not in exclude
+    }
+    return create_model(f"{model.__name__}Draft", __doc__=model.__doc__, **fields)
+
+
+@lru_cache(maxsize=None)
+def response_schema(response_type: Any) -> Dict[str, Any]:
+    """
+    Gemini response_schema for a Pydantic model or List[...] of one
+
+    Converts the Pydantic JSON Schema to the OpenAPI subset Gemini accepts:
+    $refs are inlined, Optional[...] becomes nullable, and validation-only
+    keywords (lengths, bounds, defaults) are dropped - the TypeAdapter still
+    enforces those after the response arrives.
+    """
+    schema = type_adapter(response_type).json_schema()
+    return _to_gemini(schema, schema.get("$defs", {}))
+
+
+def schema_hash(schema: Dict[str, Any]) -> str:
+    """Short stable hash of a response schema, for cache keys"""
+    return hashlib.sha256(json.dumps(schema, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def list_item_type(response_type: Any) -> Any:
+    """The element type of List[X], or None for non-list types"""
+    if get_origin(response_type) in (list, List):
+        args = get_args(response_type)
+        return args[0] if args else Any
+    return None
+
+
+def validate_response(raw: Any, response_type: Any) -> Any:
+    """
+    Validate an LLM answer (JSON text or parsed JSON) against response_type
+
+    The whole answer is validated in one pass. For list types, if that
+    fails, each element is validated on its own and invalid ones are
+    dropped, so one bad question does not cost the whole batch.
+
+    Raises:
+        ValueError: If the answer cannot be used at all
+    """
+    adapter = type_adapter(response_type)
+    try:
+        if isinstance(raw, (str, bytes)):
+            return adapter.validate_json(raw)
+        return adapter.validate_python(raw)
+    except ValidationError as e:
+        item_type = list_item_type(response_type)
+        if item_type is None:
+            raise ValueError(f"LLM response does not match {_type_name(response_type)}: {e}")
+        error = e
+
+    try:
+        items = json.loads(raw) if isinstance(raw, (str, bytes)) else raw
+    except json.JSONDecodeError:
+        raise ValueError(f"LLM did not return valid JSON: {error}")
+    if not isinstance(items, list):
+        raise ValueError(f"LLM response is not a list: {error}")
+
+    item_adapter = type_adapter(item_type)
+    valid = []
+    for item in items:
+        try:
+            valid.append(item_adapter.validate_python(item))
+        except ValidationError as item_error:
+            print(f"[SCHEMA WARNING] Dropping invalid {_type_name(item_type)}: {item_error.errors()[0]['msg']}")
+    return valid
+
+
+def _type_name(response_type: Any) -> str:
+    return getattr(response_type, "__name__", None) or str(response_type)
+
+
+def _to_gemini(node: Dict[str, Any], defs: Dict[str, Any]) -> Dict[str, Any]:
+    if "$ref" in node:
+        node = {**defs[node["$ref"].split("/")[-1]], **{k: v for k, v in node.items() if k != "$ref"}}
+    if "allOf" in node and len(node["allOf"]) == 1:
+        node = {**_resolve(node["allOf"][0], defs), **{k: v for k, v in node.items() if k != "allOf"}}
+
+    nullable = False
+    if "anyOf" in node:
+        variants = [v for v in node["anyOf"] if v.get("type") != "null"]
+        nullable = len(variants) < len(node["anyOf"])
+        # Gemini has no unions; use the first concrete variant
+        node = {**_resolve(variants[0], defs), **{k: v for k, v in node.items() if k != "anyOf"}}
+
+    out: Dict[str, Any] = {}
+    if node.get("description"):
+        out["description"] = node["description"]
+    if nullable:
+        out["nullable"] = True
+
+    if "enum" in node:
+        out["type"] = "string"
+        out["enum"] = [str(value) for value in node["enum"]]
+        return out
+
+    node_type = node.get("type", "object" if "properties" in node else "string")
+    out["type"] = node_type
+
+    if node_type == "array":
+        out["items"] = _to_gemini(node.get("items", {"type": "string"}), defs)
+        if "minItems" in node:
+            out["min_items"] = node["minItems"]
+        if "maxItems" in node:
+            out["max_items"] = node["maxItems"]
+    elif node_type == "object":
+        properties = node.get("properties", {})
+        out["properties"] = {name: _to_gemini(prop, defs) for name, prop in properties.items()}
+        if node.get("required"):
+            out["required"] = list(node["required"])
+    elif node_type not in _SCALAR_TYPES:
+        out["type"] = "string"
+
+    return out
+
+
+def _resolve(node: Dict[str, Any], defs: Dict[str, Any]) -> Dict[str, Any]:
+    if "$ref" in node:
+        return defs[node["$ref"].split("/")[-1]]
+    return node
@@ -0,0 +1,63 @@
+"""
+Tenant Tokens
+Short-lived signed tokens naming the signed-in teacher behind a request
+"""
+
+import base64
+import hashlib
+import hmac
+import time
+from typing import Optional
+
+
+def _sign(payload: str, secret: str) -> str:
+    return hmac.new(secret.encode(), payload.encode(), hashlib.sha256).hexdigest()
+
+
+def issue_tenant_token(email: str, secret: str, ttl_seconds: int = 300) -> str:
+    """
+    Create a token for `email` (the frontend's /api/llm-token route does the same)
+
+    Format: base64url(email) "." expiry (unix seconds) "." hex HMAC-SHA256 of
+    the first two fields, keyed with the shared LLM_TENANT_SECRET.
+
+    Args:
+        email: Teacher email from the authenticated session
+        secret: Shared signing secret
+        ttl_seconds: Lifetime of the token
+
+    Returns:
+        Signed token string
+    """
+    encoded = base64.urlsafe_b64encode(email.lower().encode()).decode().rstrip("=")
+    payload = f"{encoded}.{int(time.time()) + ttl_seconds}"
+    return f"{payload}.{_sign(payload, secret)}"
+
+
+def verify_tenant_token(token: str, secret: str) -> Optional[str]:
+    """
+    Check a tenant token's signature and expiry
+
+    Args:
+        token: Token from the Authorization header
+        secret: Shared signing secret
+
+    Returns:
+        Teacher email the token was issued for, or None if it is malformed,
+        forged or expired (or no secret is configured)
+    """
+    if not secret:
+        return None
+    parts = token.split(".")
+    if len(parts) != 3 or not parts[1].isdigit():
+        return None
+    encoded, expires_at, signature = parts
+    if not hmac.compare_digest(signature, _sign(f"{encoded}.{expires_at}", secret)):
+        return None
+    if int(expires_at) < time.time():
+        return None
+    try:
+        email = base64.urlsafe_b64decode(encoded + "=" * (-len(encoded) % 4)).decode()
+    except (ValueError, UnicodeDecodeError):
+        return None
+    return email.lower() or None
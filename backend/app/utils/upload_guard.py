@@ -0,0 +1,54 @@
+"""
+Upload Guard
+Reject oversized uploads from their headers, before the body is received
+"""
+
+from typing import Awaitable, Callable, Iterable
+
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+
+# Room in Content-Length for multipart boundaries and part headers around the file
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+def upload_size_guard(
+    paths: Iterable[str],
+    max_bytes: int,
+) -> Callable[[Request, Callable[[Request], Awaitable[Response]]], Awaitable[Response]]:
+    """
+    HTTP middleware limiting the request body of upload endpoints
+
+    FastAPI reads and spools the whole multipart body before the endpoint
+    (or any of its dependencies) runs, so a size check in the endpoint only
+    happens after the upload has been received. This middleware runs first
+    and answers from the headers alone: 411 without a Content-Length, 413
+    when it exceeds `max_bytes` plus multipart overhead. The body is never
+    read in either case.
+
+    Args:
+        paths: Request paths to guard (e.g. "/api/textbooks/upload")
+        max_bytes: Largest accepted file size in bytes
+
+    Returns:
+        Middleware function for app.middleware("http")
+    """
+    guarded = set(paths)
+    limit = max_bytes + MULTIPART_OVERHEAD_BYTES
+
+    async def guard(request: Request, call_next: Callable[[Request], Awaitable[Response]]) -> Response:
+        if request.method != "POST" or request.url.path not in guarded:
+            return await call_next(request)
+
+        content_length = request.headers.get("content-length")
+        if content_length is None or not content_length.isdigit():
+            return JSONResponse(status_code=411, content={"detail": "Content-Length required"})
+        if int(content_length) > limit:
+            print(f"[UPLOAD] Rejecting {request.url.path}: {int(content_length)} bytes declared")
+            return JSONResponse(
+                status_code=413,
+                content={"detail": f"File size must be less than {max_bytes // (1024 * 1024)}MB"},
+            )
+        return await call_next(request)
+
+    return guard
@@ -3,43 +3,42 @@ Web Search Utilities
 Search for Khan Academy resources with caching
 """
 
-import json
-import hashlib
-from pathlib import Path
-from typing import List, Dict
-from datetime import datetime, timedelta
+from typing import List, Dict, Optional
 
+from app.config import settings
+from app.utils.cache import CacheNamespace, get_cache, make_key
 
-# Cache directory for Khan Academy URLs
-CACHE_DIR = Path(__file__).parent.parent.parent / ".cache" / "khan_academy"
-CACHE_DIR.mkdir(parents=True, exist_ok=True)
 
 # Cache expiry: 30 days
 CACHE_EXPIRY_DAYS = 30
 
+_cache: Optional[CacheNamespace] = None
+
+
+def _get_khan_cache() -> Optional[CacheNamespace]:
+    """Get the Khan Academy cache namespace (opened on first use), or None if caching is off"""
+    global _cache
+    if not settings.cache_enabled:
+        return None
+    if _cache is None:
+        _cache = get_cache().namespace("khan_academy", ttl=CACHE_EXPIRY_DAYS * 24 * 3600)
+    return _cache
+
 
 def _get_cache_key(topic: str) -> str:
     """Generate cache key for a topic"""
-    normalized = topic.lower().strip()
-    return hashlib.md5(normalized.encode()).hexdigest()[:8]
+    return make_key(topic.lower().strip())
 
 
 def _read_cache(topic: str) -> List[Dict]:
-    """Read Khan Academy resources from cache"""
-    cache_key = _get_cache_key(topic)
-    cache_file = CACHE_DIR / f"{cache_key}.json"
-
-    if not cache_file.exists():
+    """Read Khan Academy resources from cache (expired entries read as missing)"""
+    cache = _get_khan_cache()
+    if cache is None:
         return []
 
     try:
-        with open(cache_file, 'r') as f:
-            data = json.load(f)
-
-        # Check expiry
-        cached_time = datetime.fromisoformat(data['cached_at'])
-        if datetime.now() - cached_time > timedelta(days=CACHE_EXPIRY_DAYS):
-            print(f"    [CACHE EXPIRED] Khan Academy cache for '{topic}'")
+        data = cache.get(_get_cache_key(topic))
+        if not data:
             return []
 
         print(f"    [CACHE HIT] Using cached Khan Academy resources for '{topic}'")
@@ -52,18 +51,15 @@ def _read_cache(topic: str) -> List[Dict]:
 
 def _write_cache(topic: str, resources: List[Dict]):
     """Write Khan Academy resources to cache"""
-    cache_key = _get_cache_key(topic)
-    cache_file = CACHE_DIR / f"{cache_key}.json"
+    cache = _get_khan_cache()
+    if cache is None:
+        return
 
     try:
-        data = {
+        cache.set(_get_cache_key(topic), {
             'topic': topic,
-            'cached_at': datetime.now().isoformat(),
             'resources': resources
-        }
-
-        with open(cache_file, 'w') as f:
-            json.dump(data, f, indent=2)
+        })
 
         print(f"    [CACHE WRITE] Cached {len(resources)} Khan Academy resources for '{topic}'")
 
@@ -89,6 +85,7 @@ async def search_khan_academy(topic: str, max_results: int = 3) -> List[Dict]:
 
     # If not in cache, use AI with web search to find resources
     try:
+        from app.services.llm_metrics import llm_caller
         from app.services.llm_service import get_llm_service
 
         llm = get_llm_service()
@@ -118,7 +115,8 @@ Return ONLY this JSON (no other text):
 If you cannot find confident matches, return an empty array.
 """
 
-        result = await llm.generate_json(prompt, max_tokens=1024)
+        with llm_caller("web_search"):
+            result = await llm.generate_json(prompt, max_tokens=1024)
         resources = result.get('resources', [])
 
         # Clean and deduplicate URLs
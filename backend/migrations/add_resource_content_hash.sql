@@ -0,0 +1,8 @@
+-- Add content_hash column to resources table
+-- SHA-256 of an uploaded textbook PDF, so re-uploads of the same file reuse the existing resource
+
+ALTER TABLE resources
+ADD COLUMN IF NOT EXISTS content_hash TEXT;
+
+-- Unique, so concurrent uploads of the same PDF cannot both insert a row
+CREATE UNIQUE INDEX IF NOT EXISTS idx_resources_content_hash ON resources(content_hash);
@@ -45,7 +45,7 @@ async def test_topic_extraction():
             syllabus_text=syllabus,
             course_level="undergraduate"
         )
-        print(f"📝 Prompt generated ({len(prompt)} chars)\n")
+        print(f"📝 Prompt generated ({len(str(prompt))} chars)\n")
         
         # Call LLM
         print("🤖 Calling Gemini API...\n")
@@ -0,0 +1,47 @@
+"""
+Test Configuration
+Offline settings for the backend test suite (no API keys, database or disk cache)
+"""
+
+import os
+import tempfile
+
+import pytest
+
+# Settings are read when app.config is first imported
+os.environ.setdefault("SUPABASE_URL", "http://localhost")
+os.environ.setdefault("SUPABASE_KEY", "test")
+os.environ["LLM_PROVIDERS"] = "stub"
+os.environ["LLM_MODE"] = "live"
+os.environ["CACHE_ENABLED"] = "false"
+os.environ["CACHE_DIR"] = tempfile.mkdtemp(prefix="reteach-test-cache-")
+os.environ["LLM_TENANT_SECRET"] = "test-tenant-secret"
+
+from app.services.llm_providers import ProviderRouter  # noqa: E402
+from app.services.llm_service import LLMService  # noqa: E402
+from app.utils.cache import Cache  # noqa: E402
+
+
+@pytest.fixture
+def llm_service():
+    """An LLMService whose providers and cache a test sets with `use_providers` / `use_cache`"""
+    service = LLMService()
+
+    def use_providers(*providers):
+        service.router = ProviderRouter(list(providers), switch_margin=0.25)
+
+    def use_cache(store):
+        service.cache_enabled = True
+        service.cache = store.namespace("llm_responses")
+
+    service.use_providers = use_providers
+    service.use_cache = use_cache
+    return service
+
+
+@pytest.fixture
+def cache_store(tmp_path):
+    """A cache file of its own, shared by every service a test points at it (like workers)"""
+    store = Cache(tmp_path / "cache.sqlite3", max_bytes=1024 * 1024, memory_max_bytes=64 * 1024)
+    yield store
+    store._conn.close()
@@ -0,0 +1,66 @@
+"""
+Test Fakes
+Scripted models and providers for exercising LLMService without network access
+"""
+
+from types import SimpleNamespace
+
+from app.services.circuit_breaker import CircuitBreaker
+from app.services.llm_providers import LLMProvider, ProviderResponse
+from app.services.rate_limiter import RateLimiter
+
+
+class FakeModel:
+    """
+    Model with the GenerativeModel call shape that answers from a function
+
+    `answer(prompt)` returns the response text, or raises to fail the call.
+    Every prompt the model received is kept in `prompts`.
+    """
+
+    def __init__(self, answer):
+        self.answer = answer
+        self.prompts = []
+
+    async def generate_content_async(self, prompt, generation_config=None, stream=False, **kwargs):
+        self.prompts.append(prompt)
+        text = self.answer(prompt)
+        return ProviderResponse(text, SimpleNamespace(
+            prompt_token_count=len(prompt) // 4,
+            candidates_token_count=len(text) // 4,
+            total_token_count=(len(prompt) + len(text)) // 4,
+            cached_content_token_count=0,
+        ))
+
+
+def make_provider(name, model, failure_threshold=5, context_cache=None):
+    """Provider around `model` with no rate limit and its own circuit breaker"""
+    return LLMProvider(
+        name,
+        model,
+        rate_limiter=RateLimiter(requests_per_minute=0),
+        breaker=CircuitBreaker(name, failure_threshold=failure_threshold, reset_timeout=60),
+        context_cache=context_cache,
+    )
+
+
+async def asgi_post(app, path, body, content_length=True):
+    """POST body to an ASGI app; returns (response status, number of body reads)"""
+    headers = [(b"content-length", str(len(body)).encode())] if content_length else []
+    scope = {
+        "type": "http", "method": "POST", "path": path, "raw_path": path.encode(),
+        "query_string": b"", "headers": headers, "http_version": "1.1", "scheme": "http",
+        "server": ("test", 80), "client": ("client", 1), "root_path": "",
+    }
+    reads = []
+    sent = []
+
+    async def receive():
+        reads.append(body)
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    return sent[0]["status"], len(reads)
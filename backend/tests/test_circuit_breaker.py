@@ -0,0 +1,91 @@
+"""
+Circuit breaker states and p95-based hedged requests
+"""
+
+import asyncio
+
+import pytest
+
+from app.config import settings
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError
+from app.services.llm_providers import ProviderResponse
+from tests.fakes import make_provider
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=60)
+
+    breaker.on_failure()
+    breaker.on_failure()
+    breaker.on_success()  # A success resets the count
+    breaker.on_failure()
+    breaker.on_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    breaker.on_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    assert breaker.stats == {"opened": 1, "rejected": 1}
+    assert breaker.seconds_until_probe() > 59
+
+
+def test_half_open_lets_one_probe_through():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0)
+    breaker.on_failure()
+
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    # A cancelled probe frees its place for the next one
+    breaker.on_abandoned()
+    breaker.before_call()
+    breaker.on_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_failed_probe_reopens():
+    breaker = CircuitBreaker("test", failure_threshold=5, reset_timeout=0.05)
+    for _ in range(5):
+        breaker.on_failure()
+
+    breaker._opened_at -= 0.05
+    breaker.before_call()
+    breaker.on_failure()
+    assert breaker._state == CircuitBreaker.OPEN
+    assert breaker.stats["opened"] == 2
+
+
+class SlowFirstModel:
+    """First call hangs (until cancelled), later calls answer at once"""
+
+    def __init__(self):
+        self.calls = 0
+        self.cancelled = False
+
+    async def generate_content_async(self, prompt, generation_config=None, stream=False, **kwargs):
+        self.calls += 1
+        if self.calls == 1:
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                self.cancelled = True
+                raise
+        return ProviderResponse("hedged answer")
+
+
+@pytest.mark.asyncio
+async def test_call_slower_than_p95_is_hedged(llm_service, monkeypatch):
+    monkeypatch.setattr(settings, "llm_hedge_enabled", True)
+    monkeypatch.setattr(settings, "llm_hedge_min_samples", 1)
+    model = SlowFirstModel()
+    llm_service.use_providers(make_provider("primary", model))
+    llm_service.metrics.record_api_call(0.01, provider="primary")
+
+    assert await llm_service.generate("Slow question") == "hedged answer"
+    assert model.calls == 2
+    assert model.cancelled
+    assert llm_service.stats["hedged"] == 1
+    assert llm_service.stats["hedge_wins"] == 1
@@ -0,0 +1,49 @@
+"""
+Shared-prefix prompts served through the context cache
+"""
+
+import pytest
+
+from app.services.context_cache import ContextCache, LocalContextBackend
+from app.utils.prompts import QUESTION_GENERATION_PREFIX, question_generation_prompt
+from tests.fakes import FakeModel, make_provider
+
+
+def test_builders_keep_request_details_out_of_the_prefix():
+    first = question_generation_prompt("Vectors", 3, course_level="undergraduate", context="Physics 101")
+    second = question_generation_prompt("Limits", 5)
+
+    assert first.prefix == second.prefix == QUESTION_GENERATION_PREFIX
+    assert "Vectors" in first.suffix and "Physics 101" in first.suffix
+    assert "Vectors" not in first.prefix
+
+
+@pytest.mark.asyncio
+async def test_second_call_reuses_the_cached_prefix(llm_service):
+    model = FakeModel(lambda prompt: "[]")
+    context_cache = ContextCache(LocalContextBackend(model))
+    llm_service.use_providers(make_provider("fake", model, context_cache=context_cache))
+
+    await llm_service.generate(question_generation_prompt("Vectors", 3))
+    cached_before = llm_service.stats["cached_input_tokens"]
+    prompt = question_generation_prompt("Limits", 3)
+    await llm_service.generate(prompt)
+
+    assert context_cache.stats["created"] == 1
+    assert context_cache.stats["reused"] == 1
+    assert llm_service.stats["cached_input_tokens"] - cached_before == len(prompt.prefix) // 4 > 0
+    # The model still receives the whole prompt
+    assert model.prompts[-1] == str(prompt)
+
+
+@pytest.mark.asyncio
+async def test_batched_call_sends_the_prefix_once(llm_service):
+    model = FakeModel(lambda prompt: '{"task_1": [], "task_2": []}')
+    llm_service.use_providers(make_provider("fake", model))
+    prompts = {topic: question_generation_prompt(topic, 3) for topic in ("Vectors", "Limits")}
+
+    await llm_service.generate_json_many(prompts, max_tokens_per_item=100)
+
+    assert len(model.prompts) == 1
+    assert model.prompts[0].startswith(QUESTION_GENERATION_PREFIX)
+    assert model.prompts[0].count(QUESTION_GENERATION_PREFIX) == 1
@@ -0,0 +1,86 @@
+"""
+Cross-worker LLM deduplication through the shared cache's locks
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from app.config import settings
+from app.services.llm_providers import ProviderResponse
+from tests.fakes import FakeModel, make_provider
+
+
+class SlowModel:
+    """Answers after `seconds`"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.calls = 0
+
+    async def generate_content_async(self, prompt, generation_config=None, stream=False, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.seconds)
+        return ProviderResponse("slow answer")
+
+
+def test_lock_is_exclusive_until_it_expires(cache_store):
+    assert cache_store.try_lock("llm:key", "worker-a", ttl=0.05)
+    assert not cache_store.try_lock("llm:key", "worker-b", ttl=60)
+    assert cache_store.try_lock("llm:key", "worker-a", ttl=0.05)  # Refresh
+
+    cache_store.release_lock("llm:key", "worker-b")  # Not the holder: no-op
+    assert not cache_store.try_lock("llm:key", "worker-b", ttl=60)
+
+    time.sleep(0.06)
+    assert cache_store.try_lock("llm:key", "worker-b", ttl=60)
+
+
+@pytest.mark.asyncio
+async def test_waiting_worker_reuses_the_holders_response(llm_service, cache_store):
+    model = FakeModel(lambda prompt: "own answer")
+    llm_service.use_providers(make_provider("primary", model))
+    llm_service.use_cache(cache_store)
+    cache_key = llm_service._get_cache_key("Question", **llm_service._cache_params(4096, 1.0, None))
+    assert cache_store.try_lock(f"llm:{cache_key}", "other-worker", ttl=60)
+
+    waiting = asyncio.create_task(llm_service.generate("Question"))
+    await asyncio.sleep(0.1)
+    assert not waiting.done()
+    llm_service._write_cache(cache_key, "holder's answer")
+
+    assert await waiting == "holder's answer"
+    assert model.prompts == []
+    assert llm_service.stats["coalesced_cross_worker"] == 1
+
+
+@pytest.mark.asyncio
+async def test_wait_on_a_stuck_holder_is_bounded_by_the_lock_ttl(llm_service, cache_store, monkeypatch):
+    monkeypatch.setattr(settings, "llm_lock_ttl_seconds", 0.3)
+    model = FakeModel(lambda prompt: "own answer")
+    llm_service.use_providers(make_provider("primary", model))
+    llm_service.use_cache(cache_store)
+    cache_key = llm_service._get_cache_key("Question", **llm_service._cache_params(4096, 1.0, None))
+    assert cache_store.try_lock(f"llm:{cache_key}", "stuck-worker", ttl=60)
+
+    started = time.monotonic()
+    assert await llm_service.generate("Question") == "own answer"
+    assert 0.3 <= time.monotonic() - started < 1.0
+    assert len(model.prompts) == 1
+
+
+@pytest.mark.asyncio
+async def test_holder_keeps_the_lock_alive_during_a_long_call(llm_service, cache_store, monkeypatch):
+    monkeypatch.setattr(settings, "llm_lock_ttl_seconds", 0.3)
+    model = SlowModel(0.6)
+    llm_service.use_providers(make_provider("primary", model))
+    llm_service.use_cache(cache_store)
+    cache_key = llm_service._get_cache_key("Question", **llm_service._cache_params(4096, 1.0, None))
+
+    holder = asyncio.create_task(llm_service.generate("Question"))
+    await asyncio.sleep(0.45)  # Past the TTL of the lock as first taken
+    assert not cache_store.try_lock(f"llm:{cache_key}", "other-worker", ttl=60)
+
+    assert await holder == "slow answer"
+    assert cache_store.try_lock(f"llm:{cache_key}", "other-worker", ttl=60)  # Released
@@ -0,0 +1,69 @@
+"""
+Request deadlines and their effect on LLM calls
+"""
+
+import asyncio
+
+import pytest
+
+from app.services.llm_providers import ProviderResponse
+from app.utils.deadline import DeadlineExceeded, deadline, deadline_expired, run_within_deadline, time_remaining
+from tests.fakes import make_provider
+
+
+class HangingModel:
+    """Never answers; notes when its call is cancelled"""
+
+    def __init__(self):
+        self.cancelled = False
+
+    async def generate_content_async(self, prompt, generation_config=None, stream=False, **kwargs):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return ProviderResponse("too late")
+
+
+def test_nested_deadlines_only_shorten_the_budget():
+    assert time_remaining() is None
+    with deadline(10):
+        with deadline(60):
+            assert time_remaining() <= 10
+        with deadline(None):
+            assert 9 < time_remaining() <= 10
+        with deadline(1):
+            assert time_remaining() <= 1
+        assert time_remaining() > 9
+    assert time_remaining() is None
+    assert not deadline_expired()
+
+
+@pytest.mark.asyncio
+async def test_run_within_deadline():
+    assert await run_within_deadline(asyncio.sleep(0, "no deadline")) == "no deadline"
+
+    with deadline(0.05):
+        assert await run_within_deadline(asyncio.sleep(0, "in time")) == "in time"
+        with pytest.raises(DeadlineExceeded):
+            await run_within_deadline(asyncio.sleep(1))
+
+    with deadline(0):
+        assert deadline_expired()
+        with pytest.raises(DeadlineExceeded):
+            await run_within_deadline(asyncio.sleep(1))
+
+
+@pytest.mark.asyncio
+async def test_llm_call_is_cancelled_at_the_deadline(llm_service):
+    model = HangingModel()
+    llm_service.use_providers(make_provider("primary", model))
+
+    with deadline(0.1):
+        with pytest.raises(DeadlineExceeded):
+            await llm_service.generate("Slow question")
+    await asyncio.sleep(0)
+
+    assert model.cancelled
+    assert llm_service._inflight == {}
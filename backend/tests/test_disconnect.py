@@ -0,0 +1,89 @@
+"""
+Cancelling request work when the HTTP client disconnects
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.utils.disconnect import ClientDisconnected, cancel_on_disconnect, stream_until_disconnect
+
+
+def fake_request(disconnect_after=None):
+    """Request whose client goes away `disconnect_after` seconds from now (never if None)"""
+    loop = asyncio.get_running_loop()
+    gone_at = None if disconnect_after is None else loop.time() + disconnect_after
+
+    async def is_disconnected():
+        return gone_at is not None and loop.time() >= gone_at
+
+    return SimpleNamespace(method="POST", url=SimpleNamespace(path="/api/questions/generate"),
+                           is_disconnected=is_disconnected)
+
+
+@pytest.mark.asyncio
+async def test_work_finishes_while_the_client_stays():
+    result = await cancel_on_disconnect(fake_request(), asyncio.sleep(0.02, "done"), poll_interval=0.01)
+    assert result == "done"
+
+
+@pytest.mark.asyncio
+async def test_work_is_cancelled_when_the_client_leaves():
+    cancelled = asyncio.Event()
+
+    async def work():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    with pytest.raises(ClientDisconnected):
+        await cancel_on_disconnect(fake_request(disconnect_after=0.05), work(), poll_interval=0.01)
+    assert cancelled.is_set()
+
+
+@pytest.mark.asyncio
+async def test_stream_is_relayed_in_order():
+    async def items():
+        for i in range(3):
+            await asyncio.sleep(0.01)
+            yield i
+
+    relayed = [item async for item in stream_until_disconnect(fake_request(), items(), poll_interval=0.005)]
+    assert relayed == [0, 1, 2]
+
+
+@pytest.mark.asyncio
+async def test_stream_is_closed_when_the_client_leaves_between_items():
+    closed = asyncio.Event()
+
+    async def items():
+        try:
+            yield "first"
+            await asyncio.sleep(10)  # e.g. waiting on the next LLM call
+            yield "second"
+        finally:
+            closed.set()
+
+    relayed = []
+    with pytest.raises(ClientDisconnected):
+        async for item in stream_until_disconnect(fake_request(disconnect_after=0.05), items(), poll_interval=0.01):
+            relayed.append(item)
+
+    assert relayed == ["first"]
+    assert closed.is_set()
+
+
+@pytest.mark.asyncio
+async def test_stream_error_reaches_the_consumer():
+    async def items():
+        yield "first"
+        raise ValueError("generation failed")
+
+    relayed = []
+    with pytest.raises(ValueError, match="generation failed"):
+        async for item in stream_until_disconnect(fake_request(), items(), poll_interval=0.01):
+            relayed.append(item)
+    assert relayed == ["first"]
@@ -0,0 +1,113 @@
+"""
+Batch packing and per-key retries in LLMService.generate_json_many
+"""
+
+import json
+import re
+
+import pytest
+
+from app.config import settings
+from tests.fakes import FakeModel, make_provider
+
+TASK_HEADER = re.compile(r"### TASK (task_\d+)\n(.*?)(?=\n\n### TASK|\Z)", re.DOTALL)
+
+
+def answer_tasks(skip=()):
+    """Answer batched prompts task by task (echoing each task's text), leaving out `skip`"""
+    def answer(prompt):
+        tasks = TASK_HEADER.findall(prompt)
+        if not tasks:
+            return json.dumps({"echo": prompt.strip().splitlines()[-1]})
+        return json.dumps({
+            task_id: {"echo": text.strip().splitlines()[-1]}
+            for task_id, text in tasks
+            if not any(s in text for s in skip)
+        })
+    return answer
+
+
+def test_pack_batches_respects_output_budget(llm_service, monkeypatch):
+    monkeypatch.setattr(settings, "llm_batch_max_output_tokens", 3000)
+    prompts = {f"topic {i}": f"Answer about topic {i}" for i in range(7)}
+
+    batches = llm_service._pack_batches(prompts, max_tokens_per_item=1000)
+
+    assert batches == [
+        ["topic 0", "topic 1", "topic 2"],
+        ["topic 3", "topic 4", "topic 5"],
+        ["topic 6"],
+    ]
+
+
+def test_pack_batches_respects_input_budget(llm_service, monkeypatch):
+    monkeypatch.setattr(settings, "llm_batch_token_budget", 100)
+    prompts = {"a": "x" * 300, "b": "y" * 300, "c": "z" * 40}
+
+    batches = llm_service._pack_batches(prompts, max_tokens_per_item=10)
+
+    assert batches == [["a"], ["b", "c"]]
+
+
+@pytest.mark.asyncio
+async def test_answers_are_split_back_out_per_key(llm_service, monkeypatch):
+    monkeypatch.setattr(settings, "llm_batch_max_output_tokens", 2000)
+    model = FakeModel(answer_tasks())
+    llm_service.use_providers(make_provider("fake", model))
+    prompts = {f"topic {i}": f"Answer about topic {i}" for i in range(4)}
+
+    results = await llm_service.generate_json_many(prompts, max_tokens_per_item=1000)
+
+    assert results == {key: {"echo": prompt} for key, prompt in prompts.items()}
+    assert len(model.prompts) == 2
+
+
+@pytest.mark.asyncio
+async def test_only_missing_answers_are_retried(llm_service):
+    model = FakeModel(answer_tasks(skip=["topic 2"]))
+    llm_service.use_providers(make_provider("fake", model))
+    prompts = {f"topic {i}": f"Answer about topic {i}" for i in range(4)}
+
+    results = await llm_service.generate_json_many(prompts, max_tokens_per_item=100)
+
+    assert results == {key: {"echo": prompt} for key, prompt in prompts.items()}
+    # One batched call, then one individual retry for the missing task
+    assert len(model.prompts) == 2
+    assert "### TASK" not in model.prompts[1]
+    assert "topic 2" in model.prompts[1]
+
+
+@pytest.mark.asyncio
+async def test_invalid_answers_are_retried(llm_service):
+    model = FakeModel(answer_tasks())
+    llm_service.use_providers(make_provider("fake", model))
+    prompts = {"good": "Answer good", "bad": "Answer bad"}
+    attempts = []
+
+    def validate(value):
+        attempts.append(value["echo"])
+        return value["echo"] != "Answer bad" or attempts.count("Answer bad") > 1
+
+    results = await llm_service.generate_json_many(prompts, max_tokens_per_item=100, validate=validate)
+
+    assert set(results) == {"good", "bad"}
+    assert len(model.prompts) == 2
+
+
+@pytest.mark.asyncio
+async def test_malformed_batch_keeps_the_good_tasks(llm_service):
+    def answer(prompt):
+        if "### TASK" in prompt:
+            # task_2's answer is cut off, so the object as a whole does not parse
+            return '{"task_1": {"echo": "Answer a"}, "task_2": {"echo": "Ans, "task_3": {"echo": "Answer c"}}'
+        return json.dumps({"echo": prompt.strip()})
+
+    model = FakeModel(answer)
+    llm_service.use_providers(make_provider("fake", model))
+    prompts = {"a": "Answer a", "b": "Answer b", "c": "Answer c"}
+
+    results = await llm_service.generate_json_many(prompts, max_tokens_per_item=100)
+
+    assert results == {"a": {"echo": "Answer a"}, "b": {"echo": "Answer b"}, "c": {"echo": "Answer c"}}
+    # Only task b is retried on its own
+    assert model.prompts[1:] == ["Answer b"]
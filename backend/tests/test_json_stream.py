@@ -0,0 +1,60 @@
+"""
+Incremental JSON array parsing
+"""
+
+from app.utils.json_stream import JsonArrayStreamParser, extract_json_entries
+
+
+def feed_all(parser, chunks):
+    items = []
+    for chunk in chunks:
+        items.extend(parser.feed(chunk))
+    return items
+
+
+def test_elements_are_returned_as_they_complete():
+    parser = JsonArrayStreamParser()
+
+    assert parser.feed('[{"a": 1}, {"b"') == [{"a": 1}]
+    assert parser.feed(': 2}]') == [{"b": 2}]
+    assert parser.done
+
+
+def test_fenced_array_with_preamble():
+    text = 'Here are [2] questions:\n```json\n[{"q": "What is [x]?"}, {"q": "Why \\"]\\"?"}]\n```'
+
+    items = feed_all(JsonArrayStreamParser(), [text[i:i + 7] for i in range(0, len(text), 7)])
+
+    assert items == [{"q": "What is [x]?"}, {"q": 'Why "]"?'}]
+
+
+def test_inline_fence_opens_array():
+    assert feed_all(JsonArrayStreamParser(), ['```json[1, ', '2]```']) == [1, 2]
+
+
+def test_bracket_mid_line_does_not_open_array():
+    parser = JsonArrayStreamParser()
+
+    assert parser.feed("Sure: [1, 2]") == []
+    assert not parser.started
+
+
+def test_text_after_array_is_ignored():
+    assert JsonArrayStreamParser().feed('[1]\n[2]') == [1]
+
+
+def test_invalid_element_is_skipped():
+    parser = JsonArrayStreamParser()
+
+    assert parser.feed('[{"a": 1}, {bad}, {"c": 3}]') == [{"a": 1}, {"c": 3}]
+    assert len(parser.errors) == 1
+
+
+def test_extract_json_entries_salvages_good_entries():
+    text = '{"task_1": [1, 2], "task_2": {"a": , "task_3": "done", "task_10": null'
+
+    assert extract_json_entries(text, ["task_1", "task_2", "task_3", "task_4", "task_10"]) == {
+        "task_1": [1, 2],
+        "task_3": "done",
+        "task_10": None,
+    }
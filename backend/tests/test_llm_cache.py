@@ -0,0 +1,45 @@
+"""
+Versioned LLM response cache entries
+"""
+
+import pytest
+
+from app.services import llm_service as llm_service_module
+from app.utils.prompts import template_hash
+from tests.fakes import FakeModel, make_provider
+
+
+@pytest.mark.asyncio
+async def test_response_round_trips_through_the_cache(llm_service, cache_store):
+    model = FakeModel(lambda prompt: "cached answer")
+    llm_service.use_providers(make_provider("primary", model))
+    llm_service.use_cache(cache_store)
+
+    assert await llm_service.generate("Question", template="topic_extraction") == "cached answer"
+    assert await llm_service.generate("Question", template="topic_extraction") == "cached answer"
+    assert len(model.prompts) == 1
+    assert llm_service.stats["cache_hits"] == 1
+    assert llm_service.cache_self_test()
+
+
+def test_entry_from_an_older_format_is_dropped_on_read(llm_service, cache_store, monkeypatch):
+    llm_service.use_cache(cache_store)
+    monkeypatch.setattr(llm_service_module, "CACHE_FORMAT_VERSION", 1)
+    llm_service._write_cache("key", "old answer")
+    monkeypatch.undo()
+
+    assert llm_service._read_cache("key") is None
+    assert llm_service.cache.get("key") is None
+
+
+def test_entry_from_an_edited_template_is_dropped_on_read(llm_service, cache_store):
+    llm_service.use_cache(cache_store)
+    current = f"topic_extraction@{template_hash('topic_extraction')}"
+    llm_service._write_cache("current", "answer", params={"template": current})
+    llm_service._write_cache("stale", "answer", params={"template": "topic_extraction@0123456789ab"})
+    llm_service._write_cache("removed", "answer", params={"template": "retired_template@0123456789ab"})
+
+    assert llm_service._read_cache("current") == "answer"
+    assert llm_service._read_cache("stale") is None
+    assert llm_service._read_cache("removed") is None
+    assert llm_service.cache.get("stale") is None
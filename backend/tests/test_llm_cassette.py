@@ -0,0 +1,72 @@
+"""
+Recording LLM calls to a cassette and replaying them offline
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from app.services.llm_cassette import Cassette, CassetteMiss, LatencyModel, RecordingModel, ReplayModel
+from app.services.llm_metrics import usage_from_response
+from tests.fakes import FakeModel
+
+CONFIG = SimpleNamespace(temperature=0.2, max_output_tokens=100)
+
+
+@pytest.fixture
+def recorded(tmp_path):
+    """Cassette file holding one recorded call"""
+    path = tmp_path / "llm.jsonl"
+    live = FakeModel(lambda prompt: "recorded answer " * 20)
+    return path, RecordingModel(live, Cassette(path)), live
+
+
+@pytest.mark.asyncio
+async def test_recorded_call_replays_from_a_fresh_cassette(recorded):
+    path, recorder, live = recorded
+    original = await recorder.generate_content_async("Question", generation_config=CONFIG)
+
+    replay = ReplayModel(Cassette(path), LatencyModel("none"))
+    response = await replay.generate_content_async("Question", generation_config=CONFIG)
+
+    assert response.text == original.text
+    assert usage_from_response(response) == usage_from_response(original)
+    assert len(live.prompts) == 1
+
+
+@pytest.mark.asyncio
+async def test_unrecorded_prompt_or_parameters_miss(recorded):
+    path, recorder, _ = recorded
+    await recorder.generate_content_async("Question", generation_config=CONFIG)
+    replay = ReplayModel(Cassette(path), LatencyModel("none"))
+
+    with pytest.raises(CassetteMiss):
+        await replay.generate_content_async("Other question", generation_config=CONFIG)
+    with pytest.raises(CassetteMiss):
+        await replay.generate_content_async(
+            "Question", generation_config=SimpleNamespace(temperature=0.9, max_output_tokens=100)
+        )
+
+
+@pytest.mark.asyncio
+async def test_streamed_replay_reassembles_the_response(recorded):
+    path, recorder, _ = recorded
+    original = await recorder.generate_content_async("Question", generation_config=CONFIG)
+    replay = ReplayModel(Cassette(path), LatencyModel("fixed", median_ms=10))
+
+    stream = await replay.generate_content_async("Question", generation_config=CONFIG, stream=True)
+    chunks = [chunk async for chunk in stream]
+
+    assert len(chunks) > 1
+    assert "".join(chunk.text for chunk in chunks) == original.text
+    assert chunks[-1].usage_metadata is not None
+
+
+def test_latency_models():
+    assert LatencyModel("none").sample_seconds(500) == 0
+    assert LatencyModel("recorded").sample_seconds(500) == 0.5
+    assert LatencyModel("fixed", median_ms=200).sample_seconds(500) == 0.2
+    samples = [LatencyModel("lognormal", median_ms=100, seed=1).sample_seconds() for _ in range(3)]
+    assert len(set(samples)) == 1  # Seeded, so reproducible
+    with pytest.raises(ValueError):
+        LatencyModel("sometimes")
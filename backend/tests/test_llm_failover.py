@@ -0,0 +1,52 @@
+"""
+Provider failover and circuit breaking in LLMService
+"""
+
+import pytest
+
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError
+from tests.fakes import FakeModel, make_provider
+
+
+def failing(prompt):
+    raise RuntimeError("500 Internal error")
+
+
+@pytest.mark.asyncio
+async def test_fails_over_to_next_provider(llm_service):
+    primary = FakeModel(failing)
+    backup = FakeModel(lambda prompt: "backup answer")
+    llm_service.use_providers(make_provider("primary", primary), make_provider("backup", backup))
+
+    assert await llm_service.generate("Say something") == "backup answer"
+    assert len(primary.prompts) == 1
+    assert len(backup.prompts) == 1
+
+
+@pytest.mark.asyncio
+async def test_circuit_opens_after_repeated_failures(llm_service):
+    primary_model = FakeModel(failing)
+    backup_model = FakeModel(lambda prompt: "backup answer")
+    primary = make_provider("primary", primary_model, failure_threshold=2)
+    llm_service.use_providers(primary, make_provider("backup", backup_model))
+
+    for i in range(2):
+        await llm_service.generate(f"Question {i}")
+    assert primary.breaker.state == CircuitBreaker.OPEN
+
+    # An open circuit is skipped without calling the provider
+    assert await llm_service.generate("Question 3") == "backup answer"
+    assert len(primary_model.prompts) == 2
+    assert len(backup_model.prompts) == 3
+
+
+@pytest.mark.asyncio
+async def test_all_circuits_open_fails_fast(llm_service):
+    model = FakeModel(lambda prompt: "never")
+    provider = make_provider("only", model, failure_threshold=1)
+    provider.breaker.on_failure()
+    llm_service.use_providers(provider)
+
+    with pytest.raises(CircuitOpenError):
+        await llm_service.generate("Anything")
+    assert model.prompts == []
@@ -0,0 +1,139 @@
+"""
+LLM Scheduler Tests
+Priority order, per-tenant round-robin and tenant identification
+"""
+
+import asyncio
+
+import pytest
+from starlette.requests import Request
+
+from app.services import llm_scheduler
+from app.services.llm_scheduler import LLMScheduler, Priority, track_llm_tenant
+from app.utils.tenant_token import issue_tenant_token, verify_tenant_token
+
+SECRET = "test-tenant-secret"
+
+
+async def _tenant_for(headers=None, query_string=b""):
+    """Run track_llm_tenant in a fresh task and report the tenant it set"""
+    request = Request({
+        "type": "http",
+        "method": "POST",
+        "path": "/api/topics/parse",
+        "headers": [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+        "query_string": query_string,
+        "client": ("203.0.113.7", 40000),
+    })
+
+    async def resolve():
+        await track_llm_tenant(request)
+        return llm_scheduler._current_tenant.get()
+
+    return await asyncio.create_task(resolve())
+
+
+async def _queue(scheduler, order, priority, tenant, label):
+    granted = await scheduler.acquire(priority, tenant)
+    order.append(label)
+    scheduler.release(granted)
+
+
+@pytest.mark.asyncio
+async def test_tenant_comes_from_signed_token():
+    token = issue_tenant_token("Teacher@School.edu", SECRET)
+    assert await _tenant_for({"Authorization": f"Bearer {token}"}) == "teacher@school.edu"
+
+
+@pytest.mark.asyncio
+async def test_client_set_identity_is_not_trusted():
+    forged = issue_tenant_token("teacher@school.edu", "wrong-secret")
+    assert await _tenant_for({"X-Teacher-Email": "a@b.c"}, b"teacher_email=d@e.f") == "anonymous"
+    assert await _tenant_for({"Authorization": f"Bearer {forged}"}) == "anonymous"
+
+
+def test_expired_or_tampered_token_is_rejected():
+    expired = issue_tenant_token("teacher@school.edu", SECRET, ttl_seconds=-1)
+    assert verify_tenant_token(expired, SECRET) is None
+
+    encoded, expires_at, signature = issue_tenant_token("teacher@school.edu", SECRET).split(".")
+    later = str(int(expires_at) + 3600)
+    assert verify_tenant_token(f"{encoded}.{later}.{signature}", SECRET) is None
+    assert verify_tenant_token(f"{encoded}.{expires_at}.{signature}", "") is None
+
+
+@pytest.mark.asyncio
+async def test_tenants_take_turns_within_a_class():
+    scheduler = LLMScheduler(max_concurrency=1, background_slots=1)
+    held = await scheduler.acquire(Priority.INTERACTIVE, "holder")
+
+    order = []
+    waiters = [
+        asyncio.create_task(_queue(scheduler, order, Priority.INTERACTIVE, tenant, f"{tenant}{i}"))
+        for tenant, i in [("a", 1), ("a", 2), ("a", 3), ("b", 1)]
+    ]
+    await asyncio.sleep(0)
+    scheduler.release(held)
+    await asyncio.gather(*waiters)
+
+    assert order == ["a1", "b1", "a2", "a3"]
+
+
+@pytest.mark.asyncio
+async def test_interactive_is_served_before_background():
+    scheduler = LLMScheduler(max_concurrency=1, background_slots=1)
+    held = await scheduler.acquire(Priority.INTERACTIVE, "holder")
+
+    order = []
+    background = asyncio.create_task(_queue(scheduler, order, Priority.BACKGROUND, "t", "background"))
+    await asyncio.sleep(0)
+    interactive = asyncio.create_task(_queue(scheduler, order, Priority.INTERACTIVE, "t", "interactive"))
+    await asyncio.sleep(0)
+    scheduler.release(held)
+    await asyncio.gather(background, interactive)
+
+    assert order == ["interactive", "background"]
+
+
+@pytest.mark.asyncio
+async def test_background_is_capped_and_starved_waiter_is_promoted():
+    scheduler = LLMScheduler(max_concurrency=2, background_slots=1, max_background_wait=0.05)
+    first = await scheduler.acquire(Priority.BACKGROUND, "t")
+
+    second = asyncio.create_task(scheduler.acquire(Priority.BACKGROUND, "t"))
+    await asyncio.sleep(0)
+    assert not second.done()  # Only one background slot, even with one free slot
+
+    scheduler.release(first)
+    await second
+    scheduler.release(second.result())
+
+    held = [await scheduler.acquire(Priority.INTERACTIVE, "x") for _ in range(2)]
+    order = []
+    background = asyncio.create_task(_queue(scheduler, order, Priority.BACKGROUND, "t", "background"))
+    await asyncio.sleep(0.06)
+    interactive = asyncio.create_task(_queue(scheduler, order, Priority.INTERACTIVE, "t", "interactive"))
+    await asyncio.sleep(0)
+    scheduler.release(held.pop())
+    await asyncio.gather(background, interactive)
+    scheduler.release(held.pop())
+
+    assert order[0] == "background"
+    assert scheduler.stats["promoted"] == 1
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_leaves_the_queue():
+    scheduler = LLMScheduler(max_concurrency=1, background_slots=1)
+    held = await scheduler.acquire(Priority.INTERACTIVE, "holder")
+
+    waiter = asyncio.create_task(scheduler.acquire(Priority.INTERACTIVE, "t"))
+    await asyncio.sleep(0)
+    assert scheduler.queue_depth() == 1
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+
+    assert scheduler.queue_depth() == 0
+    scheduler.release(held)
+    assert scheduler.in_use() == 0
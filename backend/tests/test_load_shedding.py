@@ -0,0 +1,43 @@
+"""
+Load shedding of LLM-backed endpoints
+"""
+
+import pytest
+from fastapi import FastAPI, Request
+
+from app.services import load_shedding
+from app.services.load_shedding import shed_llm_load_before_body
+from tests.fakes import FakeModel, asgi_post, make_provider
+
+
+def make_app():
+    app = FastAPI()
+    app.middleware("http")(shed_llm_load_before_body(paths={"/upload"}))
+
+    @app.post("/upload")
+    async def upload(request: Request):
+        return {"size": len(await request.body())}
+
+    return app
+
+
+@pytest.fixture
+def shedding_service(llm_service, monkeypatch):
+    monkeypatch.setattr(load_shedding, "get_llm_service", lambda: llm_service)
+    provider = make_provider("fake", FakeModel(lambda prompt: "[]"), failure_threshold=1)
+    llm_service.use_providers(provider)
+    return llm_service, provider
+
+
+@pytest.mark.asyncio
+async def test_upload_passes_when_not_saturated(shedding_service):
+    assert await asgi_post(make_app(), "/upload", b"%PDF-1.4") == (200, 1)
+
+
+@pytest.mark.asyncio
+async def test_upload_is_shed_before_the_body_is_read(shedding_service):
+    llm_service, provider = shedding_service
+    provider.breaker.on_failure()
+
+    assert await asgi_post(make_app(), "/upload", b"%PDF-1.4" * 1000) == (503, 0)
+    assert llm_service.stats["shed"] == 1
@@ -0,0 +1,56 @@
+"""
+Page store writes and page-range reads
+"""
+
+import hashlib
+
+import pytest
+
+from app.utils.page_store import PageStore
+
+CONTENT_HASH = hashlib.sha256(b"textbook").hexdigest()
+PAGES = [f"Page {n} text" for n in range(1, 6)] + [""]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = PageStore(tmp_path, memory_max_bytes=1024 * 1024)
+    assert store.write(CONTENT_HASH, iter(PAGES)) == len(PAGES)
+    store.link("book-1", CONTENT_HASH)
+    return store
+
+
+def test_round_trip(store):
+    assert store.page_count("book-1") == 6
+    assert store.get_pages("book-1", 1, 6) == PAGES
+    assert store.get_pages("book-1", 2, 3) == ["Page 2 text", "Page 3 text"]
+
+
+def test_repeat_read_is_served_from_memory(store):
+    store.get_pages("book-1", 2, 4)
+    assert store.get_pages("book-1", 3, 4) == ["Page 3 text", "Page 4 text"]
+    assert store.get_stats()["memory_hits"] == 1
+    assert store.get_stats()["disk_reads"] == 1
+
+
+def test_end_is_clamped_to_last_page(store):
+    assert store.get_pages("book-1", 5, 99) == ["Page 5 text", ""]
+
+
+def test_start_out_of_range(store):
+    with pytest.raises(ValueError):
+        store.get_pages("book-1", 7, 9)
+    with pytest.raises(ValueError):
+        store.get_pages("book-1", 0, 2)
+
+
+def test_textbooks_share_a_store_by_content(store):
+    store.link("book-2", CONTENT_HASH)
+
+    assert store.get_pages("book-2", 1, 1) == ["Page 1 text"]
+    assert store.get_stats()["stores_written"] == 1
+
+
+def test_unknown_textbook(store):
+    with pytest.raises(FileNotFoundError):
+        store.get_pages("missing", 1, 1)
@@ -0,0 +1,90 @@
+"""
+Token-bucket rate limiting of LLM calls
+"""
+
+import time
+
+import pytest
+
+from app.config import settings
+from app.services.llm_service import LLMService
+from app.services.rate_limiter import RateLimiter, is_rate_limit_error, parse_retry_after
+
+
+class ResourceExhausted(Exception):
+    """Same name as the google.api_core 429 error"""
+
+
+class _StatusError(Exception):
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+@pytest.mark.asyncio
+async def test_burst_is_admitted_then_throttled():
+    limiter = RateLimiter(requests_per_minute=600, burst_seconds=0.2)  # 10/s, bucket of 2
+
+    start = time.monotonic()
+    await limiter.acquire()
+    await limiter.acquire()
+    assert time.monotonic() - start < 0.05
+
+    await limiter.acquire()
+    assert time.monotonic() - start >= 0.09
+    assert limiter.stats["acquired"] == 3
+    assert limiter.stats["throttled"] == 1
+
+
+@pytest.mark.asyncio
+async def test_token_budget_holds_back_large_requests():
+    limiter = RateLimiter(requests_per_minute=0, tokens_per_minute=60_000, burst_seconds=1)  # 1000 tokens/s
+
+    await limiter.acquire(tokens=1000)
+    limiter.consume_tokens(100)
+    assert limiter.estimated_wait() == 0  # Only the request budget counts there
+
+    start = time.monotonic()
+    await limiter.acquire(tokens=100)
+    assert time.monotonic() - start >= 0.15
+
+
+@pytest.mark.asyncio
+async def test_429_halves_the_rate_and_pauses_requests():
+    limiter = RateLimiter(requests_per_minute=6000)
+
+    limiter.on_rate_limited(retry_after=0.1)
+    assert limiter.get_stats()["rate_scale"] == 0.5
+    assert limiter.estimated_wait() > 0.05
+
+    start = time.monotonic()
+    await limiter.acquire()
+    assert time.monotonic() - start >= 0.09
+
+    limiter.on_success()
+    assert limiter.get_stats()["rate_scale"] == 0.55
+
+
+def test_rate_limit_errors_are_recognised_by_type_or_status():
+    assert is_rate_limit_error(ResourceExhausted("quota"))
+    assert is_rate_limit_error(_StatusError("slow down", 429))
+    assert not is_rate_limit_error(_StatusError("bad request", 400))
+    assert not is_rate_limit_error(ValueError("model said: 429 quota exceeded"))
+
+
+def test_retry_delay_is_read_from_the_error():
+    assert parse_retry_after(Exception("429 Please retry in 12.5s")) == 12.5
+    assert parse_retry_after(Exception("retry_delay { seconds: 7 }")) == 7
+    assert parse_retry_after(Exception("quota exceeded")) is None
+
+
+def test_worker_share_never_rounds_to_unlimited(monkeypatch):
+    monkeypatch.setattr(settings, "workers", 12)
+    monkeypatch.setattr(settings, "llm_requests_per_minute", 10)
+    monkeypatch.setattr(settings, "llm_tokens_per_minute", 6)
+
+    limiter = LLMService._create_rate_limiter("gemini")
+
+    assert limiter._requests is not None
+    assert limiter._requests.rate * 60 == 10 / 12
+    assert limiter._tokens.rate * 60 == 0.5
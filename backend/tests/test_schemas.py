@@ -0,0 +1,43 @@
+"""
+Response schema validation
+"""
+
+import json
+from typing import List
+
+import pytest
+from pydantic import BaseModel
+
+from app.utils.schemas import validate_response
+
+
+class Item(BaseModel):
+    name: str
+    count: int
+
+
+def test_valid_list_is_returned_whole():
+    raw = json.dumps([{"name": "a", "count": 1}, {"name": "b", "count": 2}])
+
+    assert validate_response(raw, List[Item]) == [Item(name="a", count=1), Item(name="b", count=2)]
+
+
+def test_invalid_items_are_dropped():
+    raw = [{"name": "a", "count": 1}, {"name": "b"}, {"name": "c", "count": "many"}, {"name": "d", "count": 4}]
+
+    assert validate_response(raw, List[Item]) == [Item(name="a", count=1), Item(name="d", count=4)]
+
+
+def test_invalid_object_raises():
+    with pytest.raises(ValueError):
+        validate_response('{"name": "a"}', Item)
+
+
+def test_non_list_answer_for_list_type_raises():
+    with pytest.raises(ValueError):
+        validate_response('{"name": "a", "count": 1}', List[Item])
+
+
+def test_unparseable_json_raises():
+    with pytest.raises(ValueError):
+        validate_response('[{"name": "a",', List[Item])
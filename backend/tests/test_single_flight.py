@@ -0,0 +1,79 @@
+"""
+Coalescing of concurrent identical prompts into one LLM call
+"""
+
+import asyncio
+
+import pytest
+
+from app.services.llm_providers import ProviderResponse
+from tests.fakes import make_provider
+
+
+class GatedModel:
+    """Answers once `release` is set, counting calls and cancellations"""
+
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.calls = 0
+        self.cancelled = 0
+
+    async def generate_content_async(self, prompt, generation_config=None, stream=False, **kwargs):
+        self.calls += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return ProviderResponse(f"answer to {prompt}")
+
+
+@pytest.mark.asyncio
+async def test_identical_prompts_share_one_call(llm_service):
+    model = GatedModel()
+    llm_service.use_providers(make_provider("primary", model))
+
+    callers = [asyncio.create_task(llm_service.generate("Same prompt")) for _ in range(3)]
+    other = asyncio.create_task(llm_service.generate("Other prompt"))
+    await asyncio.sleep(0.01)
+    model.release.set()
+
+    assert await asyncio.gather(*callers) == ["answer to Same prompt"] * 3
+    assert await other == "answer to Other prompt"
+    assert model.calls == 2
+    assert llm_service.stats["coalesced"] == 2
+    assert llm_service._inflight == {}
+
+
+@pytest.mark.asyncio
+async def test_one_caller_leaving_does_not_cancel_the_shared_call(llm_service):
+    model = GatedModel()
+    llm_service.use_providers(make_provider("primary", model))
+
+    leaving = asyncio.create_task(llm_service.generate("Same prompt"))
+    staying = asyncio.create_task(llm_service.generate("Same prompt"))
+    await asyncio.sleep(0.01)
+    leaving.cancel()
+    await asyncio.sleep(0)
+    model.release.set()
+
+    assert await staying == "answer to Same prompt"
+    assert leaving.cancelled()
+    assert model.cancelled == 0
+
+
+@pytest.mark.asyncio
+async def test_call_is_cancelled_when_every_caller_leaves(llm_service):
+    model = GatedModel()
+    llm_service.use_providers(make_provider("primary", model))
+
+    callers = [asyncio.create_task(llm_service.generate("Same prompt")) for _ in range(2)]
+    await asyncio.sleep(0.01)
+    for caller in callers:
+        caller.cancel()
+    await asyncio.gather(*callers, return_exceptions=True)
+    await asyncio.sleep(0.01)
+
+    assert model.cancelled == 1
+    assert llm_service.stats["abandoned"] == 1
+    assert llm_service._inflight == {}
@@ -0,0 +1,140 @@
+"""
+Deduplication of textbook uploads by content hash
+"""
+
+import hashlib
+import io
+import os
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("supabase")
+pytest.importorskip("multipart")
+
+from fastapi import BackgroundTasks, HTTPException, UploadFile  # noqa: E402
+
+from app.routers import textbooks  # noqa: E402
+
+PDF = b"%PDF-1.4\n" + b"page text " * 1000
+STORED = {
+    "id": "existing-id",
+    "course_id": "course-1",
+    "title": "Stored Book",
+    "total_pages": 12,
+    "metadata": {"topics": [{"id": "t1", "name": "Limits", "weight": 1.0, "prereqs": []}]},
+}
+
+
+class PostgrestError(Exception):
+    def __init__(self, code):
+        super().__init__(f"postgrest error {code}")
+        self.code = code
+
+
+class FakeTable:
+    """Chainable stand-in for a Supabase table query; records inserts"""
+
+    def __init__(self, db, name):
+        self.db = db
+        self.name = name
+
+    def select(self, *args, **kwargs):
+        return self
+
+    def eq(self, *args):
+        return self
+
+    def order(self, *args):
+        return self
+
+    def limit(self, *args):
+        return self
+
+    def insert(self, data):
+        return SimpleNamespace(execute=lambda: self.db.insert(self.name, data))
+
+    def execute(self):
+        return SimpleNamespace(data=self.db.rows.get(self.name, []))
+
+
+class FakeDB:
+    """Database with preset query results and scripted insert failures"""
+
+    def __init__(self, rows=None, insert_errors=()):
+        self.rows = rows or {}
+        self.insert_errors = list(insert_errors)
+        self.inserts = []
+        self.client = SimpleNamespace(table=lambda name: FakeTable(self, name))
+
+    def insert(self, table, data):
+        self.inserts.append((table, data))
+        if self.insert_errors:
+            raise self.insert_errors.pop(0)
+        return SimpleNamespace(data=[data])
+
+
+def upload(content, filename="book.pdf"):
+    return UploadFile(io.BytesIO(content), filename=filename)
+
+
+@pytest.mark.asyncio
+async def test_save_upload_hashes_while_copying(tmp_path):
+    path = str(tmp_path / "staged.pdf")
+
+    size, content_hash = await textbooks._save_upload(upload(PDF), path)
+
+    assert size == len(PDF)
+    assert content_hash == hashlib.sha256(PDF).hexdigest()
+    assert open(path, "rb").read() == PDF
+
+
+@pytest.mark.asyncio
+async def test_save_upload_rejects_non_pdf_without_leaving_a_file(tmp_path):
+    path = str(tmp_path / "staged.pdf")
+
+    with pytest.raises(HTTPException) as error:
+        await textbooks._save_upload(upload(b"not a pdf"), path)
+
+    assert error.value.status_code == 400
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.asyncio
+async def test_reupload_reuses_the_stored_textbook(tmp_path, monkeypatch):
+    monkeypatch.setattr(textbooks, "db", FakeDB(rows={"resources": [STORED]}))
+    monkeypatch.setattr(textbooks.settings, "upload_dir", str(tmp_path))
+    monkeypatch.setattr(textbooks, "TextbookParser", None)  # Parsing must be skipped
+    background = BackgroundTasks()
+
+    response = await textbooks.upload_textbook(None, background, upload(PDF))
+
+    content_path = str(tmp_path / f"{hashlib.sha256(PDF).hexdigest()}.pdf")
+    assert response.textbook_id == "existing-id"
+    assert response.file_path == content_path
+    assert [topic.name for topic in response.topics] == ["Limits"]
+    assert os.listdir(tmp_path) == [os.path.basename(content_path)]
+    assert textbooks.db.inserts == []
+
+
+def test_concurrent_insert_of_the_same_content_returns_the_winner(monkeypatch):
+    fake_db = FakeDB(rows={"resources": [STORED]}, insert_errors=[PostgrestError(textbooks.UNIQUE_VIOLATION)])
+    monkeypatch.setattr(textbooks, "db", fake_db)
+
+    assert textbooks._insert_textbook({"id": "new-id", "content_hash": "abc"}) == STORED
+    assert len(fake_db.inserts) == 1
+
+
+def test_unmigrated_schema_stores_the_row_without_a_hash(monkeypatch):
+    fake_db = FakeDB(insert_errors=[PostgrestError(textbooks.MISSING_COLUMN)])
+    monkeypatch.setattr(textbooks, "db", fake_db)
+
+    assert textbooks._insert_textbook({"id": "new-id", "content_hash": "abc"}) is None
+    assert fake_db.inserts[-1] == ("resources", {"id": "new-id"})
+
+
+def test_other_insert_errors_are_raised(monkeypatch):
+    monkeypatch.setattr(textbooks, "db", FakeDB(insert_errors=[PostgrestError("23502")]))
+
+    with pytest.raises(PostgrestError):
+        textbooks._insert_textbook({"id": "new-id", "content_hash": "abc"})
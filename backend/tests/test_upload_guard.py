@@ -0,0 +1,37 @@
+"""
+Header-based rejection of oversized uploads
+"""
+
+import pytest
+from fastapi import FastAPI, Request
+
+from app.utils.upload_guard import MULTIPART_OVERHEAD_BYTES, upload_size_guard
+from tests.fakes import asgi_post
+
+MAX_BYTES = 1000
+
+
+def make_app():
+    app = FastAPI()
+    app.middleware("http")(upload_size_guard(paths={"/upload"}, max_bytes=MAX_BYTES))
+
+    @app.post("/upload")
+    async def upload(request: Request):
+        return {"size": len(await request.body())}
+
+    return app
+
+
+@pytest.mark.asyncio
+async def test_upload_within_limit_passes():
+    assert await asgi_post(make_app(), "/upload", b"x" * MAX_BYTES) == (200, 1)
+
+
+@pytest.mark.asyncio
+async def test_oversized_upload_is_rejected_before_the_body_is_read():
+    assert await asgi_post(make_app(), "/upload", b"x" * (MAX_BYTES + MULTIPART_OVERHEAD_BYTES + 1)) == (413, 0)
+
+
+@pytest.mark.asyncio
+async def test_upload_without_content_length_is_rejected():
+    assert await asgi_post(make_app(), "/upload", b"x", content_length=False) == (411, 0)
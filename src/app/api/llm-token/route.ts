@@ -0,0 +1,26 @@
+import { createHmac } from 'crypto'
+import { NextResponse } from 'next/server'
+import { getServerSession } from 'next-auth/next'
+import { authOptions } from '@/app/api/auth/[...nextauth]/auth-options'
+
+const TOKEN_TTL_SECONDS = 300
+
+/**
+ * Mint a short-lived tenant token for the signed-in teacher
+ * (verified by backend/app/utils/tenant_token.py with the same secret)
+ */
+export async function GET() {
+  const session = await getServerSession(authOptions)
+  const email = session?.user?.email
+  const secret = process.env.LLM_TENANT_SECRET
+  if (!email || !secret) {
+    return NextResponse.json({ error: 'Not signed in' }, { status: 401 })
+  }
+
+  const encoded = Buffer.from(email.toLowerCase()).toString('base64url')
+  const expiresAt = Math.floor(Date.now() / 1000) + TOKEN_TTL_SECONDS
+  const payload = `${encoded}.${expiresAt}`
+  const signature = createHmac('sha256', secret).update(payload).digest('hex')
+
+  return NextResponse.json({ value: `${payload}.${signature}`, expiresAt: expiresAt * 1000 })
+}
@@ -9,6 +9,29 @@ export const API_BASE_URL =
 const TEACHER_EMAIL = process.env.NEXT_PUBLIC_TEACHER_EMAIL
 const TEACHER_NAME = process.env.NEXT_PUBLIC_TEACHER_NAME
 
+let llmToken: { value: string; expiresAt: number } | null = null
+
+/**
+ * JSON headers for LLM-backed endpoints; carries a short-lived tenant token
+ * minted from the NextAuth session so the backend can share LLM capacity
+ * fairly between signed-in teachers
+ */
+async function llmHeaders(): Promise<Record<string, string>> {
+  const headers: Record<string, string> = { 'Content-Type': 'application/json' }
+  if (!llmToken || llmToken.expiresAt - 30_000 < Date.now()) {
+    try {
+      const response = await fetch('/api/llm-token')
+      llmToken = response.ok ? await response.json() : null
+    } catch {
+      llmToken = null
+    }
+  }
+  if (llmToken) {
+    headers['Authorization'] = `Bearer ${llmToken.value}`
+  }
+  return headers
+}
+
 /**
  * Parse topics from syllabus text using AI backend
  */
@@ -16,7 +39,7 @@ export async function parseTopics(syllabusText: string): Promise<Topic[]> {
   try {
     const response = await fetch(`${API_BASE_URL}/api/topics/parse`, {
       method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
+      headers: await llmHeaders(),
       body: JSON.stringify({
         syllabus_text: syllabusText,
         course_level: 'ug' // undergraduate
@@ -70,7 +93,7 @@ export async function generateQuestions(
 
     const response = await fetch(endpoint, {
       method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
+      headers: await llmHeaders(),
       body: JSON.stringify(requestBody)
     })
 